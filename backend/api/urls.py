@@ -1,5 +1,6 @@
 from rest_framework.routers import DefaultRouter # type: ignore
 from paper.views import *
+from paper import async_views
 from django.urls import path, include
 from drf_spectacular.views import ( # type: ignore
     SpectacularAPIView,
@@ -9,6 +10,9 @@ router = DefaultRouter()
 
 router.register(r'papers', PaperViewSet, basename='paper')
 router.register(r'user-uploads', UserUploadViewSet, basename='userupload')
+router.register(r'topics', TopicViewSet, basename='topic')
+router.register(r'index', IndexViewSet, basename='index')
+router.register(r'profiles', ProfileViewSet, basename='profile')
 
 """API URL Configuration
 schema_view = get_schema_view(
@@ -26,6 +30,11 @@ schema_view = get_schema_view(
 """
 urlpatterns = [
     path('', include(router.urls)),    
+
+    # Async endpoints, serve with an ASGI server (see papyrus/asgi.py)
+    path("async/papers/search/", async_views.search, name="async-paper-search"),
+    path("async/user-uploads/recommend/", async_views.recommend, name="async-userupload-recommend"),
+    path("async/executor/", async_views.executor_stats, name="async-executor"),
     
     # Swagger UI
     path("schema/", SpectacularAPIView.as_view(), name="schema"),
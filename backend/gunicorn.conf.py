@@ -0,0 +1,17 @@
+# Gunicorn settings: `gunicorn -c gunicorn.conf.py papyrus.wsgi`
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# Import Django once in the master: the FAISS snapshot is memory-mapped and
+# the encoder weights are loaded before the workers fork, so they share both
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded, before workers are
+    # forked. Only load the weights, a forward pass here would start
+    # thread pools that do not survive fork.
+    from paper.utils.encoders import warm_up
+    warm_up(encode=False)
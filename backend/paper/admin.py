@@ -10,4 +10,14 @@ class PaperAdmin(admin.ModelAdmin):
 @admin.register(UserUpload)
 class UserUploadAdmin(admin.ModelAdmin):
     list_display = ("upload_id", "title", "created_at")
-    search_fields = ("title", "abstract")
\ No newline at end of file
+    search_fields = ("title", "abstract")
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    search_fields = ("name",)
+
+@admin.register(CategoryYearCount)
+class CategoryYearCountAdmin(admin.ModelAdmin):
+    list_display = ("category", "year", "count")
+    list_filter = ("year",)
@@ -1,5 +1,4 @@
 from django.apps import AppConfig
-import os
 
 
 class PaperConfig(AppConfig):
@@ -7,6 +6,9 @@ class PaperConfig(AppConfig):
     name = 'paper'
 
     def ready(self):
-        if os.environ.get("RUN_MAIN") == "true":
-            from paper.utils.faiss_index import build_faiss_index
-            build_faiss_index()
+        # Model signals that keep the FAISS index up to date
+        from paper import signals  # noqa: F401
+
+        # The FAISS index is not loaded here, or migrate, makemigrations,
+        # tests and shard servers would all load (or build) it. The WSGI /
+        # ASGI entry points load it, other processes on their first search.
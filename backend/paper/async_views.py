@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .models import UserUpload
+from .utils.embeddings import generate_embedding
+from .utils.executor import ExecutorFull, get_executor
+from .utils.faiss_index import index_generation, search_similar_papers
+from .utils.fusion import annotate_results, reciprocal_rank_fusion
+from .utils.hydration import ahydrate_papers
+from .utils.lexical import keyword_search
+from .utils.metrics import stage_timer
+from .utils.search_filters import parse_search_filters
+from .utils.vectors import to_bytes
+
+# Async versions of /papers/search/ and /user-uploads/recommend/ for ASGI
+# servers (uvicorn papyrus.asgi:application). DRF views are synchronous, so
+# these are plain Django views with the same request and response shapes.
+# Encode + FAISS search and the keyword query run on the bounded executor,
+# the remaining ORM access is async, and the event loop stays free for
+# other clients meanwhile.
+
+
+def _overloaded():
+    response = JsonResponse({"error": "server busy, retry shortly"}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+
+# Runs on an executor thread, `timer` collects its stages
+def _semantic_search(text, top_n, filters, timer):
+    with timer.stage("encode"):
+        embedding = generate_embedding(text)
+    with timer.stage("faiss"):
+        return embedding, search_similar_papers(embedding, top_n=top_n, filters=filters)
+
+
+# Also on an executor thread: sync_to_async would run every request's
+# keyword query on the one shared thread_sensitive thread
+def _keyword_search(text, limit, filters, timer):
+    with timer.stage("keyword"):
+        return keyword_search(text, limit=limit, filters=filters)
+
+
+@require_GET
+async def search(request):
+    query = request.GET.get("q")
+    if not query:
+        return JsonResponse({"error": "q parameter is required"}, status=400)
+
+    try:
+        top_n = int(request.GET.get("top_n", 12))
+        filters = parse_search_filters(request.GET)
+    except ValueError:
+        return JsonResponse({"error": "top_n, year_from and year_to must be integers"}, status=400)
+
+    timer = stage_timer(request, "async-paper-search")
+
+    # Semantic and keyword search run concurrently (their stages overlap),
+    # submitted one after the other so a full executor rejects the request once
+    executor = get_executor()
+    try:
+        semantic = executor.submit(_semantic_search, query, top_n * 2, filters, timer)
+        keyword = executor.submit(_keyword_search, query, top_n * 2, filters, timer)
+    except ExecutorFull:
+        return _overloaded()
+
+    (_, semantic_results), keyword_results = await asyncio.gather(
+        asyncio.wrap_future(semantic), asyncio.wrap_future(keyword)
+    )
+
+    with timer.stage("fuse"):
+        fused = reciprocal_rank_fusion({
+            "semantic": [(item["paper_id"], item["score"]) for item in semantic_results],
+            "keyword": keyword_results,
+        }, k=getattr(settings, "SEARCH_RRF_K", 60))[:top_n]
+
+    with timer.stage("hydrate"):
+        papers = {p["id"]: p for p in await ahydrate_papers(item["paper_id"] for item in fused)}
+        results = annotate_results(fused, papers)
+
+    return JsonResponse({
+        "query": query,
+        "filters": filters,
+        "count": len(results),
+        "results": results
+    }, headers={"X-Index-Generation": index_generation()})
+
+
+@csrf_exempt
+@require_POST
+async def recommend(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "body must be JSON"}, status=400)
+
+    abstract = data.get("abstract")
+    if not abstract:
+        return JsonResponse({"error": "abstract is required"}, status=400)
+
+    try:
+        filters = (
+            parse_search_filters(request.GET) or
+            parse_search_filters(data.get("filters") or {})
+        )
+    except ValueError:
+        return JsonResponse({"error": "year_from and year_to must be integers"}, status=400)
+
+    timer = stage_timer(request, "async-userupload-recommend")
+
+    try:
+        embedding, similar = await get_executor().run(_semantic_search, abstract, 12, filters, timer)
+    except ExecutorFull:
+        return _overloaded()
+
+    with timer.stage("create_upload"):
+        user_upload = await UserUpload.objects.acreate(
+            abstract=abstract,
+            title=data.get("title", None),
+            authors=data.get("authors", None),
+            categories=data.get("categories", None),
+            embedding=to_bytes(embedding),
+        )
+
+    with timer.stage("hydrate"):
+        scores = {item["paper_id"]: item["score"] for item in similar}
+        papers = await ahydrate_papers(item["paper_id"] for item in similar)
+        for paper_data in papers:
+            paper_data["similarity"] = scores[paper_data["id"]]
+
+    return JsonResponse({
+        "user_upload_id": str(user_upload.upload_id),
+        "results": papers
+    }, headers={"X-Index-Generation": index_generation()})
+
+
+# Executor queue depth, rejections and throughput for this process
+@require_GET
+async def executor_stats(request):
+    return JsonResponse(get_executor().stats())
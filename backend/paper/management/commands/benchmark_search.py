@@ -0,0 +1,95 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from paper.utils.benchmark import run_benchmark
+from paper.utils.index_factory import INDEX_TYPES
+
+
+class Command(BaseCommand):
+    help = "Benchmark latency, throughput and recall@k of the search backends on a synthetic corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backends",
+            type=str,
+            default=",".join(("sklearn",) + INDEX_TYPES),
+            help="Comma separated list of backends (sklearn, " + ", ".join(INDEX_TYPES) + ")"
+        )
+        parser.add_argument("--size", type=int, default=100000, help="Number of corpus vectors")
+        parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+        parser.add_argument("--queries", type=int, default=1000, help="Number of queries")
+        parser.add_argument("--k", type=int, default=10, help="Results per query (recall@k)")
+        parser.add_argument(
+            "--distribution",
+            choices=["clustered", "random"],
+            default="clustered",
+            help="How synthetic vectors are generated"
+        )
+        parser.add_argument("--clusters", type=int, default=100, help="Clusters for the clustered corpus")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default ~4*sqrt(size))")
+        parser.add_argument("--nprobe", type=int, default=None)
+        parser.add_argument("--ef_search", type=int, default=None)
+        parser.add_argument("--pq_m", type=int, default=None, help="PQ sub-quantizers, must divide --dim")
+        parser.add_argument(
+            "--rescore",
+            action="store_true",
+            help="Re-rank compressed (fp16, sq8, pq, ivf_pq) results against the exact vectors"
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Write the JSON report to this file"
+        )
+
+    def handle(self, *args, **kwargs):
+        backends = [b.strip() for b in kwargs["backends"].split(",") if b.strip()]
+        for backend in backends:
+            if backend != "sklearn" and backend not in INDEX_TYPES:
+                self.stderr.write(f"Unknown backend: {backend}")
+                return
+
+        overrides = {}
+        for option, key in (("nlist", "NLIST"), ("nprobe", "NPROBE"), ("ef_search", "EF_SEARCH"), ("pq_m", "PQ_M")):
+            if kwargs[option] is not None:
+                overrides[key] = kwargs[option]
+        if kwargs["rescore"]:
+            overrides["RESCORE"] = True
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmarking {', '.join(backends)} on {kwargs['size']} x {kwargs['dim']} "
+            f"{kwargs['distribution']} vectors..."
+        ))
+
+        report = run_benchmark(
+            backends,
+            size=kwargs["size"],
+            dim=kwargs["dim"],
+            queries=kwargs["queries"],
+            k=kwargs["k"],
+            distribution=kwargs["distribution"],
+            clusters=kwargs["clusters"],
+            seed=kwargs["seed"],
+            overrides=overrides,
+        )
+
+        self.stdout.write(
+            f"{'backend':<10} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'qps':>9} {'batch qps':>10} {'recall':>7} {'MB':>8}"
+        )
+        for row in report["results"]:
+            self.stdout.write(
+                f"{row['backend']:<10} {row['build_seconds']:>8.2f} {row['p50_ms']:>8.3f} "
+                f"{row['p99_ms']:>8.3f} {row['qps']:>9.0f} {row['batch_qps']:>10.0f} "
+                f"{row['recall_at_k']:>7.3f} {row['index_bytes'] / 1e6:>8.1f}"
+            )
+
+        output = kwargs["output"]
+        if output:
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {output}"))
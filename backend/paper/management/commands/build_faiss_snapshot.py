@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from paper.utils.faiss_index import save_faiss_snapshot, set_shard
+from paper.utils.index_factory import INDEX_TYPES, index_config
+from paper.utils.index_validation import IndexValidationError
+
+
+class Command(BaseCommand):
+    help = "Build the FAISS index from stored embeddings and save it as a versioned snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=getattr(settings, "FAISS_SNAPSHOTS_TO_KEEP", 3),
+            help="Number of snapshot versions to keep on disk"
+        )
+        parser.add_argument(
+            "--index_type",
+            choices=INDEX_TYPES,
+            default=None,
+            help="Override FAISS_INDEX['TYPE'] for this snapshot"
+        )
+        parser.add_argument(
+            "--rescore",
+            action="store_true",
+            help="Keep the exact vectors next to a compressed index for rescoring (FAISS_INDEX['RESCORE'])"
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=None,
+            help="Embeddings read from the database per chunk (FAISS_INDEX['BUILD_BATCH_SIZE'])"
+        )
+        parser.add_argument(
+            "--shard",
+            type=int,
+            default=None,
+            help="Only index the papers of this shard (FAISS_SHARDS) into its own snapshot directory"
+        )
+        parser.add_argument(
+            "--skip_validation",
+            action="store_true",
+            help="Write the snapshot even if it fails validation (e.g. a new embedding dimension)"
+        )
+
+    def handle(self, *args, **kwargs):
+        keep = kwargs["keep"]
+
+        overrides = {}
+        if kwargs["index_type"]:
+            overrides["TYPE"] = kwargs["index_type"]
+        if kwargs["rescore"]:
+            overrides["RESCORE"] = True
+        if kwargs["batch_size"]:
+            overrides["BUILD_BATCH_SIZE"] = kwargs["batch_size"]
+        config = index_config(overrides)
+
+        if kwargs["shard"] is not None:
+            try:
+                set_shard(kwargs["shard"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f"Building FAISS {config['TYPE']} index snapshot..."))
+
+        try:
+            meta = save_faiss_snapshot(keep=keep, config=config, validate=not kwargs["skip_validation"])
+        except IndexValidationError as exc:
+            raise CommandError(f"New index failed validation, snapshot not written: {exc}")
+
+        if meta is None:
+            self.stdout.write(self.style.WARNING("No embeddings found, snapshot not written."))
+            return
+
+        self.stdout.write(
+            f"Snapshot v{meta['version']} written "
+            f"({meta['index_type']}, {meta['ntotal']} vectors, dim {meta['dim']})"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Snapshot is now CURRENT, workers swap to it on their next sync (FAISS_HOT_RELOAD)."
+        ))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from paper.utils.topics import assign_new_papers, build_topics
+
+
+class Command(BaseCommand):
+    help = "Cluster paper embeddings into topics and precompute their yearly growth"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--topics",
+            type=int,
+            default=100,
+            help="Number of topics (k-means clusters)"
+        )
+        parser.add_argument(
+            "--sample_size",
+            type=int,
+            default=200000,
+            help="Embeddings sampled to train the centroids"
+        )
+        parser.add_argument(
+            "--niter",
+            type=int,
+            default=20,
+            help="k-means iterations"
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=5000,
+            help="Embeddings streamed from the database per batch"
+        )
+        parser.add_argument(
+            "--window",
+            type=int,
+            default=3,
+            help="Years compared against the years before them for growth rates"
+        )
+        parser.add_argument(
+            "--assign_new",
+            action="store_true",
+            help="Keep the existing topics, only assign papers without one and refresh the stats"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["assign_new"]:
+            self.stdout.write(self.style.SUCCESS("Assigning new papers to existing topics..."))
+            assigned = assign_new_papers(kwargs["window"], kwargs["batch_size"])
+            if assigned is None:
+                self.stdout.write(self.style.WARNING("No topics yet, run build_topics without --assign_new first."))
+                return
+            self.stdout.write(self.style.SUCCESS(f"{assigned} papers assigned."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Clustering embeddings into {kwargs['topics']} topics..."))
+        assigned = build_topics(
+            kwargs["topics"],
+            sample_size=kwargs["sample_size"],
+            niter=kwargs["niter"],
+            seed=kwargs["seed"],
+            batch_size=kwargs["batch_size"],
+            window=kwargs["window"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Topics built, {assigned} papers assigned."))
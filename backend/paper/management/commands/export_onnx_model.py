@@ -0,0 +1,96 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from paper.models import Paper
+from paper.utils.encoders import (
+    QUANTIZATION_CONFIGS, embedding_parity, export_onnx_model, get_model, model_config,
+)
+
+
+# Used for the parity check when the database has no papers yet
+FALLBACK_SENTENCES = [
+    "Graph neural networks for molecular property prediction.",
+    "We study the convergence of stochastic gradient descent in non-convex settings.",
+    "A survey of transformer architectures for long document summarization.",
+    "Quantum error correction with surface codes on superconducting qubits.",
+    "Dark matter constraints from dwarf spheroidal galaxy observations.",
+    "Self-supervised contrastive learning of visual representations.",
+    "An efficient algorithm for maximum flow in planar graphs.",
+    "Bayesian inference for high dimensional sparse regression models.",
+]
+
+
+class Command(BaseCommand):
+    help = "Export the sentence encoder to ONNX (optionally int8 quantized) and check parity with PyTorch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Output directory, defaults to EMBEDDING_MODEL['ONNX_DIR']"
+        )
+        parser.add_argument(
+            "--quantize",
+            choices=QUANTIZATION_CONFIGS,
+            default=None,
+            help="Also write a dynamically int8 quantized model for this CPU target"
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=256,
+            help="Abstracts used for the parity check (0 to skip it)"
+        )
+        parser.add_argument(
+            "--min_cosine",
+            type=float,
+            default=None,
+            help="Fail when any sample falls below this cosine (default 0.99, 0.95 quantized)"
+        )
+
+    def handle(self, *args, **kwargs):
+        output = kwargs["output"] or model_config()["ONNX_DIR"]
+        quantize = kwargs["quantize"]
+
+        self.stdout.write(self.style.SUCCESS(f"Exporting ONNX model to {output}..."))
+        onnx_file = export_onnx_model(output, quantize)
+        self.stdout.write(f"Wrote {onnx_file}")
+
+        if kwargs["sample"] > 0:
+            self.check_parity(output, onnx_file, kwargs["sample"], kwargs["min_cosine"], quantize)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Set EMBEDDING_MODEL = {{"BACKEND": "onnx", "ONNX_DIR": "{output}", '
+            f'"ONNX_FILE": "{onnx_file}"}} to serve it.'
+        ))
+
+    def check_parity(self, output, onnx_file, sample, min_cosine, quantized):
+        if min_cosine is None:
+            min_cosine = 0.95 if quantized else 0.99
+
+        texts = self.sample_abstracts(sample)
+        self.stdout.write(f"Checking parity on {len(texts)} abstracts...")
+
+        reference = get_model("torch")
+        candidate = self.load_exported(output, onnx_file)
+        cosines = embedding_parity(reference, candidate, texts)
+
+        self.stdout.write(
+            f"Cosine vs PyTorch: mean {cosines.mean():.5f}, min {cosines.min():.5f}"
+        )
+        if cosines.min() < min_cosine:
+            raise CommandError(f"Parity check failed: min cosine below {min_cosine}")
+
+    def load_exported(self, output, onnx_file):
+        from sentence_transformers import SentenceTransformer # type: ignore
+        return SentenceTransformer(output, backend="onnx", model_kwargs={"file_name": onnx_file})
+
+    # Random abstracts from the first 100k ids (no ORDER BY RANDOM() on big tables)
+    def sample_abstracts(self, sample):
+        ids = list(Paper.objects.values_list("id", flat=True)[:100000])
+        if not ids:
+            return FALLBACK_SENTENCES
+
+        picked = random.Random(0).sample(ids, min(sample, len(ids)))
+        return list(Paper.objects.filter(id__in=picked).values_list("abstract", flat=True))
@@ -1,8 +1,11 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from paper.models import Paper
-
-from sentence_transformers import SentenceTransformer # type: ignore
-import math
+from paper.utils.encoders import get_model
+from paper.utils.faiss_index import record_index_changes
+from paper.utils.pipeline import read_checkpoint, run_pipeline, write_checkpoint
+from paper.utils.topics import assign_new_papers
+from paper.utils.vectors import to_bytes
 
 
 class Command(BaseCommand):
@@ -12,50 +15,133 @@ class Command(BaseCommand):
         parser.add_argument(
             "--batch_size",
             type=int,
-            default=128,
-            help="Number of papers to process per batch"
+            default=512,
+            help="Number of papers to read, encode and write per batch"
+        )
+        parser.add_argument(
+            "--backend",
+            choices=["torch", "onnx"],
+            default=None,
+            help="Encoder backend, defaults to EMBEDDING_MODEL['BACKEND']"
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Encode with a pool of this many CPU processes (1 encodes in-process)"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="File storing the last written paper id, a rerun resumes after it"
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an existing checkpoint and start from the first paper"
+        )
+        parser.add_argument(
+            "--skip_topics",
+            action="store_true",
+            help="Leave new papers without a topic (build_topics --assign_new assigns them later)"
+        )
+        parser.add_argument(
+            "--topic_window",
+            type=int,
+            default=3,
+            help="Growth window of the topic stats refresh, keep it equal to build_topics --window"
         )
 
     def handle(self, *args, **kwargs):
         batch_size = kwargs["batch_size"]
+        checkpoint = kwargs["checkpoint"]
 
-        self.stdout.write(self.style.SUCCESS("Loading embedding model..."))
-        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        start_id = 0
+        if checkpoint and not kwargs["restart"]:
+            start_id = read_checkpoint(checkpoint).get("last_id", 0)
+            if start_id:
+                self.stdout.write(f"Resuming after paper id {start_id}")
 
-        queryset = Paper.objects.filter(embedding__isnull=True)
+        queryset = Paper.objects.filter(embedding__isnull=True, id__gt=start_id)
         total = queryset.count()
 
         if total == 0:
             self.stdout.write(self.style.WARNING("No papers left without embeddings."))
             return
 
+        self.stdout.write(self.style.SUCCESS("Loading embedding model..."))
+        model = get_model(kwargs["backend"])
+
+        pool = None
+        if kwargs["processes"] > 1:
+            pool = model.start_multi_process_pool(["cpu"] * kwargs["processes"])
+
         self.stdout.write(self.style.SUCCESS(f"Total papers to process: {total}"))
 
-        total_batches = math.ceil(total / batch_size)
+        done = 0
 
-        for batch_num in range(total_batches):
-            start = batch_num * batch_size
-            end = start + batch_size
+        # Keyset pagination: rows embedded behind us never shift later pages
+        def read_batches():
+            last_id = start_id
+            while True:
+                rows = list(
+                    queryset
+                    .filter(id__gt=last_id)
+                    .order_by("id")
+                    .values_list("id", "abstract")[:batch_size]
+                )
+                if not rows:
+                    return
 
-            papers = list(queryset[start:end])
+                last_id = rows[-1][0]
+                yield rows
 
-            abstracts = [p.abstract for p in papers]
+        encode_kwargs = {"pool": pool} if pool is not None else {}
 
-            # Generate embeddings
+        def encode(rows):
+            abstracts = [abstract for _, abstract in rows]
             embeddings = model.encode(
                 abstracts,
-                batch_size=batch_size,
-                show_progress_bar=False
-            )
-
-            # Save embeddings
-            for paper, embedding in zip(papers, embeddings):
-                paper.embedding = embedding.tolist()
-                paper.save(update_fields=["embedding"])
-
-            self.stdout.write(
-                f"Batch {batch_num + 1}/{total_batches} completed "
-                f"({end if end < total else total}/{total})"
+                batch_size=min(batch_size, 128),
+                show_progress_bar=False,
+                **encode_kwargs,
             )
+            return rows, embeddings
+
+        def write(batch):
+            nonlocal done
+            rows, embeddings = batch
+
+            papers = [
+                Paper(id=pk, embedding=to_bytes(embedding))
+                for (pk, _), embedding in zip(rows, embeddings)
+            ]
+
+            # bulk_update skips signals, so log the changes for the live index ourselves
+            with transaction.atomic():
+                Paper.objects.bulk_update(papers, ["embedding"], batch_size=500)
+                record_index_changes(upsert_ids=[p.id for p in papers])
+
+            done += len(papers)
+            last_id = papers[-1].id
+            if checkpoint:
+                write_checkpoint(checkpoint, last_id=last_id, done=done)
+
+            self.stdout.write(f"{done}/{total} embedded (last id {last_id})")
+
+        try:
+            # Reading, encoding and writing overlap, at most two batches queue up
+            run_pipeline(read_batches(), [encode, write], queue_size=2)
+        finally:
+            if pool is not None:
+                model.stop_multi_process_pool(pool)
+
+        # New papers join the existing topics, without this they are missing
+        # from topic sizes and growth until build_topics runs again
+        if not kwargs["skip_topics"]:
+            assigned = assign_new_papers(kwargs["topic_window"])
+            if assigned is not None:
+                self.stdout.write(f"{assigned} papers assigned to topics")
 
         self.stdout.write(self.style.SUCCESS("Embedding generation completed!"))
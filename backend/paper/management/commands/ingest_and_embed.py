@@ -0,0 +1,224 @@
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from paper.models import Paper
+from paper.utils.arxiv import chunk_lines, parse_chunk, read_lines
+from paper.utils.categories import index_paper_categories
+from paper.utils.encoders import get_model
+from paper.utils.faiss_index import append_to_snapshot, record_index_changes
+from paper.utils.pipeline import read_checkpoint, run_pipeline, write_checkpoint
+from paper.utils.topics import assign_new_papers
+from paper.utils.vectors import to_bytes
+
+
+class Command(BaseCommand):
+    help = "Stream an arXiv JSONL dump into Paper rows with embeddings and feed them to the search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file_path",
+            type=str,
+            help="Path to the cleaned arXiv JSON file (.jsonl, .gz, .bz2 or .zst)"
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=512,
+            help="Papers per read / encode / write batch"
+        )
+        parser.add_argument(
+            "--queue_size",
+            type=int,
+            default=4,
+            help="Batches allowed to wait between two stages (bounds memory)"
+        )
+        parser.add_argument(
+            "--backend",
+            choices=["torch", "onnx"],
+            default=None,
+            help="Encoder backend, defaults to EMBEDDING_MODEL['BACKEND']"
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Encode with a pool of this many CPU processes (1 encodes in-process)"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="File storing the byte offset reached, an interrupted run resumes from it"
+        )
+        parser.add_argument(
+            "--snapshot_every",
+            type=int,
+            default=100000,
+            help="Append buffered vectors to the persisted FAISS snapshot every N papers (0 disables)"
+        )
+        parser.add_argument(
+            "--skip_topics",
+            action="store_true",
+            help="Leave new papers without a topic (build_topics --assign_new assigns them later)"
+        )
+        parser.add_argument(
+            "--topic_window",
+            type=int,
+            default=3,
+            help="Growth window of the topic stats refresh, keep it equal to build_topics --window"
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        checkpoint = kwargs["checkpoint"]
+        snapshot_every = kwargs["snapshot_every"]
+        keep = getattr(settings, "FAISS_SNAPSHOTS_TO_KEEP", 3)
+
+        offset = read_checkpoint(checkpoint).get("offset", 0) if checkpoint else 0
+        if offset:
+            self.stdout.write(f"Resuming from byte offset {offset}")
+
+        self.stdout.write(self.style.SUCCESS("Loading embedding model..."))
+        model = get_model(kwargs["backend"])
+
+        pool = None
+        if kwargs["processes"] > 1:
+            pool = model.start_multi_process_pool(["cpu"] * kwargs["processes"])
+        encode_kwargs = {"pool": pool} if pool is not None else {}
+
+        stats = {"created": 0, "skipped": 0}
+
+        # paper_ids from batches that may still be in flight, enough to catch
+        # duplicates the database cannot see yet without an unbounded set
+        recent = deque(maxlen=kwargs["queue_size"] * 3 + 2)
+
+        # Vectors waiting to be appended to the persisted snapshot
+        pending_ids = []
+        pending_vectors = []
+
+        # Stage 1: parse, validate and deduplicate
+        def validate(chunk):
+            records, invalid, end_offset = parse_chunk(chunk)
+
+            unique = {}
+            for record in records:
+                if not any(record["paper_id"] in seen for seen in recent):
+                    unique.setdefault(record["paper_id"], record)
+
+            existing = set(
+                Paper.objects
+                .filter(paper_id__in=list(unique.keys()))
+                .values_list("paper_id", flat=True)
+            )
+            for paper_id in existing:
+                del unique[paper_id]
+
+            recent.append(set(unique.keys()))
+            return list(unique.values()), invalid + len(records) - len(unique), end_offset
+
+        # Stage 2: batch encode the abstracts
+        def encode(batch):
+            records, skipped, end_offset = batch
+            embeddings = np.empty((0, 0), dtype="float32")
+            if records:
+                embeddings = model.encode(
+                    [record["abstract"] for record in records],
+                    batch_size=min(batch_size, 128),
+                    show_progress_bar=False,
+                    **encode_kwargs,
+                )
+            return records, embeddings, skipped, end_offset
+
+        # Stage 3: bulk write papers with their embeddings and log them for live indexes
+        def write(batch):
+            records, embeddings, skipped, end_offset = batch
+
+            if records:
+                with transaction.atomic():
+                    # Papers stored since validation (e.g. by another run) are
+                    # skipped here, so only rows this batch inserts get counted
+                    # and appended to the snapshot
+                    existing = set(
+                        Paper.objects
+                        .filter(paper_id__in=[record["paper_id"] for record in records])
+                        .values_list("paper_id", flat=True)
+                    )
+                    new = [
+                        (record, embedding) for record, embedding in zip(records, embeddings)
+                        if record["paper_id"] not in existing
+                    ]
+                    skipped += len(records) - len(new)
+
+                    # No ignore_conflicts: a row inserted concurrently fails the
+                    # batch (nothing is checkpointed) instead of being miscounted
+                    Paper.objects.bulk_create(
+                        [Paper(**record, embedding=to_bytes(embedding)) for record, embedding in new],
+                        batch_size=1000,
+                    )
+                    # Not every backend returns pks from bulk_create, look them up
+                    ids = dict(
+                        Paper.objects
+                        .filter(paper_id__in=[record["paper_id"] for record, _ in new])
+                        .values_list("paper_id", "id")
+                    )
+                    record_index_changes(upsert_ids=list(ids.values()))
+                    index_paper_categories(
+                        (ids[record["paper_id"]], record["categories"], record["publication_year"])
+                        for record, _ in new
+                    )
+
+                for record, embedding in new:
+                    pending_ids.append(ids[record["paper_id"]])
+                    pending_vectors.append(embedding)
+
+                stats["created"] += len(new)
+
+            stats["skipped"] += skipped
+
+            if snapshot_every and len(pending_ids) >= snapshot_every:
+                flush_snapshot()
+
+            # Only record progress once the batch is committed
+            if checkpoint:
+                write_checkpoint(checkpoint, offset=end_offset, created=stats["created"])
+
+            self.stdout.write(
+                f"{stats['created']} papers ingested and embedded ({stats['skipped']} skipped)..."
+            )
+
+        def flush_snapshot():
+            if not pending_ids:
+                return
+            meta = append_to_snapshot(pending_ids, np.vstack(pending_vectors), keep=keep)
+            if meta is not None:
+                self.stdout.write(f"Snapshot v{meta['version']} written ({meta['ntotal']} vectors)")
+            pending_ids.clear()
+            pending_vectors.clear()
+
+        self.stdout.write(self.style.SUCCESS("Starting streaming ingestion..."))
+
+        try:
+            run_pipeline(
+                chunk_lines(read_lines(kwargs["file_path"], offset), batch_size),
+                [validate, encode, write],
+                queue_size=kwargs["queue_size"],
+            )
+            if snapshot_every:
+                flush_snapshot()
+        finally:
+            if pool is not None:
+                model.stop_multi_process_pool(pool)
+
+        # New papers join the existing topics, without this they are missing
+        # from topic sizes and growth until build_topics runs again
+        if not kwargs["skip_topics"]:
+            assigned = assign_new_papers(kwargs["topic_window"])
+            if assigned is not None:
+                self.stdout.write(f"{assigned} papers assigned to topics")
+
+        self.stdout.write(self.style.SUCCESS("Ingestion completed!"))
+        self.stdout.write(f"Total inserted: {stats['created']}")
+        self.stdout.write(f"Total skipped: {stats['skipped']}")
@@ -1,7 +1,11 @@
-import json
+import multiprocessing
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from paper.models import Paper
+from paper.utils.arxiv import chunk_lines, parse_chunk, parse_record, read_lines
+from paper.utils.categories import index_paper_categories
+from paper.utils.pipeline import bounded_imap, read_checkpoint, write_checkpoint
 
 
 class Command(BaseCommand):
@@ -11,67 +15,151 @@ class Command(BaseCommand):
         parser.add_argument(
             "file_path",
             type=str,
-            help="Path to the cleaned arXiv JSON file"
+            help="Path to the cleaned arXiv JSON file (.jsonl, .gz, .bz2 or .zst)"
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Insert with batched bulk_create in chunked transactions"
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=5000,
+            help="Rows per bulk_create / transaction in --bulk mode"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes used to parse JSON in --bulk mode (0 parses inline)"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="File storing the byte offset reached, an interrupted --bulk run resumes from it"
         )
 
     def handle(self, *args, **kwargs):
-        file_path = kwargs["file_path"]
-        created_count = 0
-        skipped_count = 0
-
         self.stdout.write(self.style.SUCCESS("Starting arXiv ingestion..."))
 
-        with open(file_path, "r", encoding="utf-8") as file:
-            for line_number, line in enumerate(file, start=1):
-                try:
-                    data = json.loads(line)
-
-                    paper_id = data.get("paper_id")
-                    title = data.get("title", "").strip()
-                    authors = data.get("authors", "").strip()
-                    abstract = data.get("abstract", "").strip()
-                    categories = data.get("categories")
-                    journal_ref = data.get("journal_ref")
-                    doi = data.get("doi")
-                    publication_year = data.get("publication_year")
-
-                    # Essential fields check
-                    if not paper_id or not title or not abstract:
-                        skipped_count += 1
-                        continue
-
-                    # Avoid duplicates
-                    if Paper.objects.filter(paper_id=paper_id).exists():
-                        skipped_count += 1
-                        continue
-
-                    Paper.objects.create(
-                        paper_id=paper_id,
-                        title=title,
-                        authors=authors,
-                        abstract=abstract,
-                        categories=categories,
-                        journal_ref=journal_ref,
-                        doi=doi,
-                        publication_year=publication_year,
-                    )
+        if kwargs["bulk"]:
+            created_count, skipped_count = self.ingest_bulk(kwargs)
+        else:
+            created_count, skipped_count = self.ingest_rows(kwargs["file_path"])
 
-                    created_count += 1
+        self.stdout.write(self.style.SUCCESS("Ingestion completed!"))
+        self.stdout.write(f"Total inserted: {created_count}")
+        self.stdout.write(f"Total skipped: {skipped_count}")
 
-                    # Progress output every 1000 records
-                    if created_count % 1000 == 0:
-                        self.stdout.write(
-                            f"{created_count} papers ingested..."
-                        )
+    # One query pair per paper, simple and fine for small files
+    def ingest_rows(self, file_path):
+        created_count = 0
+        skipped_count = 0
+
+        for line_number, (line, _) in enumerate(read_lines(file_path), start=1):
+            try:
+                record = parse_record(line)
 
-                except json.JSONDecodeError:
+                if record is None:
                     skipped_count += 1
-                except Exception as e:
+                    continue
+
+                # Avoid duplicates
+                if Paper.objects.filter(paper_id=record["paper_id"]).exists():
                     skipped_count += 1
-                    self.stderr.write(
-                        f"Error at line {line_number}: {str(e)}"
+                    continue
+
+                Paper.objects.create(**record)
+
+                created_count += 1
+
+                # Progress output every 1000 records
+                if created_count % 1000 == 0:
+                    self.stdout.write(
+                        f"{created_count} papers ingested..."
                     )
 
-        self.stdout.write(self.style.SUCCESS("Ingestion completed!"))
-        self.stdout.write(f"Total inserted: {created_count}")
-        self.stdout.write(f"Total skipped: {skipped_count}")
+            except Exception as e:
+                skipped_count += 1
+                self.stderr.write(
+                    f"Error at line {line_number}: {str(e)}"
+                )
+
+        return created_count, skipped_count
+
+    def ingest_bulk(self, kwargs):
+        file_path = kwargs["file_path"]
+        batch_size = kwargs["batch_size"]
+        checkpoint = kwargs["checkpoint"]
+
+        offset = read_checkpoint(checkpoint).get("offset", 0) if checkpoint else 0
+        if offset:
+            self.stdout.write(f"Resuming from byte offset {offset}")
+
+        created_count = 0
+        skipped_count = 0
+
+        chunks = chunk_lines(read_lines(file_path, offset), batch_size)
+
+        pool = None
+        if kwargs["workers"] > 0:
+            pool = multiprocessing.Pool(kwargs["workers"])
+            # Results keep file order, so checkpoints only ever move forward,
+            # and at most two chunks per worker are parsed ahead of the writer
+            parsed = bounded_imap(pool, parse_chunk, chunks, 2 * kwargs["workers"])
+        else:
+            parsed = map(parse_chunk, chunks)
+
+        try:
+            for records, invalid, end_offset in parsed:
+                created, duplicates = self.write_batch(records)
+
+                created_count += created
+                skipped_count += invalid + duplicates
+
+                # Only record progress once the batch is committed
+                if checkpoint:
+                    write_checkpoint(checkpoint, offset=end_offset, created=created_count)
+
+                self.stdout.write(
+                    f"{created_count} papers ingested ({skipped_count} skipped)..."
+                )
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return created_count, skipped_count
+
+    # Insert one batch in one transaction, returns (created, duplicates)
+    def write_batch(self, records):
+        # Deduplicate inside the batch, then drop papers already stored
+        unique = {}
+        for record in records:
+            unique.setdefault(record["paper_id"], record)
+
+        with transaction.atomic():
+            existing = set(
+                Paper.objects
+                .filter(paper_id__in=list(unique.keys()))
+                .values_list("paper_id", flat=True)
+            )
+            new_papers = [
+                Paper(**record) for paper_id, record in unique.items()
+                if paper_id not in existing
+            ]
+
+            # No ignore_conflicts: a row inserted concurrently by another run
+            # fails the batch (nothing is checkpointed) instead of being
+            # counted as created here
+            Paper.objects.bulk_create(new_papers, batch_size=1000)
+
+            # bulk_create skips signals, link the categories for the trend rollups here
+            index_paper_categories(
+                Paper.objects
+                .filter(paper_id__in=[paper.paper_id for paper in new_papers])
+                .values_list("id", "categories", "publication_year")
+            )
+
+        return len(new_papers), len(records) - len(new_papers)
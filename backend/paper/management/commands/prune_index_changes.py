@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from paper.utils.faiss_index import prune_index_changes
+
+
+class Command(BaseCommand):
+    help = "Delete FAISS change log entries older than the retention window that every snapshot contains"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention_hours",
+            type=float,
+            default=getattr(settings, "FAISS_CHANGE_LOG_RETENTION_HOURS", 72),
+            help="Keep entries younger than this, every worker must have replayed them by then"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["retention_hours"] < 0:
+            raise CommandError("--retention_hours must not be negative")
+
+        deleted = prune_index_changes(kwargs["retention_hours"])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} change log entries deleted."))
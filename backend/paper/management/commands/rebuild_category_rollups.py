@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from paper.utils.categories import rebuild_category_index, rebuild_category_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the paper/category links and the per (category, year) trend rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=5000,
+            help="Papers read and linked per batch"
+        )
+        parser.add_argument(
+            "--rollups_only",
+            action="store_true",
+            help="Keep the existing links and only recount the rollup table from them"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["rollups_only"]:
+            self.stdout.write(self.style.SUCCESS("Recounting category rollups..."))
+            rollups = rebuild_category_rollups()
+            self.stdout.write(self.style.SUCCESS(f"{rollups} rollup rows written."))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Rebuilding category links and rollups..."))
+        stats = rebuild_category_index(batch_size=kwargs["batch_size"])
+
+        self.stdout.write(f"Papers scanned: {stats['papers']}")
+        self.stdout.write(f"Category links: {stats['links']}")
+        self.stdout.write(self.style.SUCCESS(f"{stats['rollups']} rollup rows written."))
@@ -0,0 +1,54 @@
+import signal
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paper.utils import faiss_index
+from paper.utils.shards import serve_shard, shard_addresses, shard_config
+
+
+class Command(BaseCommand):
+    help = "Serve one shard of the FAISS index to the web workers over a local or TCP socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shard", type=int, required=True, help="Shard number, 0 to FAISS_SHARDS['COUNT'] - 1")
+        parser.add_argument(
+            "--address",
+            type=str,
+            default=None,
+            help="unix:/path.sock or host:port to listen on (default FAISS_SHARDS['ADDRESSES'][shard])"
+        )
+        parser.add_argument("--no_mmap", action="store_true", help="Read the snapshot into memory instead of mapping it")
+
+    def handle(self, *args, **kwargs):
+        config = shard_config()
+        if not config["COUNT"]:
+            raise CommandError("Set FAISS_SHARDS['COUNT'] to serve shards")
+
+        number = kwargs["shard"]
+        try:
+            faiss_index.set_shard(number)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        address = kwargs["address"] or shard_addresses(config)[number]
+
+        if faiss_index.load_faiss_snapshot(mmap=not kwargs["no_mmap"]):
+            self.stdout.write(
+                f"Shard {number} snapshot v{faiss_index.index_version} loaded "
+                f"with {faiss_index.index.ntotal} vectors."
+            )
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"No snapshot for shard {number}, building it from the database "
+                f"(run build_faiss_snapshot --shard {number} to avoid this)."
+            ))
+            faiss_index.build_faiss_index()
+
+        # Leave through the server's cleanup (socket file removal) on SIGTERM too
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        self.stdout.write(self.style.SUCCESS(f"Serving shard {number} of {config['COUNT']} on {address}"))
+        try:
+            serve_shard(address)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,90 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Run in a fresh interpreter so nothing is already imported
+SCRIPT = """
+import os
+import time
+start = time.perf_counter()
+import django
+django.setup()
+import api.urls
+print("SETUP", time.perf_counter() - start)
+if os.environ.get("STARTUP_REPORT_WARM_UP") == "1":
+    from paper.utils.encoders import warm_up
+    start = time.perf_counter()
+    warm_up()
+    print("WARM_UP", time.perf_counter() - start)
+"""
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+class Command(BaseCommand):
+    help = "Report where process startup time goes (python -X importtime, grouped by package)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15, help="Rows per table")
+        parser.add_argument(
+            "--warm_up",
+            action="store_true",
+            help="Also time loading the encoder model"
+        )
+
+    def handle(self, *args, **kwargs):
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "papyrus.settings")
+        env["STARTUP_REPORT_WARM_UP"] = "1" if kwargs["warm_up"] else "0"
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+
+        if result.returncode != 0:
+            self.stderr.write(result.stderr[-2000:])
+            return
+
+        self_us = defaultdict(int)
+        top_level = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if not match:
+                continue
+
+            own, cumulative, indent, module = match.groups()
+            package = module.split(".")[0]
+            self_us[package] += int(own)
+
+            # Top-level imports (least indented) carry the cumulative time
+            if len(indent) <= 1:
+                top_level[module] = int(cumulative)
+
+        timings = dict(
+            line.split() for line in result.stdout.splitlines()
+            if line.startswith(("SETUP", "WARM_UP"))
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"django.setup() + URL import: {float(timings['SETUP']):.2f}s"
+        ))
+        if "WARM_UP" in timings:
+            self.stdout.write(self.style.SUCCESS(f"Encoder warm-up: {float(timings['WARM_UP']):.2f}s"))
+
+        self.stdout.write("\nSelf import time by package:")
+        for package, us in sorted(self_us.items(), key=lambda kv: kv[1], reverse=True)[:kwargs["top"]]:
+            self.stdout.write(f"  {us / 1e6:8.3f}s  {package}")
+
+        self.stdout.write("\nCumulative time of top-level imports:")
+        for module, us in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:kwargs["top"]]:
+            self.stdout.write(f"  {us / 1e6:8.3f}s  {module}")
@@ -0,0 +1,102 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .utils.metrics import StageTimer, timing_config
+from .utils.profiling import (
+    RequestProfile, acquire_slot, profiling_config, release_slot, save_profile, wants_profile,
+)
+
+
+class StageTimingMiddleware:
+    # Gives every request a StageTimer (request.stage_timer). Views that
+    # name it through metrics.stage_timer get a Server-Timing header, a
+    # structured log line and per-stage histograms; rendering the DRF
+    # response is timed as the "serialize" stage.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not timing_config()["ENABLED"]:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.stage_timer = StageTimer()
+        response = self.get_response(request)
+        return request.stage_timer.finish(request, response)
+
+    async def __acall__(self, request):
+        request.stage_timer = StageTimer()
+        response = await self.get_response(request)
+        return request.stage_timer.finish(request, response)
+
+    # Runs right before a template / DRF response is rendered
+    def process_template_response(self, request, response):
+        timer = getattr(request, "stage_timer", None)
+        if timer is not None and timer.view:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timer.record("serialize", time.perf_counter() - start)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class RequestProfilingMiddleware:
+    # Opt-in cProfile + SQL capture for the REQUEST_PROFILING["VIEWS"]
+    # viewsets. A request is profiled when it sends the profiling header
+    # or is sampled; the view and the rendering of its response then run
+    # inside the profiler and the artifacts are saved under MEDIA_ROOT
+    # (X-Profile-Id names them, download them from /api/profiles/).
+    # Disabled, the middleware is not installed at all.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.config = profiling_config()
+        if not self.config["ENABLED"]:
+            raise MiddlewareNotUsed()
+
+        self.views = set(self.config["VIEWS"])
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    # Awaited by the handler in async mode
+    def __call__(self, request):
+        return self.get_response(request)
+
+    # Runs in the thread that executes the (sync) view, also under ASGI,
+    # so the profiler and the connection wrappers see the view's work
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cls = getattr(view_func, "cls", None)
+        if cls is None or cls.__name__ not in self.views or not wants_profile(request, self.config):
+            return None
+        if not acquire_slot(self.config):
+            return None
+
+        try:
+            actions = getattr(view_func, "actions", None) or {}
+            view = f"{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+
+            profile = RequestProfile(self.config)
+            with profile.record():
+                response = view_func(request, *view_args, **view_kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+
+            response["X-Profile-Id"] = save_profile(profile, request, response, view)
+            return response
+        finally:
+            release_slot()
@@ -0,0 +1,91 @@
+import numpy as np
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def _dtype():
+    return np.dtype(getattr(settings, "EMBEDDING_DTYPE", "float32")).newbyteorder("<")
+
+
+# Copy JSON float lists into packed binary blobs
+def json_to_binary(apps, schema_editor):
+    dtype = _dtype()
+
+    for model_name in ("Paper", "UserUpload"):
+        model = apps.get_model("paper", model_name)
+        queryset = model.objects.exclude(embedding__isnull=True).only("id", "embedding")
+
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            obj.embedding_bin = np.asarray(obj.embedding, dtype=dtype).tobytes()
+            batch.append(obj)
+
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["embedding_bin"])
+                batch = []
+
+        if batch:
+            model.objects.bulk_update(batch, ["embedding_bin"])
+
+
+# Reverse: decode the blobs back into JSON float lists
+def binary_to_json(apps, schema_editor):
+    dtype = _dtype()
+
+    for model_name in ("Paper", "UserUpload"):
+        model = apps.get_model("paper", model_name)
+        queryset = model.objects.exclude(embedding_bin__isnull=True).only("id", "embedding_bin")
+
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            obj.embedding = np.frombuffer(obj.embedding_bin, dtype=dtype).astype("float32").tolist()
+            batch.append(obj)
+
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["embedding"])
+                batch = []
+
+        if batch:
+            model.objects.bulk_update(batch, ["embedding"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='embedding_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userupload',
+            name='embedding_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='paper',
+            name='embedding',
+        ),
+        migrations.RemoveField(
+            model_name='userupload',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='paper',
+            old_name='embedding_bin',
+            new_name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='userupload',
+            old_name='embedding_bin',
+            new_name='embedding',
+        ),
+    ]
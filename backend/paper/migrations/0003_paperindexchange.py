@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0002_binary_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaperIndexChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paper_pk', models.BigIntegerField(db_index=True)),
+                ('op', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# The DDL is kept here rather than imported from paper.utils.lexical, so
+# this migration does not change when the search code does
+
+# SQLite: FTS5 table over paper_paper (external content, kept in sync by triggers)
+SQLITE_FULLTEXT_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS paper_paper_fts USING fts5(
+        title, abstract, content='paper_paper', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS paper_paper_fts_ai AFTER INSERT ON paper_paper BEGIN
+        INSERT INTO paper_paper_fts(rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS paper_paper_fts_ad AFTER DELETE ON paper_paper BEGIN
+        INSERT INTO paper_paper_fts(paper_paper_fts, rowid, title, abstract)
+        VALUES ('delete', old.id, old.title, old.abstract);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS paper_paper_fts_au AFTER UPDATE OF title, abstract ON paper_paper BEGIN
+        INSERT INTO paper_paper_fts(paper_paper_fts, rowid, title, abstract)
+        VALUES ('delete', old.id, old.title, old.abstract);
+        INSERT INTO paper_paper_fts(rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+    END""",
+    "INSERT INTO paper_paper_fts(paper_paper_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS paper_paper_fts_ai",
+    "DROP TRIGGER IF EXISTS paper_paper_fts_ad",
+    "DROP TRIGGER IF EXISTS paper_paper_fts_au",
+    "DROP TABLE IF EXISTS paper_paper_fts",
+]
+
+# PostgreSQL: GIN index over the tsvector expression keyword_search queries
+POSTGRES_FULLTEXT_SQL = [
+    "CREATE INDEX IF NOT EXISTS paper_paper_fulltext_gin ON paper_paper USING GIN "
+    "(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(abstract, '')))",
+]
+
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS paper_paper_fulltext_gin",
+]
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {"sqlite": SQLITE_FULLTEXT_SQL, "postgresql": POSTGRES_FULLTEXT_SQL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0003_paperindexchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
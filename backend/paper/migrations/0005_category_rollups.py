@@ -0,0 +1,107 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:09
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+
+def _year(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+# Link the papers already stored and fill the rollups. Self-contained with
+# historical models, paper.utils.categories may change after this migration.
+def backfill(apps, schema_editor):
+    Paper = apps.get_model("paper", "Paper")
+    Category = apps.get_model("paper", "Category")
+    PaperCategory = apps.get_model("paper", "PaperCategory")
+    CategoryYearCount = apps.get_model("paper", "CategoryYearCount")
+
+    ids = {}
+    counts = Counter()
+    last_id = 0
+
+    while True:
+        rows = list(
+            Paper.objects
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "categories", "publication_year")[:5000]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        names = {name for _, categories, _ in rows for name in (categories or "").split()}
+        new_names = names - ids.keys()
+        if new_names:
+            Category.objects.bulk_create([Category(name=name) for name in new_names], ignore_conflicts=True)
+            ids.update(Category.objects.filter(name__in=new_names).values_list("name", "id"))
+
+        links = []
+        for pk, categories, year in rows:
+            year = _year(year)
+            for name in set((categories or "").split()):
+                links.append(PaperCategory(paper_id=pk, category_id=ids[name], publication_year=year))
+                if year is not None:
+                    counts[(ids[name], year)] += 1
+        PaperCategory.objects.bulk_create(links, batch_size=1000)
+
+    CategoryYearCount.objects.bulk_create(
+        [
+            CategoryYearCount(category_id=category_id, year=year, count=count)
+            for (category_id, year), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0004_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryYearCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='year_counts', to='paper.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'year'), name='unique_category_year')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaperCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_year', models.IntegerField(blank=True, null=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paper_links', to='paper.category')),
+                ('paper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_links', to='paper.paper')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'publication_year'], name='paper_paper_categor_530f93_idx')],
+                'constraints': [models.UniqueConstraint(fields=('paper', 'category'), name='unique_paper_category')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0005_category_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Topic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField(unique=True)),
+                ('label', models.CharField(blank=True, max_length=255)),
+                ('centroid', models.BinaryField()),
+                ('size', models.IntegerField(default=0)),
+                ('recent_count', models.IntegerField(default=0)),
+                ('previous_count', models.IntegerField(default=0)),
+                ('growth_rate', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaperTopic',
+            fields=[
+                ('paper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='topic_link', serialize=False, to='paper.paper')),
+                ('similarity', models.FloatField()),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paper_links', to='paper.topic')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopicYearCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('growth', models.FloatField(blank=True, null=True)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='year_counts', to='paper.topic')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('topic', 'year'), name='unique_topic_year')],
+            },
+        ),
+    ]
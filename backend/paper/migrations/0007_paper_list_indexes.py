@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper', '0006_topics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['created_at', 'id'], name='paper_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['publication_year', 'id'], name='paper_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(fields=['categories'], name='paper_categories_idx'),
+        ),
+    ]
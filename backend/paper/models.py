@@ -11,12 +11,26 @@ class Paper(models.Model):
     journal_ref = models.CharField(max_length=255, null=True, blank=True)
     doi = models.CharField(max_length=255, null=True, blank=True)
     publication_year = models.IntegerField(null=True, blank=True)
-    embedding = models.JSONField(null=True, blank=True)   # vector representation
+    embedding = models.BinaryField(null=True, blank=True)   # packed vector, see paper/utils/vectors.py
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # (field, id) pairs back the keyset pagination of /papers/ (see paper/pagination.py)
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="paper_created_id_idx"),
+            models.Index(fields=["publication_year", "id"], name="paper_year_id_idx"),
+            models.Index(fields=["categories"], name="paper_categories_idx"),
+        ]
+
     def __str__(self):
         return self.title
 
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # The indexed values loaded at init may be stale now, the next save
+        # logs an index change (see paper/signals.py)
+        self.__dict__.pop("_indexed_state", None)
+
 
 class UserUpload(models.Model):
     upload_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -24,8 +38,101 @@ class UserUpload(models.Model):
     authors = models.TextField(blank=True, null=True)
     abstract = models.TextField()
     categories = models.CharField(max_length=200, blank=True, null=True)
-    embedding = models.JSONField(null=True, blank=True)
+    embedding = models.BinaryField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title or f"User Upload {self.upload_id}"
+
+
+class PaperIndexChange(models.Model):
+    # Append-only log of embedding changes. Every process replays it to keep
+    # its in-memory FAISS index fresh without rebuilding from scratch.
+    UPSERT = "upsert"
+    DELETE = "delete"
+    OP_CHOICES = [
+        (UPSERT, "Upsert"),
+        (DELETE, "Delete"),
+    ]
+
+    paper_pk = models.BigIntegerField(db_index=True)   # Paper.id, kept after the paper is deleted
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.op} paper {self.paper_pk}"
+
+
+class Category(models.Model):
+    # One row per arXiv category ("cs.LG"), Paper.categories is split into these
+    name = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        verbose_name_plural = "categories"
+
+    def __str__(self):
+        return self.name
+
+
+class PaperCategory(models.Model):
+    # Paper <-> Category link, maintained from Paper.categories by
+    # paper/utils/categories.py. The year is copied so rollups can be
+    # corrected when a paper changes and rebuilt with one GROUP BY.
+    paper = models.ForeignKey(Paper, on_delete=models.CASCADE, related_name="category_links")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="paper_links")
+    publication_year = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["paper", "category"], name="unique_paper_category"),
+        ]
+        indexes = [
+            models.Index(fields=["category", "publication_year"]),
+        ]
+
+
+class CategoryYearCount(models.Model):
+    # Precomputed papers per (category, publication year) read by /papers/trends/
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="year_counts")
+    year = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "year"], name="unique_category_year"),
+        ]
+
+
+class Topic(models.Model):
+    # Cluster of paper embeddings found by the build_topics command
+    number = models.IntegerField(unique=True)
+    label = models.CharField(max_length=255, blank=True)      # most common categories of its papers
+    centroid = models.BinaryField()                            # packed vector, see paper/utils/vectors.py
+    size = models.IntegerField(default=0)
+    recent_count = models.IntegerField(default=0)              # papers in the last `window` years
+    previous_count = models.IntegerField(default=0)            # papers in the `window` years before
+    growth_rate = models.FloatField(null=True, blank=True)     # recent vs previous window
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.label or f"Topic {self.number}"
+
+
+class PaperTopic(models.Model):
+    # Topic assignment of a paper (nearest centroid)
+    paper = models.OneToOneField(Paper, on_delete=models.CASCADE, primary_key=True, related_name="topic_link")
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="paper_links")
+    similarity = models.FloatField()
+
+
+class TopicYearCount(models.Model):
+    # Papers per (topic, year) with the change against the year before
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="year_counts")
+    year = models.IntegerField()
+    count = models.IntegerField(default=0)
+    growth = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["topic", "year"], name="unique_topic_year"),
+        ]
@@ -0,0 +1,175 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound # type: ignore
+from rest_framework.pagination import BasePagination, PageNumberPagination # type: ignore
+from rest_framework.response import Response # type: ignore
+from rest_framework.utils.urls import remove_query_param, replace_query_param # type: ignore
+
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination on (ordering field, id). Each page is an indexed
+    # range query, `WHERE (field, id) < (last value, last id) LIMIT n`, with
+    # no COUNT(*) and no OFFSET, so page 10000 costs the same as page 1.
+    # The ordering comes from ?ordering= (first field, limited to the view's
+    # ordering_fields) and works with ?search= and the other filters.
+    # ?page=N still gets the old page number pagination.
+
+    page_size = 15
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    ordering_param = "ordering"
+    default_ordering = "-created_at"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get("page") is not None:
+            self.legacy = PageNumberPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+        self.legacy = None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        ordering = self.get_ordering(request, view)
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor["r"])
+
+        rows = []
+        for segment in self.segments(queryset, cursor):
+            rows.extend(segment[:self.page_size + 1 - len(rows)])
+            if len(rows) > self.page_size:
+                break
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        allowed = getattr(view, "ordering_fields", None) or []
+        value = request.query_params.get(self.ordering_param, "")
+        first = value.split(",")[0].strip()
+        if first and first.lstrip("-") in allowed:
+            return first
+        return getattr(view, "keyset_ordering", self.default_ordering)
+
+    # Querysets to read in order for the current direction, each one a plain
+    # index range. NULLs (nullable fields only) sort after every value going
+    # forward and come first going back.
+    def segments(self, queryset, cursor):
+        descending = self.descending != self.reverse
+        past = "lt" if descending else "gt"
+        id_order = "-id" if descending else "id"
+        value_order = f"-{self.field}" if descending else self.field
+
+        values = queryset
+        if self.model_field.null:
+            values = queryset.filter(**{f"{self.field}__isnull": False})
+        nulls = queryset.filter(**{f"{self.field}__isnull": True})
+
+        # Values past the cursor: (field, id) > (value, pk), written with a
+        # leading range on field so the composite index is used
+        if cursor is None or (cursor["v"] is None and self.reverse):
+            values = values.order_by(value_order, id_order)
+        elif cursor["v"] is None:
+            values = None
+        else:
+            values = values.filter(
+                Q(**{f"{self.field}__{past}e": cursor["v"]}) &
+                ~Q(**{self.field: cursor["v"], f"id__{'gte' if descending else 'lte'}": cursor["id"]})
+            ).order_by(value_order, id_order)
+
+        if not self.model_field.null:
+            return [values]
+
+        # The NULL block, ordered by id
+        if cursor is None or (cursor["v"] is not None and not self.reverse):
+            nulls = nulls.order_by(id_order)
+        elif cursor["v"] is None:
+            nulls = nulls.filter(**{f"id__{past}": cursor["id"]}).order_by(id_order)
+        else:
+            nulls = None
+
+        ordered = [nulls, values] if self.reverse else [values, nulls]
+        return [segment for segment in ordered if segment is not None]
+
+    def encode_cursor(self, row, reverse):
+        value = getattr(row, self.field)
+        if value is not None:
+            value = self.model_field.value_to_string(row)
+        payload = json.dumps({"v": value, "id": row.pk, "r": int(reverse)}, separators=(",", ":"))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if cursor["v"] is not None:
+                cursor["v"] = self.model_field.to_python(cursor["v"])
+            cursor["id"] = int(cursor["id"])
+            cursor["r"] = bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+        return cursor
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.rows[0], reverse=True)
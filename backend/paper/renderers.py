@@ -0,0 +1,18 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer # type: ignore
+
+
+class NDJSONRenderer(BaseRenderer):
+    # Lets clients ask for newline delimited JSON with Accept. Streamed
+    # results bypass it, it only renders the plain Responses of the same
+    # view (validation errors) as a single line.
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return (json.dumps(data, cls=DjangoJSONEncoder) + "\n").encode(self.charset)
@@ -4,8 +4,9 @@ from .models import *
 class PaperSerializer(serializers.ModelSerializer):
     class Meta:
         model = Paper
-        fields = '__all__'  
-        read_only_fields = ['id', 'created_at', 'updated_at', 'paper_id', 'embedding']
+        # The packed embedding is internal, never send it to clients
+        exclude = ['embedding']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'paper_id']
 
 class PaperListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,3 +37,27 @@ class UserUploadSerializer(serializers.ModelSerializer):
             'created_at',
         ]  
         read_only_fields = ['id', 'created_at', 'upload_id']
+
+
+class TopicYearCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TopicYearCount
+        fields = ["year", "count", "growth"]
+
+
+class TopicSerializer(serializers.ModelSerializer):
+    year_counts = TopicYearCountSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Topic
+        fields = [
+            'id',
+            "number",
+            "label",
+            "size",
+            "recent_count",
+            "previous_count",
+            "growth_rate",
+            "year_counts",
+            "updated_at",
+        ]
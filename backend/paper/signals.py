@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Paper
+from .utils.categories import index_paper_categories
+from .utils.faiss_index import apply_index_changes, record_index_changes
+from .utils.hydration import invalidate_papers
+from .utils.vectors import from_bytes
+
+# Fields the index depends on: the vector itself and the filter attributes
+INDEXED_FIELDS = {"embedding", "categories", "publication_year"}
+CATEGORY_FIELDS = {"categories", "publication_year"}
+
+# Stands in for deferred fields, whose loaded value is unknown
+_UNKNOWN = object()
+
+
+def _indexed_values(instance):
+    values = {}
+    for field in INDEXED_FIELDS:
+        value = instance.__dict__.get(field, _UNKNOWN)
+        # Postgres returns BinaryField values as memoryview
+        values[field] = bytes(value) if isinstance(value, memoryview) else value
+    return values
+
+
+# Remember the indexed fields as loaded, so saves that do not touch them
+# (title or abstract edits) skip the change log and the index update
+@receiver(post_init, sender=Paper)
+def paper_loaded(sender, instance, **kwargs):
+    instance._indexed_state = _indexed_values(instance)
+
+
+# Indexed fields this save changes, compared with the values last loaded
+# or saved. New papers and instances without a known state change all.
+@receiver(pre_save, sender=Paper)
+def paper_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    state = getattr(instance, "_indexed_state", None)
+    current = _indexed_values(instance)
+
+    if instance._state.adding or state is None:
+        changed = set(INDEXED_FIELDS)
+    else:
+        changed = {
+            field for field in INDEXED_FIELDS
+            if state[field] is _UNKNOWN or state[field] != current[field]
+        }
+
+    if update_fields is not None:
+        changed &= set(update_fields)
+
+    instance._indexed_changes = changed
+
+
+# Keep the FAISS index in step with Paper rows. The change is logged for
+# the other worker processes and applied to this one once the transaction
+# commits. Bulk writers (bulk_create/bulk_update) bypass signals and call
+# record_index_changes themselves.
+@receiver(post_save, sender=Paper)
+def paper_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+
+    # Cached search payloads go stale on any edit, not only embedding changes
+    invalidate_papers([instance.pk])
+
+    if not getattr(instance, "_indexed_changes", INDEXED_FIELDS):
+        return
+
+    pk = instance.pk
+
+    if instance.embedding is None:
+        if created:
+            return
+
+        record_index_changes(delete_ids=[pk])
+        transaction.on_commit(lambda: apply_index_changes(deletes=[pk]))
+        return
+
+    vector = from_bytes(instance.embedding)
+    attributes = {pk: (instance.categories, instance.publication_year)}
+    record_index_changes(upsert_ids=[pk])
+    transaction.on_commit(lambda: apply_index_changes(upserts={pk: vector}, attributes=attributes))
+
+
+@receiver(post_delete, sender=Paper)
+def paper_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+
+    invalidate_papers([pk])
+    record_index_changes(delete_ids=[pk])
+    transaction.on_commit(lambda: apply_index_changes(deletes=[pk]))
+
+
+# Keep the category links and trend rollups in step with Paper.categories.
+# Bulk writers call index_paper_categories themselves.
+@receiver(post_save, sender=Paper)
+def paper_categories_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+
+    if not CATEGORY_FIELDS & getattr(instance, "_indexed_changes", CATEGORY_FIELDS):
+        return
+
+    index_paper_categories([(instance.pk, instance.categories, instance.publication_year)])
+
+
+# The saved values are the stored state now. Registered after the receivers
+# above, which still need this save's changes.
+@receiver(post_save, sender=Paper)
+def paper_state_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    state = getattr(instance, "_indexed_state", None)
+    current = _indexed_values(instance)
+    if state is None or update_fields is None:
+        instance._indexed_state = current
+    else:
+        instance._indexed_state = {
+            field: current[field] if field in update_fields else state[field]
+            for field in INDEXED_FIELDS
+        }
+    instance._indexed_changes = set()
+
+
+# Links cascade on delete, but the rollup counts need decrementing first
+@receiver(pre_delete, sender=Paper)
+def paper_categories_deleted(sender, instance, **kwargs):
+    index_paper_categories([(instance.pk, None, None)])
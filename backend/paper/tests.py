@@ -1,3 +1,1631 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from contextlib import redirect_stdout
+from multiprocessing.pool import ThreadPool
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from paper.management.commands.export_onnx_model import FALLBACK_SENTENCES
+from paper.models import CategoryYearCount, Paper, PaperIndexChange, PaperTopic, Topic, UserUpload
+from paper.utils import embedding_cache, encoders, faiss_index, hydration, recommend, shards
+from paper.utils.batching import BatchingEncoder
+from paper.utils.categories import rebuild_category_index
+from paper.utils.embedding_cache import EmbeddingCache
+from paper.utils.embeddings import generate_embedding, generate_embeddings
+from paper.utils.encoders import embedding_parity, get_model, model_config
+from paper.utils.executor import BoundedExecutor, ExecutorFull
+from paper.utils.fusion import annotate_results, reciprocal_rank_fusion
+from paper.utils.hydration import PaperPayloadCache, hydrate_papers
+from paper.utils.index_factory import (
+    INDEX_TYPES, create_index, describe_index, filtered_config, index_config, resolve_index_type,
+    search_parameters,
+)
+from paper.utils.index_validation import probe_recall
+from paper.utils.lexical import keyword_search
+from paper.utils.pipeline import bounded_imap
+from paper.utils.profiling import list_profiles, profile_path
+from paper.utils.search_filters import FILTERS_FILE, FilterAttributes, parse_search_filters
+from paper.utils.vectors import from_bytes, to_bytes
+
+
+class FakeEncoder:
+    # Stand-in for the sentence encoder: a hashed bag of words, so texts
+    # sharing words are close and the tests never download a model
+
+    dim = 256
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), self.dim), dtype="float32")
+        for row, text in enumerate([texts] if single else texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+        return vectors[0] if single else vectors
+
+
+def embed(text):
+    return FakeEncoder().encode(text)
+
+
+def make_paper(paper_id, title="", abstract="", categories=None, year=None, embedded=False, **fields):
+    if embedded:
+        fields["embedding"] = to_bytes(embed(abstract))
+    return Paper.objects.create(
+        paper_id=paper_id, title=title, authors="A. Author", abstract=abstract,
+        categories=categories, publication_year=year, **fields,
+    )
+
+
+class IndexTestCase(TestCase):
+    # Every test gets an empty snapshot directory, an in-memory flat index
+    # and the fake encoder. The index is module state, so it is reset
+    # before and after each test.
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+
+        settings_override = override_settings(
+            FAISS_INDEX_DIR=self.index_dir,
+            FAISS_INDEX={"TYPE": "flat"},
+            FAISS_SHARDS={"COUNT": 0},
+            FAISS_SYNC_INTERVAL=0,
+            FAISS_HOT_RELOAD=False,
+            ENCODER_BATCHING={"ENABLED": False},
+            EMBEDDING_CACHE={"BACKEND": None},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        encoder = mock.patch.dict(encoders._models, {model_config()["BACKEND"]: FakeEncoder()})
+        encoder.start()
+        self.addCleanup(encoder.stop)
+
+        self.reset_index()
+        self.addCleanup(self.reset_index)
+
+    def reset_index(self):
+        faiss_index._set_base(None, np.empty(0, dtype="int64"), None, 0)
+        faiss_index._index_built = False
+        faiss_index._load_attempted = True
+        faiss_index._rejected_version = None
+
+    def build_index(self):
+        self.reset_index()
+        with redirect_stdout(io.StringIO()):
+            faiss_index.build_faiss_index()
+
+    def search(self, text, top_n=5, filters=None):
+        return [hit["paper_id"] for hit in faiss_index.search_similar_papers(embed(text), top_n, filters)]
+
+
+# Runs against the model written by `manage.py export_onnx_model`,
+# skipped when it has not been exported on this machine.
+class OnnxParityTests(SimpleTestCase):
+
+    def setUp(self):
+        config = model_config()
+        if not os.path.exists(os.path.join(config["ONNX_DIR"], config["ONNX_FILE"])):
+            raise unittest.SkipTest("ONNX model not exported")
+
+        try:
+            self.reference = get_model("torch")
+            self.candidate = get_model("onnx")
+        except (ImportError, OSError) as e:
+            raise unittest.SkipTest(f"Encoder not available: {e}")
+
+        self.quantized = "qint8" in config["ONNX_FILE"]
+
+    def test_cosine_agreement_with_pytorch(self):
+        cosines = embedding_parity(self.reference, self.candidate, FALLBACK_SENTENCES)
+
+        self.assertGreaterEqual(cosines.min(), 0.95 if self.quantized else 0.99)
+
+
+class KeywordSearchTests(TestCase):
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            raise unittest.SkipTest("BM25 ordering is specific to the SQLite FTS5 index")
+
+        self.strong = make_paper(
+            "0001", "Neural ranking models", "Neural ranking with neural networks for ranking.", "cs.IR", 2021
+        )
+        self.weak = make_paper("0002", "Graph theory", "A short note that mentions neural methods once.", "math.CO", 2019)
+        self.other = make_paper("0003", "Cooking", "Nothing relevant here.", "cs.IR", 2020)
+
+    def test_bm25_ranks_better_matches_first(self):
+        results = keyword_search("neural ranking")
+
+        self.assertEqual([pk for pk, _ in results], [self.strong.pk, self.weak.pk])
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_filters_apply_inside_the_query(self):
+        results = keyword_search("neural", filters={"categories": ("math.CO",), "year_from": None, "year_to": None})
+
+        self.assertEqual([pk for pk, _ in results], [self.weak.pk])
+
+    def test_category_filters_match_wildcards_literally(self):
+        for category in ("%", "_", "cs_IR", "cs.%"):
+            with self.subTest(category=category):
+                results = keyword_search("neural", filters=search_filters([category]))
+                self.assertEqual(results, [])
+
+    def test_index_follows_edits(self):
+        self.other.abstract = "Neural ranking, neural ranking, neural ranking."
+        self.other.save()
+        self.strong.delete()
+
+        self.assertEqual(keyword_search("ranking")[0][0], self.other.pk)
+
+
+class IndexChangeTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.graphs = make_paper("1001", "Graphs", "graph coloring planar graphs", "math.CO", 2020, embedded=True)
+        self.proteins = make_paper("1002", "Proteins", "protein folding molecular dynamics", "q-bio.BM", 2021, embedded=True)
+        self.vision = make_paper("1003", "Vision", "image segmentation convolutional networks", "cs.CV", 2022, embedded=True)
+        self.build_index()
+
+    def test_base_index_finds_stored_papers(self):
+        self.assertEqual(self.search("protein folding")[0], self.proteins.pk)
+        self.assertEqual(faiss_index.index_stats()["ntotal"], 3)
+
+    def test_update_moves_the_paper_to_the_delta_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.graphs.abstract = "quantum error correcting codes"
+            self.graphs.embedding = to_bytes(embed(self.graphs.abstract))
+            self.graphs.save()
+
+        self.assertEqual(self.search("quantum error correcting codes")[0], self.graphs.pk)
+        # The stale base vector is tombstoned
+        self.assertNotIn(self.graphs.pk, self.search("graph coloring planar graphs", top_n=3)[:1])
+
+        stats = faiss_index.index_stats()
+        self.assertEqual((stats["ntotal"], stats["delta"], stats["removed"]), (3, 1, 1))
+
+    def test_delete_removes_the_paper_from_results(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vision.delete()
+
+        self.assertNotIn(self.vision.pk, self.search("image segmentation convolutional networks"))
+
+    def test_new_paper_is_searchable_before_any_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            paper = make_paper("1004", "Markets", "stock market volatility forecasting", "q-fin.ST", 2023, embedded=True)
+
+        self.assertEqual(self.search("stock market volatility")[0], paper.pk)
+
+    def test_changes_from_other_processes_are_replayed_from_the_log(self):
+        # Writes that bypass this process's signals, as another worker's would look
+        Paper.objects.filter(pk=self.graphs.pk).update(embedding=to_bytes(embed("black hole thermodynamics")))
+        Paper.objects.filter(pk=self.proteins.pk).update(embedding=None)
+        faiss_index.record_index_changes(upsert_ids=[self.graphs.pk], delete_ids=[self.proteins.pk])
+
+        faiss_index.sync_index_changes(force=True)
+
+        self.assertEqual(self.search("black hole thermodynamics")[0], self.graphs.pk)
+        self.assertNotIn(self.proteins.pk, self.search("protein folding molecular dynamics"))
+        self.assertEqual(faiss_index.index_stats()["last_change_id"], PaperIndexChange.objects.latest("id").id)
+
+    def test_snapshot_append_and_reload(self):
+        meta = faiss_index.save_faiss_snapshot(validate=False)
+        self.assertEqual((meta["version"], meta["ntotal"]), (1, 3))
+
+        # Bulk inserts skip signals, the ingest commands append them directly
+        text = "stock market volatility forecasting"
+        Paper.objects.bulk_create([Paper(
+            paper_id="1004", title="Markets", authors="A. Author", abstract=text,
+            categories="q-fin.ST", publication_year=2023, embedding=to_bytes(embed(text)),
+        )])
+        paper = Paper.objects.get(paper_id="1004")
+        meta = faiss_index.append_to_snapshot([paper.pk], embed(text)[None, :])
+        self.assertEqual((meta["version"], meta["ntotal"]), (2, 4))
+
+        self.reset_index()
+        self.assertTrue(faiss_index.load_faiss_snapshot(mmap=False))
+        self.assertEqual(faiss_index.index_version, 2)
+        self.assertEqual(self.search(text)[0], paper.pk)
+        self.assertEqual(self.search(text, filters={"categories": ("q-fin.ST",), "year_from": None, "year_to": None}), [paper.pk])
+
+    # What ingest_and_embed does per batch: bulk insert, log, append later
+    def ingest(self, paper_id, text):
+        Paper.objects.bulk_create([Paper(
+            paper_id=paper_id, title=text, authors="A. Author", abstract=text,
+            categories="q-fin.ST", publication_year=2023, embedding=to_bytes(embed(text)),
+        )])
+        paper = Paper.objects.get(paper_id=paper_id)
+        faiss_index.record_index_changes(upsert_ids=[paper.pk])
+        return paper
+
+    def test_reloading_an_appended_snapshot_replays_nothing(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        papers = [self.ingest("1004", "stock market volatility"), self.ingest("1005", "bond yield curves")]
+
+        faiss_index.append_to_snapshot([p.pk for p in papers], np.vstack([embed(p.abstract) for p in papers]))
+
+        self.reset_index()
+        faiss_index.load_faiss_snapshot(mmap=False)
+        faiss_index.sync_index_changes(force=True)
+
+        self.assertEqual(faiss_index.index_stats()["delta"], 0)
+        self.assertEqual(faiss_index.index_stats()["removed"], 0)
+        self.assertEqual(self.search("bond yield curves")[0], papers[1].pk)
+
+    def test_appended_snapshot_still_replays_later_changes(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        paper = self.ingest("1004", "stock market volatility")
+        # Edited and another paper deleted after the insert, before the append
+        Paper.objects.filter(pk=paper.pk).update(embedding=to_bytes(embed("option pricing models")))
+        faiss_index.record_index_changes(upsert_ids=[paper.pk], delete_ids=[self.vision.pk])
+        Paper.objects.filter(pk=self.vision.pk).update(embedding=None)
+
+        faiss_index.append_to_snapshot([paper.pk], embed("stock market volatility")[None, :])
+
+        self.reset_index()
+        faiss_index.load_faiss_snapshot(mmap=False)
+        faiss_index.sync_index_changes(force=True)
+
+        self.assertEqual(self.search("option pricing models")[0], paper.pk)
+        self.assertNotIn(self.vision.pk, self.search("image segmentation convolutional networks"))
+
+    def test_saves_that_keep_the_indexed_fields_log_nothing(self):
+        logged = PaperIndexChange.objects.count()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            paper = Paper.objects.get(pk=self.graphs.pk)
+            paper.title = "Graph colourings"
+            paper.save()
+            paper.embedding = to_bytes(embed(paper.abstract))
+            paper.save()
+            Paper.objects.only("id", "title").get(pk=self.proteins.pk).save()
+
+        self.assertEqual(PaperIndexChange.objects.count(), logged)
+        self.assertEqual(faiss_index.index_stats()["delta"], 0)
+
+    def test_saves_that_change_indexed_fields_are_logged(self):
+        last = PaperIndexChange.objects.latest("id").id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            paper = Paper.objects.get(pk=self.graphs.pk)
+            paper.categories = "math.GT"
+            paper.save(update_fields=["categories"])
+            # Equal to the stored value again, but only after reloading
+            Paper.objects.filter(pk=paper.pk).update(categories="math.CO")
+            paper.refresh_from_db(fields=["categories"])
+            paper.categories = "math.GT"
+            paper.save()
+
+        logged = PaperIndexChange.objects.filter(id__gt=last).values_list("paper_pk", flat=True)
+        self.assertEqual(list(logged), [paper.pk, paper.pk])
+        self.assertEqual(faiss_index._delta_attributes[paper.pk], ("math.GT", 2020))
+
+    def test_tombstones_stay_sorted_and_their_selector_is_reused(self):
+        faiss_index.apply_index_changes(deletes=[self.vision.pk])
+        faiss_index.apply_index_changes(deletes=[self.graphs.pk, self.vision.pk])
+
+        np.testing.assert_array_equal(
+            faiss_index._removed_positions,
+            sorted(faiss_index._base_position(pk) for pk in (self.graphs.pk, self.vision.pk)),
+        )
+
+        with mock.patch.object(faiss_index.faiss, "IDSelectorBatch", wraps=faiss_index.faiss.IDSelectorBatch) as batch:
+            self.assertEqual(self.search("protein folding"), [self.proteins.pk])
+            self.assertEqual(self.search("graph coloring"), [self.proteins.pk])
+        self.assertEqual(batch.call_count, 1)
+
+    def test_delta_filter_selector_follows_changes(self):
+        filters = search_filters(categories=("q-fin.ST",))
+        faiss_index.apply_index_changes(
+            {self.graphs.pk: embed("market risk")}, attributes={self.graphs.pk: ("q-fin.ST", 2020)}
+        )
+        self.assertEqual(self.search("market risk", filters=filters), [self.graphs.pk])
+
+        faiss_index.apply_index_changes(
+            {self.proteins.pk: embed("market risk premia")}, attributes={self.proteins.pk: ("q-fin.ST", 2021)}
+        )
+        self.assertEqual(sorted(self.search("market risk", filters=filters)), sorted([self.graphs.pk, self.proteins.pk]))
+
+    def test_writing_a_snapshot_keeps_the_change_log(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vision.delete()
+        faiss_index.save_faiss_snapshot(validate=False)
+
+        self.assertTrue(PaperIndexChange.objects.exists())
+
+    def test_prune_only_drops_old_entries_every_snapshot_contains(self):
+        faiss_index.record_index_changes(upsert_ids=[self.graphs.pk])
+        faiss_index.save_faiss_snapshot(validate=False)
+        faiss_index.record_index_changes(upsert_ids=[self.proteins.pk])
+
+        # Inside the retention window nothing goes
+        self.assertEqual(faiss_index.prune_index_changes(retention_hours=1), 0)
+
+        faiss_index.prune_index_changes(retention_hours=0)
+        self.assertEqual(list(PaperIndexChange.objects.values_list("paper_pk", flat=True)), [self.proteins.pk])
+
+
+class IndexFactoryTests(SimpleTestCase):
+
+    def test_unknown_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            index_config({"TYPE": "lsh"})
+
+    def test_small_corpora_fall_back_to_flat_unless_untrained(self):
+        config = index_config({"MIN_TRAIN_SIZE": 1000})
+
+        for index_type in INDEX_TYPES:
+            expected = index_type if index_type in ("flat", "fp16", "sq8") else "flat"
+            self.assertEqual(resolve_index_type(999, {**config, "TYPE": index_type}), expected)
+            self.assertEqual(resolve_index_type(1000, {**config, "TYPE": index_type}), index_type)
+
+    def test_each_type_creates_its_index(self):
+        config = index_config({"MIN_TRAIN_SIZE": 1, "NLIST": 8, "PQ_M": 4, "HNSW_M": 8})
+        expected = {
+            "flat": "flat", "fp16": "fp16", "sq8": "sq8", "pq": "pq(M=4)",
+            "ivf_flat": "ivf_flat(nlist=8)", "ivf_pq": "ivf_pq(nlist=8)", "hnsw": "hnsw(M=8)",
+        }
+
+        for index_type in INDEX_TYPES:
+            new_index = create_index(16, 100, {**config, "TYPE": index_type})
+            self.assertEqual(describe_index(new_index), expected[index_type])
+
+    def test_search_parameters(self):
+        config = index_config({"MIN_TRAIN_SIZE": 1, "NLIST": 8, "NPROBE": 16, "EF_SEARCH": 40, "HNSW_M": 8})
+        selector = faiss_index.faiss.IDSelectorRange(0, 10)
+
+        ivf = search_parameters(create_index(16, 100, {**config, "TYPE": "ivf_flat"}), selector, config)
+        self.assertEqual(ivf.nprobe, 8)   # never more than the lists there are
+        hnsw = search_parameters(create_index(16, 100, {**config, "TYPE": "hnsw"}), None, config)
+        self.assertEqual(hnsw.efSearch, 40)
+        self.assertIsNone(search_parameters(create_index(16, 100, {**config, "TYPE": "flat"}), None, config))
+        self.assertIsNotNone(search_parameters(create_index(16, 100, {**config, "TYPE": "flat"}), selector, config))
+
+    def test_filtered_config_widens_by_selectivity(self):
+        config = index_config({"NPROBE": 4, "EF_SEARCH": 64, "MAX_EF_SEARCH": 1024})
+
+        widened = filtered_config(config, 0.1)
+        self.assertEqual((widened["NPROBE"], widened["EF_SEARCH"]), (40, 640))
+        self.assertEqual(filtered_config(config, 0.001)["EF_SEARCH"], 1024)
+        self.assertEqual(config["NPROBE"], 4)
+
+
+class IndexTypeTests(IndexTestCase):
+    # Every index type over a small random corpus, with training forced on.
+    # 20 of the 640 papers are in "rare.X" for the filtered searches.
+
+    CONFIG = {
+        "MIN_TRAIN_SIZE": 1, "TRAIN_SAMPLE": 640, "NLIST": 16, "NPROBE": 16,
+        "PQ_M": 8, "PQ_NBITS": 4, "HNSW_M": 8, "EF_CONSTRUCTION": 40, "EF_SEARCH": 32,
+    }
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(7)
+        self.vectors = rng.standard_normal((640, 32)).astype("float32")
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+
+        Paper.objects.bulk_create([
+            Paper(
+                paper_id=f"{n:04d}", title="t", authors="a", abstract="a",
+                categories="rare.X" if n % 32 == 0 else "common.Y", publication_year=2020,
+                embedding=to_bytes(vector),
+            )
+            for n, vector in enumerate(self.vectors)
+        ])
+        self.ids = np.asarray(Paper.objects.order_by("id").values_list("id", flat=True))
+
+    def use(self, build=True, **config):
+        override = override_settings(FAISS_INDEX={**self.CONFIG, **config})
+        override.enable()
+        self.addCleanup(override.disable)
+        if build:
+            self.build_index()
+
+    def exact_top(self, query, top_n):
+        scores = self.vectors @ query
+        return [int(self.ids[pos]) for pos in np.argsort(-scores, kind="stable")[:top_n]]
+
+    def test_every_type_builds_trains_and_searches(self):
+        for index_type in INDEX_TYPES:
+            with self.subTest(index_type):
+                self.use(TYPE=index_type)
+
+                self.assertEqual(describe_index(faiss_index.index).split("(")[0], index_type)
+                self.assertTrue(faiss_index.index.is_trained)
+                self.assertEqual(faiss_index.index.ntotal, 640)
+                self.assertGreaterEqual(probe_recall(faiss_index.index, self.ids, 32, index_config()), 0.8)
+
+                results = faiss_index.search_similar_papers(self.vectors[5], 5)
+                self.assertEqual(len(results), 5)
+
+    def test_rescoring_returns_the_exact_order(self):
+        # Enough candidates to cover the corpus, the order then comes from exact vectors alone
+        self.use(build=False, TYPE="pq", RESCORE=True, RESCORE_FACTOR=128)
+
+        faiss_index.save_faiss_snapshot(validate=False)
+        self.reset_index()
+        faiss_index.load_faiss_snapshot(mmap=False)
+        self.assertIsNotNone(faiss_index._exact_vectors)
+
+        query = self.vectors[11] + self.vectors[12]
+        query /= np.linalg.norm(query)
+        hits = faiss_index.search_similar_papers(query, 5)
+
+        self.assertEqual([hit["paper_id"] for hit in hits], self.exact_top(query, 5))
+        np.testing.assert_allclose(
+            [hit["score"] for hit in hits], np.sort(self.vectors @ query)[::-1][:5], rtol=1e-5
+        )
+
+    def test_selective_filters_still_fill_top_n(self):
+        mask = np.arange(640) % 32 == 0
+
+        for index_type in ("ivf_flat", "ivf_pq", "hnsw"):
+            with self.subTest(index_type):
+                # One IVF list or a short HNSW candidate list sees about one matching paper
+                self.use(TYPE=index_type, NPROBE=1, EF_SEARCH=10)
+
+                for row in (3, 150, 299):
+                    hits = self.search_vector(self.vectors[row], 10, search_filters(categories=("rare.X",)))
+                    self.assertEqual(len(hits), 10)
+                    self.assertTrue(set(hits) <= set(self.ids[mask].tolist()))
+
+    def search_vector(self, vector, top_n, filters):
+        return [hit["paper_id"] for hit in faiss_index.search_similar_papers(vector, top_n, filters)]
+
+
+class ShardServingTests(IndexTestCase):
+    # Two shard servers on unix sockets in this process, answered by the
+    # real handler. Index state is per process, so each connection thread
+    # swaps its shard's index in (one request at a time) before answering.
+
+    TEXTS = [
+        ("cs.LG", 2019, "gradient descent for deep networks"),
+        ("cs.LG", 2021, "deep networks generalization bounds"),
+        ("cs.CV", 2020, "image segmentation with deep networks"),
+        ("cs.CV", 2022, "object detection in images"),
+        ("math.CO", 2018, "graph coloring and planar graphs"),
+        ("math.CO", 2023, "random graphs and percolation"),
+        ("q-bio.BM", 2020, "protein folding with deep networks"),
+        ("q-bio.BM", 2021, "molecular dynamics of proteins"),
+        ("cs.LG math.CO", 2022, "graph neural networks"),
+        ("cs.CV cs.LG", 2023, "self supervised image representations"),
+    ]
+
+    QUERIES = ["deep networks", "graph coloring", "image segmentation", "proteins"]
+
+    def setUp(self):
+        super().setUp()
+        for n, (categories, year, text) in enumerate(self.TEXTS):
+            make_paper(f"3{n:03d}", text, text, categories, year, embedded=True)
+
+        self.build_index()
+        self.expected = self.run_queries()
+
+    def run_queries(self):
+        filters = [None, search_filters(categories=("cs.LG",)), search_filters(year_from=2021)]
+        return [
+            faiss_index.search_similar_papers_batch([embed(text) for text in self.QUERIES], 4, f)
+            for f in filters
+        ]
+
+    def serve_shards(self, strategy, **config):
+        states = {}
+        for number in range(2):
+            faiss_index.set_shard(number, 2, strategy)
+            self.build_index()
+            states[number] = (faiss_index._shard, faiss_index.index, faiss_index.paper_ids, faiss_index._attributes)
+        faiss_index._shard = None
+        self.addCleanup(setattr, faiss_index, "_shard", None)
+        self.assertEqual(sum(len(state[2]) for state in states.values()), len(self.TEXTS))
+
+        local = threading.local()
+        lock = threading.Lock()
+        handle_request = shards.handle_request
+
+        def answer(header, payload):
+            with lock:
+                shard, new_index, ids, attributes = states[local.number]
+                faiss_index._shard = shard
+                faiss_index._set_base(new_index, ids, None, faiss_index._last_change_id, attributes)
+                try:
+                    return handle_request(header, payload)
+                finally:
+                    faiss_index._shard = None
+
+        patcher = mock.patch.object(shards, "handle_request", answer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        addresses = []
+        for number in range(2):
+            class Handler(shards._ShardHandler):
+                shard_number = number
+
+                def handle(self):
+                    local.number = self.shard_number
+                    super().handle()
+
+            path = os.path.join(self.index_dir, f"shard-{number:02d}.sock")
+            server = shards._UnixServer(path, Handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            addresses.append(f"unix:{path}")
+
+        # Shard threads would replay the change log on a database connection
+        # blocked by the test transaction, and there are no changes to replay
+        faiss_index._last_sync = time.monotonic()
+        settings_override = override_settings(FAISS_SYNC_INTERVAL=3600, FAISS_SHARDS={
+            "COUNT": 2, "STRATEGY": strategy, "ADDRESSES": addresses, "ALLOW_PARTIAL": False, **config,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        shards._clients = None
+        self.addCleanup(lambda: [client.close() for client in shards._clients or []])
+        self.addCleanup(setattr, shards, "_clients", None)
+
+    # Same scores, and the same papers above the last score (ties there
+    # can be cut differently)
+    def assertSameHits(self, actual, expected):
+        for actual_rows, expected_rows in zip(actual, expected):
+            for actual_hits, expected_hits in zip(actual_rows, expected_rows):
+                scores = [hit["score"] for hit in expected_hits]
+                np.testing.assert_allclose([hit["score"] for hit in actual_hits], scores, rtol=1e-5)
+
+                above = [hit["paper_id"] for hit in expected_hits if hit["score"] > scores[-1] + 1e-5]
+                self.assertEqual([hit["paper_id"] for hit in actual_hits][:len(above)], above)
+
+    def test_hash_shards_match_a_single_index(self):
+        self.serve_shards("hash")
+
+        self.assertSameHits(self.run_queries(), self.expected)
+        stats = faiss_index.index_stats()["shards"]
+        self.assertEqual(sum(shard["ntotal"] for shard in stats), len(self.TEXTS))
+
+    def test_category_shards_match_a_single_index(self):
+        self.serve_shards("category")
+
+        self.assertSameHits(self.run_queries(), self.expected)
+
+    def test_partial_results_when_a_shard_is_down(self):
+        self.serve_shards("hash", ALLOW_PARTIAL=True)
+        shards.get_shard_clients()[1].address = f"unix:{os.path.join(self.index_dir, 'missing.sock')}"
+
+        with self.assertLogs("paper.utils.shards", "WARNING"):
+            hits = faiss_index.search_similar_papers(embed("deep networks"), 10)
+
+        self.assertTrue(hits)
+        self.assertTrue(all(hit["paper_id"] % 2 == 0 for hit in hits))
+
+
+class SnapshotReloadTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.papers = [
+            make_paper(f"4{n:03d}", text, text, "cs.LG", 2020, embedded=True)
+            for n, text in enumerate([
+                "graph coloring planar graphs", "protein folding molecular dynamics",
+                "image segmentation convolutional networks", "stock market volatility",
+                "quantum error correcting codes", "bayesian optimization of hyperparameters",
+            ])
+        ]
+        faiss_index.save_faiss_snapshot(validate=False)
+        faiss_index.load_faiss_snapshot(mmap=False)
+
+        # Reloads print what they did
+        patcher = mock.patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def snapshot_file(self, version, name):
+        return os.path.join(self.index_dir, f"v{version:06d}", name)
+
+    def point_current_at(self, version):
+        with open(os.path.join(self.index_dir, "CURRENT"), "w") as f:
+            f.write(f"v{version:06d}")
+
+    def assertRejected(self, version):
+        self.assertFalse(faiss_index.reload_faiss_snapshot(mmap=False))
+        self.assertEqual(faiss_index.index_version, 1)
+        self.assertEqual(faiss_index._rejected_version, version)
+        self.assertIn(f"snapshot v{version} rejected", faiss_index._rebuild_status["error"])
+        # Still serving the previous snapshot
+        self.assertEqual(self.search("protein folding")[0], self.papers[1].pk)
+
+    def test_mismatched_id_map_is_rejected(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        ids = np.load(self.snapshot_file(2, "ids.npy"))
+        np.save(self.snapshot_file(2, "ids.npy"), ids[:-1])
+
+        self.assertRejected(2)
+
+    def test_other_dimension_is_rejected(self):
+        new_index = faiss_index.faiss.IndexFlatIP(8)
+        new_index.add(np.eye(8, dtype="float32")[:6])
+        faiss_index._write_snapshot(new_index, faiss_index.paper_ids, 0, keep=3)
+
+        self.assertRejected(2)
+
+    def test_unreadable_snapshot_is_rejected(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        with open(self.snapshot_file(2, "index.faiss"), "r+b") as f:
+            f.truncate(64)
+
+        self.assertRejected(2)
+
+    def test_rejected_snapshot_is_not_retried(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        os.remove(self.snapshot_file(2, "ids.npy"))
+        self.assertRejected(2)
+
+        with override_settings(FAISS_HOT_RELOAD=True), \
+                mock.patch.object(faiss_index, "_read_snapshot") as read, \
+                mock.patch.object(faiss_index, "_reload_in_background") as reload:
+            self.assertFalse(faiss_index.reload_faiss_snapshot(mmap=False))
+            faiss_index.sync_index_changes(force=True)
+
+        read.assert_not_called()
+        reload.assert_not_called()
+
+        # A newer snapshot is tried again
+        faiss_index.save_faiss_snapshot(validate=False)
+        self.assertTrue(faiss_index.reload_faiss_snapshot(mmap=False))
+        self.assertEqual(faiss_index.index_version, 3)
+
+    def test_searches_keep_serving_during_swaps(self):
+        faiss_index.save_faiss_snapshot(validate=False)
+        # Search threads must not replay the change log on connections the
+        # test transaction blocks, only the swaps are under test
+        faiss_index._last_sync = time.monotonic()
+        settings_override = override_settings(FAISS_SYNC_INTERVAL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        stop = threading.Event()
+        failures = []
+        searches = []
+
+        def search():
+            while not stop.is_set():
+                try:
+                    top = self.search("quantum error correcting codes")[0]
+                    if top != self.papers[4].pk:
+                        failures.append(top)
+                    searches.append(top)
+                except Exception as exc:
+                    failures.append(exc)
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for swap in range(20):
+                version = 2 - swap % 2
+                self.point_current_at(version)
+                self.assertTrue(faiss_index.reload_faiss_snapshot(mmap=False))
+                self.assertEqual(faiss_index.index_version, version)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(failures, [])
+        self.assertTrue(searches)
+
+
+class IndexPermissionTests(TestCase):
+
+    def test_index_state_is_staff_only(self):
+        self.assertEqual(self.client.get("/api/index/").status_code, 403)
+
+        staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/api/index/").status_code, 200)
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+
+    def test_papers_found_by_both_rankings_come_first(self):
+        fused = reciprocal_rank_fusion({
+            "semantic": [(1, 0.9), (2, 0.8), (3, 0.7)],
+            "keyword": [(3, 12.0), (4, 9.0)],
+        }, k=60)
+
+        self.assertEqual([item["paper_id"] for item in fused], [3, 1, 2, 4])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 63 + 1 / 61)
+        self.assertEqual(fused[0]["sources"]["keyword"], {"rank": 1, "score": 12.0})
+        self.assertIsNone(fused[1]["sources"]["keyword"])
+
+    def test_only_ranks_matter(self):
+        small = reciprocal_rank_fusion({"semantic": [(1, 0.2), (2, 0.1)], "keyword": [(2, 0.001)]})
+        large = reciprocal_rank_fusion({"semantic": [(1, 900.0), (2, 800.0)], "keyword": [(2, 5e6)]})
+
+        self.assertEqual(
+            [(item["paper_id"], item["score"]) for item in small],
+            [(item["paper_id"], item["score"]) for item in large],
+        )
+
+    def test_annotate_results_keeps_fused_order_and_skips_missing_papers(self):
+        fused = reciprocal_rank_fusion({"semantic": [(1, 0.9), (2, 0.5)], "keyword": [(2, 3.0)]})
+
+        results = annotate_results(fused, {1: {"id": 1}, 2: {"id": 2}})
+        self.assertEqual([(r["id"], r["semantic_score"], r["keyword_score"]) for r in results], [(2, 0.5, 3.0), (1, 0.9, None)])
+
+        self.assertEqual([r["id"] for r in annotate_results(fused, {1: {"id": 1}})], [1])
+
+
+class HybridSearchTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor != "sqlite":
+            raise unittest.SkipTest("Keyword ranking uses the SQLite FTS5 index")
+
+        self.both = make_paper("2001", "Sparse attention", "sparse attention transformers", "cs.LG", 2022, embedded=True)
+        self.semantic = make_paper("2002", "Efficient models", "sparse transformers pruning", "cs.LG", 2021, embedded=True)
+        self.unrelated = make_paper("2003", "Soil", "soil erosion rainfall", "physics.geo-ph", 2020, embedded=True)
+        self.build_index()
+
+    def test_search_fuses_semantic_and_keyword_rankings(self):
+        response = self.client.get("/api/papers/search/", {"q": "sparse attention", "top_n": 3})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(results[0]["id"], self.both.pk)
+        self.assertGreater(results[0]["keyword_score"], 0)
+        self.assertIsNotNone(results[0]["semantic_score"])
+        # Found by FAISS only, BM25 does not match "attention" in its text
+        by_id = {result["id"]: result for result in results}
+        self.assertIn(self.semantic.pk, by_id)
+        self.assertIsNotNone(by_id[self.semantic.pk]["semantic_score"])
+
+    def test_search_requires_a_query(self):
+        self.assertEqual(self.client.get("/api/papers/search/").status_code, 400)
+
+
+def search_filters(categories=(), year_from=None, year_to=None):
+    return {"categories": tuple(categories), "year_from": year_from, "year_to": year_to}
+
+
+class FilterAttributesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.attributes = FilterAttributes.from_rows([
+            ("cs.LG stat.ML", 2019),
+            ("cs.CV", 2021),
+            (None, None),
+            ("cs.LG", 2023),
+        ])
+
+    def test_category_postings(self):
+        self.assertEqual(self.attributes.postings("cs.LG").tolist(), [0, 3])
+        self.assertEqual(self.attributes.postings("math.AG").tolist(), [])
+        self.assertFalse(self.attributes.mask(search_filters(["%"])).any())
+
+    def test_mask_matches_any_category_and_the_year_range(self):
+        mask = self.attributes.mask(search_filters(["stat.ML", "cs.CV"]))
+        self.assertEqual(mask.tolist(), [True, True, False, False])
+
+        mask = self.attributes.mask(search_filters(["cs.LG"], year_from=2020))
+        self.assertEqual(mask.tolist(), [False, False, False, True])
+
+    def test_unknown_years_never_match_a_year_bound(self):
+        self.assertFalse(self.attributes.mask(search_filters(year_to=2030))[2])
+        self.assertFalse(self.attributes.mask(search_filters(year_from=1900))[2])
+
+    def test_extend_and_round_trip(self):
+        extended = self.attributes.extend([("cs.CV cs.LG", 2024)])
+        self.assertEqual(extended.postings("cs.LG").tolist(), [0, 3, 4])
+        self.assertEqual(extended.postings("cs.CV").tolist(), [1, 4])
+
+        path = os.path.join(tempfile.mkdtemp(), FILTERS_FILE)
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        extended.save(path)
+        loaded = FilterAttributes.load(path)
+        self.assertEqual(loaded.names, extended.names)
+        self.assertEqual(loaded.mask(search_filters(["cs.CV"])).tolist(), [False, True, False, False, True])
+
+    def test_parse_search_filters(self):
+        params = QueryDict("categories=cs.LG,cs.CV&categories=cs.LG&year_from=2020")
+        self.assertEqual(parse_search_filters(params), search_filters(["cs.LG", "cs.CV"], year_from=2020))
+        self.assertIsNone(parse_search_filters(QueryDict("")))
+        with self.assertRaises(ValueError):
+            parse_search_filters(QueryDict("year_to=recent"))
+
+
+class FilteredSearchTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = make_paper("3001", "Old nets", "neural networks training", "cs.LG", 2015, embedded=True)
+        self.new = make_paper("3002", "New nets", "neural networks pruning", "cs.LG", 2023, embedded=True)
+        self.vision = make_paper("3003", "Nets for images", "neural networks images", "cs.CV", 2022, embedded=True)
+        self.undated = make_paper("3004", "Undated nets", "neural networks", "cs.LG", None, embedded=True)
+        self.build_index()
+
+    def test_only_matching_papers_are_returned(self):
+        self.assertEqual(set(self.search("neural networks", filters=search_filters(["cs.LG"]))),
+                         {self.old.pk, self.new.pk, self.undated.pk})
+        self.assertEqual(self.search("neural networks", filters=search_filters(["cs.LG"], year_from=2020)), [self.new.pk])
+        self.assertEqual(self.search("neural networks", filters=search_filters(["math.AG"])), [])
+
+    def test_category_filters_match_wildcards_literally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vision.title = "Nets for pictures"
+            self.vision.save()
+
+        for category in ("%", "_", "cs_LG", "cs.%"):
+            with self.subTest(category=category):
+                self.assertEqual(self.search("neural networks", filters=search_filters([category])), [])
+
+    def test_filters_follow_edits_in_the_delta_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old.categories = "cs.CV"
+            self.old.save()
+
+        self.assertEqual(set(self.search("neural networks", filters=search_filters(["cs.CV"]))), {self.old.pk, self.vision.pk})
+        self.assertNotIn(self.old.pk, self.search("neural networks", filters=search_filters(["cs.LG"])))
+
+    def test_search_endpoint_reads_filters_from_the_query(self):
+        response = self.client.get("/api/papers/search/", {"q": "neural networks", "categories": "cs.CV"})
+        self.assertEqual([result["id"] for result in response.json()["results"]], [self.vision.pk])
+
+        response = self.client.get("/api/papers/search/", {"q": "neural networks", "year_from": "soon"})
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        years = [2020, None, 2018, 2020, None, 2022, 2018, None, 2019]
+        self.papers = [
+            make_paper(f"40{i:02d}", f"Paper {i}", "abstract", "cs.LG", year)
+            for i, year in enumerate(years)
+        ]
+
+    def walk(self, params):
+        pages = []
+        url, query = "/api/papers/", params
+        while url:
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append(([paper["id"] for paper in body["results"]], body["previous"]))
+            url, query = body["next"], None
+        return pages
+
+    def expected(self, descending):
+        dated = sorted((p for p in self.papers if p.publication_year is not None),
+                       key=lambda p: (p.publication_year, p.pk), reverse=descending)
+        undated = sorted((p.pk for p in self.papers if p.publication_year is None), reverse=descending)
+        return [p.pk for p in dated] + undated
+
+    def test_pages_cover_every_paper_once_with_nulls_last(self):
+        for ordering, descending in (("-publication_year", True), ("publication_year", False)):
+            pages = self.walk({"ordering": ordering, "page_size": 2})
+            self.assertEqual([pk for ids, _ in pages for pk in ids], self.expected(descending))
+            self.assertEqual(len(pages), 5)
+
+    def test_previous_links_walk_back_through_the_same_pages(self):
+        pages = self.walk({"ordering": "-publication_year", "page_size": 2})
+
+        previous = pages[-1][1]
+        for ids, _ in reversed(pages[:-1]):
+            body = self.client.get(previous).json()
+            self.assertEqual([paper["id"] for paper in body["results"]], ids)
+            previous = body["previous"]
+        self.assertIsNone(previous)
+
+    def test_default_ordering_is_newest_first(self):
+        ids = [pk for page, _ in self.walk({"page_size": 4}) for pk in page]
+        self.assertEqual(ids, [p.pk for p in sorted(self.papers, key=lambda p: (p.created_at, p.pk), reverse=True)])
+
+    def test_page_numbers_and_bad_cursors(self):
+        body = self.client.get("/api/papers/", {"page": 1}).json()
+        self.assertEqual(body["count"], len(self.papers))
+        self.assertEqual(self.client.get("/api/papers/", {"cursor": "not-a-cursor"}).status_code, 404)
+
+
+class CategoryRollupTests(TestCase):
+
+    def rollups(self):
+        return set(CategoryYearCount.objects.values_list("category__name", "year", "count"))
+
+    def test_saves_and_deletes_apply_deltas(self):
+        first = make_paper("5001", "A", "a", "cs.LG stat.ML", 2020)
+        make_paper("5002", "B", "b", "cs.LG", 2020)
+        make_paper("5003", "C", "c", "cs.LG", None)
+        self.assertEqual(self.rollups(), {("cs.LG", 2020, 2), ("stat.ML", 2020, 1)})
+
+        first.categories = "cs.CV stat.ML"
+        first.publication_year = 2021
+        first.save()
+        self.assertEqual(self.rollups(), {("cs.LG", 2020, 1), ("cs.CV", 2021, 1), ("stat.ML", 2021, 1)})
+        self.assertEqual(
+            set(first.category_links.values_list("category__name", "publication_year")),
+            {("cs.CV", 2021), ("stat.ML", 2021)},
+        )
+
+        first.delete()
+        self.assertEqual(self.rollups(), {("cs.LG", 2020, 1)})
+
+    def test_saving_unrelated_fields_leaves_the_rollups_alone(self):
+        paper = make_paper("5001", "A", "a", "cs.LG", 2020)
+        paper.title = "Renamed"
+        paper.save(update_fields=["title"])
+        paper.save()
+
+        self.assertEqual(self.rollups(), {("cs.LG", 2020, 1)})
+
+    def test_rebuild_picks_up_writes_that_skipped_signals(self):
+        make_paper("5001", "A", "a", "cs.LG stat.ML", 2020)
+        make_paper("5002", "B", "b", "cs.LG", 2021)
+        Paper.objects.filter(paper_id="5002").update(categories="cs.CV")
+
+        stats = rebuild_category_index(batch_size=1)
+
+        self.assertEqual(stats["papers"], 2)
+        self.assertEqual(self.rollups(), {("cs.LG", 2020, 1), ("stat.ML", 2020, 1), ("cs.CV", 2021, 1)})
+
+    def test_trends_endpoint_reads_the_rollups(self):
+        make_paper("5001", "A", "a", "cs.LG", 2020)
+        make_paper("5002", "B", "b", "cs.LG", 2021)
+        make_paper("5003", "C", "c", "cs.CV", 2021)
+
+        trends = self.client.get("/api/papers/trends/", {"top_n": 1}).json()["trends"]
+        self.assertEqual(trends, {"cs.LG": {"2020": 1, "2021": 1}})
+
+
+class BoundedExecutorTests(SimpleTestCase):
+
+    def test_submissions_beyond_workers_and_queue_are_rejected(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        running = executor.submit(release.wait, 5)
+        queued = executor.submit(lambda: "done")
+        with self.assertRaises(ExecutorFull):
+            executor.submit(lambda: "rejected")
+
+        release.set()
+        self.assertTrue(running.result(timeout=5))
+        self.assertEqual(queued.result(timeout=5), "done")
+
+        # Capacity is back once the tasks finished
+        self.assertEqual(executor.submit(lambda: 1).result(timeout=5), 1)
+        stats = executor.stats()
+        self.assertEqual((stats["rejected"], stats["completed"], stats["queue_depth"]), (1, 3, 0))
+
+    def test_failures_are_counted_and_raised(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=0)
+
+        with self.assertRaises(ZeroDivisionError):
+            executor.submit(lambda: 1 / 0).result(timeout=5)
+        self.assertEqual(executor.stats()["failed"], 1)
+
+    def test_async_views_answer_503_when_the_executor_is_full(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        executor.submit(release.wait, 5)
+
+        with mock.patch("paper.async_views.get_executor", return_value=executor), \
+                mock.patch("paper.async_views.keyword_search", return_value=[]):
+            response = self.client.get("/api/async/papers/search/", {"q": "graphs"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(executor.stats()["rejected"], 1)
+
+
+    def test_async_search_runs_both_searches_on_the_executor(self):
+        executor = BoundedExecutor(max_workers=2, max_queue=0)
+        threads = []
+
+        def keyword_search(text, limit, filters):
+            threads.append(threading.current_thread().name)
+            return []
+
+        with mock.patch("paper.async_views.get_executor", return_value=executor), \
+                mock.patch("paper.async_views.keyword_search", keyword_search), \
+                mock.patch("paper.async_views.generate_embedding", return_value=np.zeros(4, dtype="float32")), \
+                mock.patch("paper.async_views.search_similar_papers", return_value=[]):
+            response = self.client.get("/api/async/papers/search/", {"q": "graphs"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(threads[0].startswith("papyrus-executor"))
+        self.assertEqual(executor.stats()["completed"], 2)
+        stages = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        self.assertEqual(sorted(stages), ["encode", "faiss", "fuse", "hydrate", "keyword", "total"])
+
+
+class ArxivIngestTests(TestCase):
+
+    def write_dump(self, records):
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as f:
+            for record in records:
+                f.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+        return path
+
+    def test_bounded_imap_keeps_order_and_reads_ahead_at_most_a_window(self):
+        read = []
+
+        def items():
+            for number in range(20):
+                read.append(number)
+                yield number
+
+        with ThreadPool(2) as pool:
+            results = bounded_imap(pool, lambda n: n * n, items(), 4)
+            self.assertEqual(next(results), 0)
+            self.assertEqual(len(read), 4)
+            self.assertEqual(list(results), [n * n for n in range(1, 20)])
+
+    def test_bulk_ingest_with_workers(self):
+        records = [
+            {"paper_id": f"2401.{n:05d}", "title": f"Paper {n}", "abstract": "An abstract.", "categories": "cs.LG"}
+            for n in range(7)
+        ]
+        path = self.write_dump(records + [records[0], "not json", {"paper_id": "x", "title": "No abstract"}])
+
+        out = io.StringIO()
+        call_command("ingest_arxiv", path, bulk=True, batch_size=2, workers=2, stdout=out)
+
+        self.assertEqual(
+            sorted(Paper.objects.values_list("paper_id", flat=True)), [record["paper_id"] for record in records]
+        )
+        self.assertIn("Total inserted: 7", out.getvalue())
+        self.assertIn("Total skipped: 3", out.getvalue())
+
+
+class BatchingEncoderTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    # Row i of a batch is [len(text), i], so callers can check they got their own text
+    def encode_batch(self, texts):
+        self.calls.append(list(texts))
+        return np.asarray([[len(text), row] for row, text in enumerate(texts)], dtype="float32")
+
+    def encode_concurrently(self, encoder, texts):
+        results = [None] * len(texts)
+
+        def run(slot):
+            try:
+                results[slot] = encoder.encode(texts[slot], timeout=10)
+            except Exception as exc:
+                results[slot] = exc
+
+        threads = [threading.Thread(target=run, args=(slot,)) for slot in range(len(texts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_model_call(self):
+        # A full batch is flushed at once, long before the wait runs out
+        encoder = BatchingEncoder(self.encode_batch, max_batch_size=8, max_wait_ms=10000)
+        texts = ["x" * length for length in range(1, 9)]
+
+        results = self.encode_concurrently(encoder, texts)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(self.calls[0]), texts)
+        self.assertEqual(encoder.stats()["largest_batch"], 8)
+        for text, vector in zip(texts, results):
+            # Each caller gets the row of its own text
+            self.assertEqual(vector[0], len(text))
+            self.assertEqual(self.calls[0][int(vector[1])], text)
+
+    def test_partial_batch_is_flushed_after_the_wait(self):
+        encoder = BatchingEncoder(self.encode_batch, max_batch_size=32, max_wait_ms=1)
+
+        self.assertEqual(encoder.encode("abc", timeout=10)[0], 3)
+        self.assertEqual(self.calls, [["abc"]])
+
+    def test_model_errors_reach_every_waiter(self):
+        def fail(texts):
+            self.calls.append(list(texts))
+            raise ValueError("model failed")
+
+        encoder = BatchingEncoder(fail, max_batch_size=4, max_wait_ms=10000)
+
+        results = self.encode_concurrently(encoder, ["a", "bb", "ccc", "dddd"])
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+        # The worker thread survives and serves the next batch
+        encoder.encode_batch = self.encode_batch
+        encoder.max_wait = 0.001
+        self.assertEqual(encoder.encode("ee", timeout=10)[0], 2)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+
+    def test_hit_and_miss(self):
+        cache = EmbeddingCache(max_size=10)
+        key = cache.key("model", "Graph  Neural\tNetworks")
+
+        self.assertIsNone(cache.get(key))
+        cache.set(key, [1.0, 2.0])
+
+        # Whitespace and case do not split entries
+        np.testing.assert_array_equal(cache.get(cache.key("model", "graph neural networks")), [1.0, 2.0])
+        self.assertNotEqual(cache.key("other-model", "graph neural networks"), key)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = EmbeddingCache(max_size=2)
+        cache.set("a", [1.0])
+        cache.set("b", [2.0])
+        cache.get("a")
+        cache.set("c", [3.0])
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_entries_expire(self):
+        cache = EmbeddingCache(ttl=60)
+        with mock.patch("paper.utils.embedding_cache.time.monotonic", return_value=1000.0):
+            cache.set("a", [1.0])
+        with mock.patch("paper.utils.embedding_cache.time.monotonic", return_value=1059.0):
+            self.assertIsNotNone(cache.get("a"))
+        with mock.patch("paper.utils.embedding_cache.time.monotonic", return_value=1061.0):
+            self.assertIsNone(cache.get("a"))
+
+    def test_shared_backend_serves_other_workers(self):
+        shared = LocMemCache("embedding-tests", {})
+        self.addCleanup(shared.clear)
+        EmbeddingCache(shared=shared).set("a", [1.0, 2.0])
+
+        other = EmbeddingCache(shared=shared)
+        np.testing.assert_array_equal(other.get("a"), [1.0, 2.0])
+        self.assertEqual(other.stats()["shared_hits"], 1)
+        # Then served from its own LRU
+        other.get("a")
+        self.assertEqual(other.stats()["hits"], 1)
+
+    @override_settings(EMBEDDING_CACHE={"BACKEND": "local"}, ENCODER_BATCHING={"ENABLED": False})
+    def test_repeated_texts_skip_the_model(self):
+        model = mock.Mock(wraps=FakeEncoder())
+        with mock.patch.dict(encoders._models, {model_config()["BACKEND"]: model}), \
+                mock.patch.object(embedding_cache, "_cache", None):
+            first = generate_embedding("deep networks")
+            second = generate_embedding("  Deep networks ")
+            matrix = generate_embeddings(["deep networks", "graph coloring"])
+
+        np.testing.assert_array_equal(first, second)
+        np.testing.assert_array_equal(matrix[0], first)
+        # One call for the first query, one for the uncached half of the batch
+        self.assertEqual(model.encode.call_count, 2)
+        self.assertEqual(model.encode.call_args.args[0], ["graph coloring"])
+
+
+class PaperPayloadCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = PaperPayloadCache(max_size=2)
+        cache.set_many({1: {"id": 1}, 2: {"id": 2}})
+        cache.get_many([1])
+        cache.set_many({3: {"id": 3}})
+
+        self.assertEqual(sorted(cache.get_many([1, 2, 3])), [1, 3])
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_entries_expire(self):
+        cache = PaperPayloadCache(ttl=60)
+        with mock.patch("paper.utils.hydration.time.monotonic", return_value=1000.0):
+            cache.set_many({1: {"id": 1}})
+        with mock.patch("paper.utils.hydration.time.monotonic", return_value=1061.0):
+            self.assertEqual(cache.get_many([1]), {})
+
+
+class HydrationTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(hydration, "_cache", PaperPayloadCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.graphs = make_paper("5001", "Graphs", "graph coloring", "math.CO", 2020, embedded=True)
+        self.proteins = make_paper("5002", "Proteins", "protein folding", "q-bio.BM", 2021, embedded=True)
+        self.build_index()
+
+    def titles(self, pks):
+        return [payload["title"] for payload in hydrate_papers(pks)]
+
+    def test_cached_payloads_skip_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.titles([self.proteins.pk, self.graphs.pk]), ["Proteins", "Graphs"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles([self.graphs.pk, self.proteins.pk]), ["Graphs", "Proteins"])
+        # Callers may extend payloads without touching the cached ones
+        hydrate_papers([self.graphs.pk])[0]["score"] = 1.0
+        self.assertNotIn("score", hydrate_papers([self.graphs.pk])[0])
+
+    def test_saving_a_paper_evicts_its_payload(self):
+        self.titles([self.graphs.pk, self.proteins.pk])
+
+        self.graphs.title = "Graph colourings"
+        self.graphs.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.titles([self.graphs.pk, self.proteins.pk]), ["Graph colourings", "Proteins"])
+
+    def test_deleted_papers_are_dropped(self):
+        self.titles([self.graphs.pk, self.proteins.pk])
+
+        self.proteins.delete()
+
+        self.assertEqual(self.titles([self.graphs.pk, self.proteins.pk]), ["Graphs"])
+
+    def test_change_log_replay_evicts_edits_of_other_processes(self):
+        self.titles([self.graphs.pk])
+
+        # Another worker: no signal in this process, only the change log
+        Paper.objects.filter(pk=self.graphs.pk).update(title="Edited elsewhere")
+        faiss_index.record_index_changes(upsert_ids=[self.graphs.pk])
+        faiss_index._replay_changes()
+
+        self.assertEqual(self.titles([self.graphs.pk]), ["Edited elsewhere"])
+
+
+class RecommendBatchTests(IndexTestCase):
+
+    URL = "/api/user-uploads/recommend-batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.papers = [
+            make_paper(f"6{n:03d}", text, text, "cs.LG", 2020, embedded=True)
+            for n, text in enumerate([
+                "graph coloring planar graphs", "protein folding molecular dynamics",
+                "image segmentation convolutional networks", "stock market volatility",
+                "quantum error correcting codes",
+            ])
+        ]
+        self.build_index()
+
+        self.search = mock.patch.object(
+            recommend, "search_similar_papers_batch", wraps=faiss_index.search_similar_papers_batch
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def post(self, body, **headers):
+        return self.client.post(self.URL, body, content_type="application/json", headers=headers)
+
+    def uploads(self):
+        return [{"abstract": paper.abstract, "title": f"Upload {n}"} for n, paper in enumerate(self.papers)]
+
+    @override_settings(RECOMMEND_BATCH_CHUNK_SIZE=2)
+    def test_stream_sends_one_line_per_upload(self):
+        response = self.post({"uploads": self.uploads(), "top_n": 3}, Accept="application/x-ndjson")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2, 3, 4])
+        for line, paper in zip(lines, self.papers):
+            self.assertEqual(line["results"][0]["id"], paper.pk)
+            self.assertLessEqual(len(line["results"]), 3)
+        self.assertEqual(
+            sorted(str(upload) for upload in UserUpload.objects.values_list("upload_id", flat=True)),
+            sorted(line["user_upload_id"] for line in lines),
+        )
+        # One FAISS matrix search per chunk of two uploads
+        self.assertEqual(self.search.call_count, 3)
+        self.assertEqual([len(call.args[0]) for call in self.search.call_args_list], [2, 2, 1])
+
+    def test_batch_searches_once(self):
+        response = self.post({"abstracts": [paper.abstract for paper in self.papers]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 5)
+        self.assertEqual(self.search.call_count, 1)
+
+    @override_settings(RECOMMEND_BATCH_MAX_SIZE=4)
+    def test_size_limit(self):
+        response = self.post({"uploads": self.uploads()})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 4", response.json()["error"])
+        self.assertFalse(UserUpload.objects.exists())
+        self.search.assert_not_called()
+
+    def test_uploads_without_abstract_are_rejected(self):
+        response = self.post({"uploads": [{"abstract": "graphs"}, {"title": "no abstract"}, {"abstract": " "}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["invalid"], [1, 2])
+
+    def test_errors_are_one_line_for_ndjson_clients(self):
+        response = self.post({"uploads": []}, Accept="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertIn("error", json.loads(response.content.decode()))
+
+
+class InterruptedEncoder(FakeEncoder):
+    # Fails its `fail_on`th call, like a run killed halfway through
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, **kwargs):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("interrupted")
+        return super().encode(texts)
+
+
+# Runs the stages of run_pipeline one batch at a time in this thread: the
+# in-memory test database locks whole tables across connections, so the
+# validate stage could not read while the write stage commits
+def run_inline(source, stages, queue_size=2):
+    for item in source:
+        for stage in stages:
+            item = stage(item)
+
+
+class ResumeTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.checkpoint = os.path.join(self.root, "checkpoint.json")
+
+        settings_override = override_settings(
+            FAISS_INDEX_DIR=os.path.join(self.root, "indexes"),
+            FAISS_INDEX={"TYPE": "flat"},
+            FAISS_SHARDS={"COUNT": 0},
+            FAISS_SYNC_INTERVAL=0,
+            FAISS_HOT_RELOAD=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        faiss_index._set_base(None, np.empty(0, dtype="int64"), None, 0)
+        self.addCleanup(faiss_index._set_base, None, np.empty(0, dtype="int64"), None, 0)
+
+    def run_command(self, name, *args, fail_on=None, **options):
+        encoder = InterruptedEncoder(fail_on)
+        out = io.StringIO()
+        with mock.patch.dict(encoders._models, {model_config()["BACKEND"]: encoder}), \
+                mock.patch(f"paper.management.commands.{name}.run_pipeline", run_inline):
+            call_command(name, *args, checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def assertLoggedOnce(self, pks):
+        logged = list(PaperIndexChange.objects.filter(op=PaperIndexChange.UPSERT).values_list("paper_pk", flat=True))
+        self.assertEqual(sorted(logged), sorted(pks))
+
+    def test_generate_embeddings_resumes_after_the_last_batch(self):
+        papers = [make_paper(f"7{n:03d}", f"Paper {n}", f"abstract number {n}") for n in range(7)]
+
+        with self.assertRaisesMessage(RuntimeError, "interrupted"):
+            self.run_command("generate_embeddings", batch_size=2, fail_on=2)
+
+        first_batch = [paper.pk for paper in papers[:2]]
+        self.assertEqual(
+            list(Paper.objects.filter(embedding__isnull=False).values_list("id", flat=True)), first_batch
+        )
+
+        out = self.run_command("generate_embeddings", batch_size=2)
+
+        self.assertIn(f"Resuming after paper id {first_batch[-1]}", out)
+        self.assertFalse(Paper.objects.filter(embedding__isnull=True).exists())
+        self.assertLoggedOnce(paper.pk for paper in papers)
+        for paper in Paper.objects.all():
+            np.testing.assert_array_equal(from_bytes(paper.embedding), embed(paper.abstract))
+
+    def test_ingest_and_embed_resumes_without_duplicates_or_gaps(self):
+        path = os.path.join(self.root, "dump.jsonl")
+        with open(path, "w") as f:
+            for n in range(7):
+                f.write(json.dumps({
+                    "paper_id": f"2402.{n:05d}", "title": f"Paper {n}", "abstract": f"abstract number {n}",
+                    "categories": "cs.LG", "publication_year": 2024,
+                }) + "\n")
+
+        with self.assertRaisesMessage(RuntimeError, "interrupted"):
+            self.run_command("ingest_and_embed", path, batch_size=2, snapshot_every=1, fail_on=2)
+        self.assertEqual(Paper.objects.count(), 2)
+
+        out = self.run_command("ingest_and_embed", path, batch_size=2, snapshot_every=1)
+
+        self.assertIn("Resuming from byte offset", out)
+        self.assertIn("Total inserted: 5", out)
+        pks = sorted(Paper.objects.values_list("id", flat=True))
+        self.assertEqual(
+            sorted(Paper.objects.values_list("paper_id", flat=True)), [f"2402.{n:05d}" for n in range(7)]
+        )
+        self.assertLoggedOnce(pks)
+
+        # The appended snapshot holds every paper once and needs no replay
+        self.assertTrue(faiss_index.load_faiss_snapshot(mmap=False))
+        self.assertEqual(faiss_index.paper_ids.tolist(), pks)
+        faiss_index.sync_index_changes(force=True)
+        self.assertEqual(faiss_index.index_stats()["delta"], 0)
+
+    def test_new_papers_join_the_existing_topics(self):
+        graphs = make_paper("7101", "Graphs", "graph coloring planar graphs", "math.CO", 2020)
+        proteins = make_paper("7102", "Proteins", "protein folding molecular dynamics", "q-bio.BM", 2021)
+        Topic.objects.create(number=0, centroid=to_bytes(embed(graphs.abstract)))
+        Topic.objects.create(number=1, centroid=to_bytes(embed(proteins.abstract)))
+
+        out = self.run_command("generate_embeddings")
+
+        self.assertIn("2 papers assigned to topics", out)
+        self.assertEqual(
+            dict(PaperTopic.objects.values_list("paper_id", "topic__number")), {graphs.pk: 0, proteins.pk: 1}
+        )
+        self.assertEqual(list(Topic.objects.order_by("number").values_list("size", "label")),
+                         [(1, "math.CO"), (1, "q-bio.BM")])
+
+    def test_topics_can_be_left_for_build_topics(self):
+        make_paper("7101", "Graphs", "graph coloring planar graphs", "math.CO", 2020)
+        Topic.objects.create(number=0, centroid=to_bytes(embed("graph coloring")))
+
+        out = self.run_command("generate_embeddings", skip_topics=True)
+
+        self.assertNotIn("assigned to topics", out)
+        self.assertFalse(PaperTopic.objects.exists())
+
+        out = io.StringIO()
+        call_command("build_topics", assign_new=True, stdout=out)
+        self.assertIn("1 papers assigned", out.getvalue())
+        self.assertEqual(PaperTopic.objects.count(), 1)
+
+
+class RequestMetricsTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        make_paper("8001", "Graph coloring", "graph coloring planar graphs", "math.CO", 2020, embedded=True)
+        self.build_index()
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_metrics_do_not_exist_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_metrics_are_open_in_debug(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_need_the_bearer_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("papyrus_index_vectors 1", response.content.decode())
+
+    def test_search_reports_its_stages_in_server_timing(self):
+        response = self.client.get("/api/papers/search/", {"q": "graph coloring"})
+
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["encode", "faiss", "keyword", "fuse", "hydrate", "serialize", "total"])
+
+        # Recorded for /metrics as well
+        with override_settings(DEBUG=True):
+            text = self.client.get("/metrics").content.decode()
+        self.assertIn('view="paper-search",stage="faiss"', text)
+
+    def test_unnamed_views_get_no_header(self):
+        response = self.client.get("/api/papers/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(REQUEST_TIMING={"ENABLED": True, "LOG": True, "LOG_SLOWER_THAN_MS": 0})
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs("papyrus.timing", "INFO") as logs:
+            self.client.get("/api/papers/search/", {"q": "graph coloring"})
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry["event"], entry["view"], entry["status"]), ("request_timing", "paper-search", 200))
+        self.assertIn("faiss", entry["stages_ms"])
+
+
+class RequestProfilingTests(IndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+
+        settings_override = override_settings(MEDIA_ROOT=media_root, REQUEST_PROFILING={
+            "ENABLED": True, "TOKEN": "profile-secret", "SAMPLE_RATE": 0.0, "KEEP": 2,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        make_paper("9001", "Graph coloring", "graph coloring planar graphs", "math.CO", 2020, embedded=True)
+        self.build_index()
+
+        self.staff = User.objects.create_user("staff", password="secret", is_staff=True)
+
+    def search(self, **headers):
+        return self.client.get("/api/papers/search/", {"q": "graph coloring"}, headers=headers)
+
+    def test_requests_without_the_header_are_not_profiled(self):
+        self.assertNotIn("X-Profile-Id", self.search())
+        self.assertNotIn("X-Profile-Id", self.search(X_Profile="wrong"))
+        self.assertEqual(list_profiles(), [])
+
+    def test_profiled_request_saves_its_artifacts(self):
+        response = self.search(X_Profile="profile-secret")
+
+        self.assertEqual(response.status_code, 200)
+        name = response["X-Profile-Id"]
+        self.assertEqual(list_profiles(), [name])
+
+        with open(profile_path(name)) as f:
+            summary = json.load(f)
+        self.assertEqual((summary["view"], summary["status"]), ("PaperViewSet.search", 200))
+        self.assertGreater(summary["query_count"], 0)
+        self.assertTrue(any("paper_paper" in query["sql"] for query in summary["queries"]))
+        self.assertIn("search_similar_papers", summary["top_functions"])
+        self.assertIsNotNone(profile_path(name, "prof"))
+
+    def test_only_the_newest_profiles_are_kept(self):
+        names = [self.search(X_Profile="profile-secret")["X-Profile-Id"] for _ in range(3)]
+
+        self.assertEqual(sorted(list_profiles()), sorted(names[1:]))
+
+    def test_staff_users_profile_without_a_token(self):
+        with override_settings(REQUEST_PROFILING={"ENABLED": True, "TOKEN": None}):
+            self.client.force_login(self.staff)
+            self.assertIn("X-Profile-Id", self.search(X_Profile="1"))
+            self.client.logout()
+            self.assertNotIn("X-Profile-Id", self.search(X_Profile="1"))
+
+    def test_busy_slots_run_the_request_normally(self):
+        with mock.patch("paper.middleware.acquire_slot", return_value=False):
+            response = self.search(X_Profile="profile-secret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_profiles_are_served_to_staff(self):
+        name = self.search(X_Profile="profile-secret")["X-Profile-Id"]
+
+        self.assertEqual(self.client.get("/api/profiles/").status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.assertEqual([item["name"] for item in self.client.get("/api/profiles/").json()], [name])
+        self.assertEqual(self.client.get(f"/api/profiles/{name}/").json()["view"], "PaperViewSet.search")
+        download = self.client.get(f"/api/profiles/{name}/download/")
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b"".join(download.streaming_content))
+        self.assertEqual(self.client.get("/api/profiles/../../settings/").status_code, 404)
@@ -0,0 +1,101 @@
+import bz2
+import gzip
+import io
+import json
+
+
+# Open a JSONL dump for binary line reading, decompressing .gz / .bz2 / .zst
+# transparently. Seeking in a compressed stream works but has to decompress
+# everything before the target offset.
+def open_input(file_path):
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+
+    if file_path.endswith(".bz2"):
+        return bz2.open(file_path, "rb")
+
+    if file_path.endswith(".zst"):
+        try:
+            import zstandard # type: ignore
+        except ImportError as e:
+            raise RuntimeError("Reading .zst files needs `pip install zstandard`") from e
+
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+        return io.BufferedReader(reader)
+
+    return open(file_path, "rb")
+
+
+# Iterate (line, end_offset) pairs starting at `offset` (in uncompressed bytes)
+def read_lines(file_path, offset=0):
+    with open_input(file_path) as file:
+        if offset and file.seekable():
+            file.seek(offset)
+        elif offset:
+            # Streams without seek support (zstd): read up to the offset
+            remaining = offset
+            while remaining:
+                skipped = len(file.read(min(remaining, 1 << 20)))
+                if not skipped:
+                    break
+                remaining -= skipped
+
+        for line in file:
+            offset += len(line)
+            yield line, offset
+
+
+# Validate one JSON line into Paper field values, None when it must be skipped
+def parse_record(line):
+    try:
+        data = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    paper_id = data.get("paper_id")
+    title = (data.get("title") or "").strip()
+    authors = (data.get("authors") or "").strip()
+    abstract = (data.get("abstract") or "").strip()
+
+    # Essential fields check
+    if not paper_id or not title or not abstract:
+        return None
+
+    return {
+        "paper_id": str(paper_id),
+        "title": title,
+        "authors": authors,
+        "abstract": abstract,
+        "categories": data.get("categories"),
+        "journal_ref": data.get("journal_ref"),
+        "doi": data.get("doi"),
+        "publication_year": data.get("publication_year"),
+    }
+
+
+# Parse a chunk of raw lines (runs in worker processes for --workers)
+def parse_chunk(chunk):
+    lines, end_offset = chunk
+    records = []
+    for line in lines:
+        record = parse_record(line)
+        if record is not None:
+            records.append(record)
+    return records, len(lines) - len(records), end_offset
+
+
+# Group lines into chunks of `size`, each tagged with the offset after its last line
+def chunk_lines(lines, size):
+    chunk = []
+    end_offset = 0
+    for line, end_offset in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk, end_offset
+            chunk = []
+    if chunk:
+        yield chunk, end_offset
+
@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchingEncoder:
+    # Collects concurrent single-text encode calls for up to `max_wait_ms`
+    # (or until `max_batch_size` texts are queued), runs one batched forward
+    # pass and hands every caller its own row. `encode_batch` takes a list of
+    # strings and returns an (n, dim) array.
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def encode(self, text, timeout=None):
+        future = Future()
+        self._ensure_worker().put((text, future))
+        return future.result(timeout)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    # Start the worker thread lazily, and again after a fork (gunicorn
+    # workers inherit the object but not the thread)
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._queue
+
+        with self._lock:
+            if self._pid != pid:
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name="batching-encoder", daemon=True
+                )
+                self._thread.start()
+                self._pid = pid
+
+        return self._queue
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = np.asarray(self.encode_batch(texts), dtype="float32")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
@@ -0,0 +1,178 @@
+import platform
+import time
+
+import faiss # type: ignore
+import numpy as np
+
+from paper.utils.index_factory import (
+    create_index, index_config, is_compressed, search_parameters, train_index,
+)
+
+
+# Synthetic, normalized corpus. "clustered" draws points around random
+# centres, which behaves much more like real embeddings than uniform noise.
+def make_corpus(size, dim, distribution="clustered", clusters=100, seed=0):
+    rng = np.random.default_rng(seed)
+
+    if distribution == "clustered":
+        centres = rng.standard_normal((clusters, dim)).astype("float32")
+        labels = rng.integers(0, clusters, size)
+        vectors = centres[labels] + 0.3 * rng.standard_normal((size, dim)).astype("float32")
+    elif distribution == "random":
+        vectors = rng.standard_normal((size, dim)).astype("float32")
+    else:
+        raise ValueError(f"Unknown distribution: {distribution}")
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+# Queries are perturbed corpus points, so every query has true neighbours
+def make_queries(corpus, count, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(corpus), count, replace=len(corpus) < count)
+
+    queries = corpus[picks] + 0.05 * rng.standard_normal((count, corpus.shape[1])).astype("float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+# Exact top-k by brute force, used as ground truth for recall
+def exact_neighbours(corpus, queries, k):
+    ground_truth = faiss.IndexFlatIP(corpus.shape[1])
+    ground_truth.add(corpus)
+    _, indices = ground_truth.search(queries, k)
+    return indices
+
+
+def recall_at_k(found, expected):
+    hits = 0
+    for row_found, row_expected in zip(found, expected):
+        hits += len(set(row_found[row_found >= 0]) & set(row_expected))
+    return hits / expected.size
+
+
+def _latency_stats(timings, batch_seconds, batch_size):
+    timings_ms = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "mean_ms": float(timings_ms.mean()),
+        "qps": float(len(timings) / np.sum(timings)),
+        "batch_qps": float(batch_size / batch_seconds) if batch_seconds else None,
+    }
+
+
+# Legacy path from paper/utils/legacy.py: sklearn cosine similarity over every row
+def run_sklearn(corpus, queries, k):
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    found = np.empty((len(queries), k), dtype="int64")
+    timings = []
+
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        scores = cosine_similarity(query.reshape(1, -1), corpus)[0]
+        found[i] = np.argsort(scores)[::-1][:k]
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scores = cosine_similarity(queries, corpus)
+    _ = np.argsort(scores, axis=1)[:, ::-1][:, :k]
+    batch_seconds = time.perf_counter() - start
+
+    stats = _latency_stats(timings, batch_seconds, len(queries))
+    stats.update({"build_seconds": 0.0, "index_bytes": int(corpus.nbytes)})
+    return stats, found
+
+
+# FAISS path: build the index the same way faiss_index.py does, then time
+# single-query searches (API-like) and one batched search (throughput)
+def run_faiss(corpus, queries, k, overrides=None):
+    # The benchmark asks for a specific type, never fall back to flat
+    config = index_config({"MIN_TRAIN_SIZE": 0, **(overrides or {})})
+
+    start = time.perf_counter()
+    bench_index = create_index(corpus.shape[1], len(corpus), config)
+    train_index(bench_index, corpus, config)
+    bench_index.add(corpus)
+    build_seconds = time.perf_counter() - start
+
+    params = search_parameters(bench_index, config=config)
+
+    # Compressed indexes can re-rank extra candidates against the exact
+    # vectors, like the serving path does with RESCORE
+    rescore = config["RESCORE"] and is_compressed(bench_index)
+    fetch = k * config["RESCORE_FACTOR"] if rescore else k
+
+    def search(batch):
+        _, indices = bench_index.search(batch, fetch, params=params)
+        if not rescore:
+            return indices
+        exact = np.einsum("qkd,qd->qk", corpus[np.maximum(indices, 0)], batch)
+        exact[indices < 0] = -np.inf
+        order = np.argsort(-exact, axis=1)[:, :k]
+        return np.take_along_axis(indices, order, axis=1)
+
+    found = np.empty((len(queries), k), dtype="int64")
+    timings = []
+
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        indices = search(queries[i:i + 1])
+        timings.append(time.perf_counter() - start)
+        found[i] = indices[0]
+
+    start = time.perf_counter()
+    search(queries)
+    batch_seconds = time.perf_counter() - start
+
+    stats = _latency_stats(timings, batch_seconds, len(queries))
+    stats.update({
+        "build_seconds": build_seconds,
+        "index_bytes": int(faiss.serialize_index(bench_index).nbytes),
+    })
+    return stats, found
+
+
+# Run every backend against one synthetic corpus and return a JSON-able report
+def run_benchmark(backends, size, dim, queries=1000, k=10, distribution="clustered",
+                  clusters=100, seed=0, overrides=None):
+    corpus = make_corpus(size, dim, distribution, clusters, seed)
+    query_vectors = make_queries(corpus, queries, seed + 1)
+    expected = exact_neighbours(corpus, query_vectors, k)
+
+    results = []
+    for backend in backends:
+        if backend == "sklearn":
+            stats, found = run_sklearn(corpus, query_vectors, k)
+        else:
+            stats, found = run_faiss(corpus, query_vectors, k, {"TYPE": backend, **(overrides or {})})
+
+        stats["backend"] = backend
+        stats["recall_at_k"] = recall_at_k(found, expected)
+        results.append(stats)
+
+    return {
+        "created_at": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "numpy": np.__version__,
+            "faiss": faiss.__version__,
+            "threads": faiss.omp_get_max_threads(),
+        },
+        "params": {
+            "size": size,
+            "dim": dim,
+            "queries": queries,
+            "k": k,
+            "distribution": distribution,
+            "clusters": clusters,
+            "seed": seed,
+            "overrides": overrides or {},
+        },
+        "results": results,
+    }
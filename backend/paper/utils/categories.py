@@ -0,0 +1,172 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from paper.models import Category, CategoryYearCount, Paper, PaperCategory
+from paper.utils.search_filters import split_categories
+
+
+def _year(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+# Category.id for every name, creating the missing categories
+def category_ids(names):
+    names = set(names)
+    if not names:
+        return {}
+
+    Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+    return dict(Category.objects.filter(name__in=names).values_list("name", "id"))
+
+
+# Bring the category links and the CategoryYearCount rollup in line with
+# `rows` [(Paper.id, categories, publication_year)]. Only the difference to
+# the stored links is written, so it is safe to call again for the same
+# papers, for new papers (ingestion) and for edited ones. Pass
+# categories=None to unlink a paper that is about to be deleted.
+def index_paper_categories(rows):
+    wanted = {}
+    for pk, categories, year in rows:
+        wanted[pk] = (set(split_categories(categories)), _year(year))
+    if not wanted:
+        return
+
+    with transaction.atomic():
+        ids = category_ids(name for names, _ in wanted.values() for name in names)
+        desired = {
+            (pk, ids[name], year)
+            for pk, (names, year) in wanted.items()
+            for name in names
+        }
+
+        existing = {}
+        links = (
+            PaperCategory.objects
+            .filter(paper_id__in=list(wanted.keys()))
+            .values_list("id", "paper_id", "category_id", "publication_year")
+        )
+        for link_id, pk, category_id, year in links:
+            existing[(pk, category_id, year)] = link_id
+
+        removed = existing.keys() - desired
+        added = desired - existing.keys()
+        if not removed and not added:
+            return
+
+        if removed:
+            PaperCategory.objects.filter(id__in=[existing[link] for link in removed]).delete()
+        PaperCategory.objects.bulk_create(
+            [
+                PaperCategory(paper_id=pk, category_id=category_id, publication_year=year)
+                for pk, category_id, year in added
+            ],
+            batch_size=1000,
+        )
+
+        deltas = Counter()
+        for _, category_id, year in added:
+            if year is not None:
+                deltas[(category_id, year)] += 1
+        for _, category_id, year in removed:
+            if year is not None:
+                deltas[(category_id, year)] -= 1
+
+        apply_rollup_deltas(deltas)
+
+
+# Add `deltas` {(Category.id, year): change} to the rollup counts
+def apply_rollup_deltas(deltas):
+    deltas = {key: change for key, change in deltas.items() if change}
+    if not deltas:
+        return
+
+    if connection.vendor in ("sqlite", "postgresql"):
+        table = connection.ops.quote_name(CategoryYearCount._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} (category_id, year, count) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (category_id, year) DO UPDATE SET count = {table}.count + excluded.count"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (category_id, year, change) for (category_id, year), change in deltas.items()
+            ])
+    else:
+        for (category_id, year), change in deltas.items():
+            updated = (
+                CategoryYearCount.objects
+                .filter(category_id=category_id, year=year)
+                .update(count=F("count") + change)
+            )
+            if not updated:
+                CategoryYearCount.objects.create(category_id=category_id, year=year, count=change)
+
+    if any(change < 0 for change in deltas.values()):
+        CategoryYearCount.objects.filter(count__lte=0).delete()
+
+
+# Recompute every link and rollup row from Paper.categories
+def rebuild_category_index(batch_size=5000):
+    with transaction.atomic():
+        PaperCategory.objects.all().delete()
+
+        ids = dict(Category.objects.values_list("name", "id"))
+        papers = links = 0
+        last_id = 0
+
+        # Keyset pagination over papers, one bulk insert per page
+        while True:
+            rows = list(
+                Paper.objects
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "categories", "publication_year")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            names = {name for _, categories, _ in rows for name in split_categories(categories)}
+            new_names = names - ids.keys()
+            if new_names:
+                Category.objects.bulk_create([Category(name=name) for name in new_names], ignore_conflicts=True)
+                ids.update(Category.objects.filter(name__in=new_names).values_list("name", "id"))
+
+            batch = [
+                PaperCategory(paper_id=pk, category_id=ids[name], publication_year=_year(year))
+                for pk, categories, year in rows
+                for name in set(split_categories(categories))
+            ]
+            PaperCategory.objects.bulk_create(batch, batch_size=1000)
+
+            papers += len(rows)
+            links += len(batch)
+
+        rollups = rebuild_category_rollups()
+
+    return {"papers": papers, "links": links, "rollups": rollups}
+
+
+# Recompute the rollup table from the existing links with one GROUP BY
+def rebuild_category_rollups():
+    with transaction.atomic():
+        CategoryYearCount.objects.all().delete()
+
+        counts = (
+            PaperCategory.objects
+            .exclude(publication_year__isnull=True)
+            .values("category_id", "publication_year")
+            .annotate(total=Count("id"))
+        )
+        rollups = CategoryYearCount.objects.bulk_create(
+            [
+                CategoryYearCount(category_id=row["category_id"], year=row["publication_year"], count=row["total"])
+                for row in counts
+            ],
+            batch_size=1000,
+        )
+
+    return len(rollups)
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+# Defaults for settings.EMBEDDING_CACHE
+DEFAULTS = {
+    "BACKEND": "local",        # "local", "django" (shared) or None to disable
+    "MAX_SIZE": 10000,         # entries kept in the in-process LRU
+    "TTL": 3600,               # seconds, None keeps entries until evicted
+    "CACHE_ALIAS": "default",  # Django cache used by the "django" backend
+    "LOWERCASE": True,         # safe for uncased models such as all-MiniLM-L6-v2
+}
+
+
+def cache_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, "EMBEDDING_CACHE", {}))
+    return config
+
+
+# Collapse whitespace (and case) so trivially different queries share an entry
+def normalize_text(text, lowercase=True):
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+
+class EmbeddingCache:
+    # Two levels: a bounded in-process LRU with TTL, optionally backed by a
+    # Django cache (Redis, Memcached, FileBasedCache, ...) shared by every worker.
+
+    def __init__(self, max_size=10000, ttl=3600, shared=None, lowercase=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.lowercase = lowercase
+
+        self._entries = OrderedDict()   # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def key(self, model_name, text):
+        normalized = normalize_text(text, self.lowercase)
+        digest = hashlib.sha1(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+        return f"papyrus:emb:{digest}"
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, vector = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        if self.shared is not None:
+            blob = self.shared.get(key)
+            if blob is not None:
+                vector = self._freeze(np.frombuffer(blob, dtype="float32"))
+                self._store_local(key, vector)
+                with self._lock:
+                    self.shared_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, vector):
+        vector = self._freeze(np.array(vector, dtype="float32"))
+        self._store_local(key, vector)
+
+        if self.shared is not None:
+            self.shared.set(key, vector.tobytes(), timeout=self.ttl)
+
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    def _store_local(self, key, vector):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._entries[key] = (expires_at, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _freeze(vector):
+        # Cached arrays are shared between callers, keep them read-only
+        vector.setflags(write=False)
+        return vector
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide cache built from settings.EMBEDDING_CACHE (None when disabled)
+def get_embedding_cache():
+    global _cache
+
+    if _cache is not None:
+        return _cache
+
+    config = cache_config()
+    if not config["BACKEND"]:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            shared = None
+            if config["BACKEND"] == "django":
+                from django.core.cache import caches
+                shared = caches[config["CACHE_ALIAS"]]
+            elif config["BACKEND"] != "local":
+                raise ValueError(f"Unknown embedding cache backend: {config['BACKEND']}")
+
+            _cache = EmbeddingCache(
+                max_size=config["MAX_SIZE"],
+                ttl=config["TTL"],
+                shared=shared,
+                lowercase=config["LOWERCASE"],
+            )
+
+    return _cache
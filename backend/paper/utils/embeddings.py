@@ -1,11 +1,88 @@
-from sentence_transformers import SentenceTransformer # type: ignore
+from django.conf import settings
 import numpy as np
 
-# Load once
-_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+from paper.utils.batching import BatchingEncoder
+from paper.utils.embedding_cache import get_embedding_cache
+from paper.utils.encoders import get_model, model_id
+from paper.utils.metrics import ENCODE_BATCH_SIZE, ENCODE_SECONDS
 
+_batcher = None
 
+
+def _encode_batch(texts):
+    ENCODE_BATCH_SIZE.observe(len(texts))
+    with ENCODE_SECONDS.time():
+        return get_model().encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+# Shared micro-batching encoder, None when ENCODER_BATCHING is disabled
+def get_batcher():
+    global _batcher
+
+    config = getattr(settings, "ENCODER_BATCHING", {})
+    if not config.get("ENABLED", True):
+        return None
+
+    if _batcher is None:
+        _batcher = BatchingEncoder(
+            _encode_batch,
+            max_batch_size=config.get("MAX_BATCH_SIZE", 32),
+            max_wait_ms=config.get("MAX_WAIT_MS", 5.0),
+        )
+    return _batcher
+
+
+def _encode(text):
+    batcher = get_batcher()
+    if batcher is None:
+        ENCODE_BATCH_SIZE.observe(1)
+        with ENCODE_SECONDS.time():
+            return get_model().encode(text, show_progress_bar=False)
+    return batcher.encode(text)
+
+
+# Returns a float32 numpy vector (pack it with vectors.to_bytes before saving).
+# Repeated queries are served from the embedding cache without running the model.
 def generate_embedding(text: str):
-    embedding = _model.encode(text)
-    embedding = np.array(embedding).astype("float32")
-    return embedding.tolist()
+    cache = get_embedding_cache()
+
+    if cache is None:
+        return np.asarray(_encode(text), dtype="float32")
+
+    key = cache.key(model_id(), text)
+    embedding = cache.get(key)
+    if embedding is not None:
+        return embedding
+
+    embedding = _encode(text)
+    return cache.set(key, embedding)
+
+
+# Batch version of generate_embedding: a (len(texts), dim) float32 matrix.
+# Cached texts are reused, the rest go through the model in one encode call.
+def generate_embeddings(texts, batch_size=64):
+    texts = list(texts)
+    cache = get_embedding_cache()
+
+    embeddings = [None] * len(texts)
+    keys = [None] * len(texts)
+    if cache is not None:
+        for i, text in enumerate(texts):
+            keys[i] = cache.key(model_id(), text)
+            embeddings[i] = cache.get(keys[i])
+
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        ENCODE_BATCH_SIZE.observe(len(missing))
+        with ENCODE_SECONDS.time():
+            encoded = get_model().encode(
+                [texts[i] for i in missing], batch_size=batch_size, show_progress_bar=False
+            )
+        for i, embedding in zip(missing, encoded):
+            if cache is not None:
+                embedding = cache.set(keys[i], embedding)
+            embeddings[i] = np.asarray(embedding, dtype="float32")
+
+    if not embeddings:
+        return np.empty((0, 0), dtype="float32")
+    return np.vstack(embeddings)
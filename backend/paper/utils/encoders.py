@@ -0,0 +1,120 @@
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Defaults for settings.EMBEDDING_MODEL
+DEFAULTS = {
+    "BACKEND": "torch",        # "torch" or "onnx" (ONNX Runtime, CPU friendly)
+    "ONNX_DIR": None,          # output of `manage.py export_onnx_model`
+    "ONNX_FILE": "onnx/model.onnx",   # or onnx/model_qint8_<config>.onnx for int8
+}
+
+QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+# Model registry: every caller shares one loaded copy per backend, loaded on first use
+_models = {}
+_models_lock = threading.Lock()
+
+
+def model_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, "EMBEDDING_MODEL", {}))
+    if not config["ONNX_DIR"]:
+        config["ONNX_DIR"] = os.path.join(settings.BASE_DIR, "models", "all-MiniLM-L6-v2-onnx")
+    return config
+
+
+# Identifies the encoder in cache keys: int8 ONNX vectors differ slightly from torch ones
+def model_id():
+    config = model_config()
+    if config["BACKEND"] == "onnx":
+        return f"{MODEL_NAME}:onnx:{config['ONNX_FILE']}"
+    return f"{MODEL_NAME}:{config['BACKEND']}"
+
+
+# Load the sentence encoder for the configured (or given) backend
+def load_model(backend=None, onnx_file=None):
+    from sentence_transformers import SentenceTransformer # type: ignore
+
+    config = model_config()
+    backend = backend or config["BACKEND"]
+
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME)
+
+    if backend == "onnx":
+        onnx_file = onnx_file or config["ONNX_FILE"]
+        if not os.path.exists(os.path.join(config["ONNX_DIR"], onnx_file)):
+            raise ImproperlyConfigured(
+                f"ONNX model {onnx_file} not found in {config['ONNX_DIR']}, "
+                "run `python manage.py export_onnx_model` first"
+            )
+
+        try:
+            return SentenceTransformer(
+                config["ONNX_DIR"], backend="onnx", model_kwargs={"file_name": onnx_file}
+            )
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                'The ONNX backend needs `pip install "sentence-transformers[onnx]"`'
+            ) from e
+
+    raise ImproperlyConfigured(f"Unknown embedding backend: {backend}")
+
+
+# Shared, lazily loaded encoder. Importing this module never loads a model,
+# so migrate, admin-only processes and tests start without paying for it.
+def get_model(backend=None):
+    key = backend or model_config()["BACKEND"]
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        if key not in _models:
+            _models[key] = load_model(key)
+        return _models[key]
+
+
+# Load the model ahead of the first request. Call it in a gunicorn
+# preload_app master (see gunicorn.conf.py) so forked workers share the
+# weights copy-on-write. `encode=True` also runs one forward pass to warm
+# up kernels, only do that in processes that serve requests themselves.
+def warm_up(encode=True):
+    model = get_model()
+    if encode:
+        model.encode("warm up", show_progress_bar=False)
+    return model
+
+
+# Export the model to ONNX in `output_dir`, optionally with a dynamically
+# int8-quantized copy. Returns the ONNX file name to put in ONNX_FILE.
+def export_onnx_model(output_dir, quantization=None):
+    from sentence_transformers import SentenceTransformer # type: ignore
+
+    model = SentenceTransformer(MODEL_NAME, backend="onnx")
+    model.save(output_dir)
+
+    if not quantization:
+        return "onnx/model.onnx"
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model # type: ignore
+
+    export_dynamic_quantized_onnx_model(model, quantization, output_dir)
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+# Cosine agreement between two encoders on the same texts, one value per text
+def embedding_parity(reference_model, candidate_model, texts, batch_size=64):
+    reference = np.asarray(reference_model.encode(texts, batch_size=batch_size), dtype="float32")
+    candidate = np.asarray(candidate_model.encode(texts, batch_size=batch_size), dtype="float32")
+
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
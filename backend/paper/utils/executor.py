@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class ExecutorFull(Exception):
+    pass
+
+
+class BoundedExecutor:
+    # Thread pool for CPU bound work (encode, FAISS search) called from async
+    # views. Both release the GIL, so a few threads keep the cores busy while
+    # the event loop serves other clients. At most max_workers + max_queue
+    # tasks are accepted, beyond that submit() raises ExecutorFull so the
+    # caller can shed load instead of queueing without bound.
+
+    def __init__(self, max_workers=4, max_queue=64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.peak_queued = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorFull(f"{self.in_flight} tasks already in flight")
+
+            # Threads do not survive fork, start a fresh pool in each worker
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="papyrus-executor")
+                self._pid = os.getpid()
+
+            self.in_flight += 1
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.in_flight - self.max_workers)
+
+        try:
+            return self._pool.submit(self._run, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self.running += 1
+
+        # Pool threads outlive requests: treat each task like one, so its
+        # DB connections are closed (or recycled per CONN_MAX_AGE) instead
+        # of idling for the life of the thread
+        close_old_connections()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            close_old_connections()
+            with self._lock:
+                self.running -= 1
+                self.in_flight -= 1
+                self.completed += 1
+
+        return result
+
+    # Await fn(*args, **kwargs) on the pool from a coroutine
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queue_depth": self.in_flight - self.running,
+                "peak_queue_depth": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = getattr(settings, "ASYNC_EXECUTOR", {})
+                _executor = BoundedExecutor(
+                    max_workers=config.get("MAX_WORKERS", 4),
+                    max_queue=config.get("MAX_QUEUE", 64),
+                )
+    return _executor
@@ -1,59 +1,996 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
 import faiss # type: ignore
 import numpy as np
-from paper.models import Paper
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max
+from django.utils import timezone
+from paper.models import Paper, PaperIndexChange
+from paper.utils.hydration import invalidate_papers
+from paper.utils.index_validation import IndexValidationError, validate_index
+from paper.utils.metrics import SEARCH_BATCH_SIZE, SEARCH_SECONDS
+from paper.utils.index_factory import (
+    create_index, describe_index, filtered_config, index_config, is_compressed, search_parameters,
+    train_index,
+)
+from paper.utils.search_filters import FILTERS_FILE, FilterAttributes, paper_matches
+from paper.utils.shards import get_shard_clients, search_shards, shard_config, shard_of
+from paper.utils.vectors import from_bytes, to_matrix
 
 # Global objects (loaded once)
 index = None
-paper_ids = []
+paper_ids = np.empty(0, dtype="int64")   # position in `index` -> Paper.id, sorted
+index_version = None
 
 _index_built = False
+_load_attempted = False
+_load_lock = threading.Lock()
+
+# Category / year attributes of the base index for filtered search (built
+# lazily from the database when a snapshot has none), and recently used
+# filter bitmaps, tombstone and delta selectors, valid until the index changes
+_attributes = None
+_filter_masks = OrderedDict()
+_delta_selectors = OrderedDict()
+_removed_selector = None
+_generation = 0
+
+# Exact normalized vectors of a compressed base index (memory mapped from
+# the snapshot), used to rescore its approximate top candidates
+_exact_vectors = None
+
+# Incremental updates on top of the base index: changed vectors live in a
+# small id-mapped delta index, their stale base positions are masked out.
+_delta = None
+_removed = {}   # Paper.id -> position in the base index (or None if not in it)
+_removed_positions = np.empty(0, dtype="int64")
+_delta_attributes = {}   # Paper.id -> (categories, publication_year) of delta vectors
+_last_change_id = 0
+_last_sync = 0.0
+
+# (number, count, strategy) when this process serves one shard of the
+# corpus (serve_faiss_shard), see paper/utils/shards.py
+_shard = None
+_lock = threading.RLock()
+_sync_lock = threading.Lock()
+
+# Background rebuilds and snapshot reloads: a new index is built or loaded
+# off to the side, validated, then swapped in under _lock. Searches that
+# already took the old index finish on it.
+_reload_lock = threading.Lock()
+_rejected_version = None   # CURRENT snapshot that failed validation here
+_rebuild_status = {"running": False, "started_at": None, "finished_at": None, "version": None, "error": None}
+
+# Snapshot layout: <FAISS_INDEX_DIR>/v000001/{index.faiss, ids.npy, meta.json}
+# (plus filters.npz and, for rescoring, vectors.f32) and a CURRENT file
+# naming the snapshot workers should load
+_CURRENT_FILE = "CURRENT"
+_VECTORS_FILE = "vectors.f32"
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _index_dir():
+    root = str(getattr(settings, "FAISS_INDEX_DIR", os.path.join(settings.BASE_DIR, "indexes")))
+    if _shard is not None:
+        return os.path.join(root, f"shard-{_shard[0]:02d}")
+    return root
+
+
+# Make this process build, load and serve shard `number` only. Its
+# snapshots live in <FAISS_INDEX_DIR>/shard-NN/.
+def set_shard(number, count=None, strategy=None):
+    global _shard
+
+    config = shard_config()
+    count = count or config["COUNT"]
+    if not 0 <= number < count:
+        raise ValueError(f"Shard {number} out of range for {count} shards")
+
+    _shard = (number, count, strategy or config["STRATEGY"])
+
+
+# Web processes with FAISS_SHARDS configured hold no index, they fan out
+# every search to the shard servers
+def _coordinator():
+    return _shard is None and shard_config()["COUNT"] > 0
+
+
+def _owns(pk, categories):
+    return _shard is None or shard_of(pk, categories, _shard[1], _shard[2]) == _shard[0]
+
+
+# Stream (ids, rows, normalized float32 matrix) chunks of the stored
+# embeddings up to `max_id` with keyset pagination, rows are
+# (categories, publication_year) for the filter attributes
+def _iter_embedding_chunks(batch_size, max_id):
+    last_id = 0
+    while True:
+        chunk = list(
+            Paper.objects
+            .exclude(embedding__isnull=True)
+            .filter(id__gt=last_id, id__lte=max_id)
+            .order_by("id")
+            .values_list("id", "embedding", "categories", "publication_year")[:batch_size]
+        )
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+
+        chunk = [row for row in chunk if _owns(row[0], row[2])]
+        if not chunk:
+            continue
+
+        # Raw bytes go straight into one float32 matrix
+        vectors = to_matrix([blob for _, blob, _, _ in chunk])
+        faiss.normalize_L2(vectors)
+        yield (
+            np.asarray([pk for pk, _, _, _ in chunk], dtype="int64"),
+            [(categories, year) for _, _, categories, year in chunk],
+            vectors,
+        )
+
+
+# Build a fresh index from the stored embeddings, one BUILD_BATCH_SIZE
+# chunk at a time so peak memory is the index itself plus one chunk.
+# With `vectors_path` the exact normalized vectors are also written there
+# (float32, index position order) for rescoring.
+# Returns (index, ids, attributes, last_change_id)
+def _build_from_db(config=None, vectors_path=None):
+    # Read the change log position first: changes made while we scan are
+    # replayed afterwards, replaying is idempotent
+    last_change_id = PaperIndexChange.objects.aggregate(m=Max("id"))["m"] or 0
+
+    # Papers added during the build are left to the change log as well
+    stats = Paper.objects.exclude(embedding__isnull=True).aggregate(n=Count("id"), max_id=Max("id"))
+    if not stats["n"]:
+        return None, None, None, last_change_id
+
+    # Index type comes from settings.FAISS_INDEX (flat for small corpora)
+    config = config or index_config()
+    batch_size = config["BUILD_BATCH_SIZE"]
+    # A shard holds about 1 / count of the corpus (sizes IVF lists and the training sample)
+    size = max(1, stats["n"] // _shard[1]) if _shard is not None else stats["n"]
+
+    new_index = None
+    ids = []
+    attributes = []
+    vectors_file = open(vectors_path, "wb") if vectors_path else None
+
+    try:
+        for chunk_ids, rows, vectors in _iter_embedding_chunks(batch_size, stats["max_id"]):
+            if new_index is None:
+                new_index = create_index(vectors.shape[1], size, config)
+                if not new_index.is_trained:
+                    train_index(new_index, _training_sample(batch_size, size, stats["max_id"], config), config)
+
+            new_index.add(vectors)
+            ids.append(chunk_ids)
+            attributes.append(FilterAttributes.from_rows(rows))
+            if vectors_file is not None:
+                vectors_file.write(vectors.tobytes())
+    finally:
+        if vectors_file is not None:
+            vectors_file.close()
+
+    if new_index is None:
+        return None, None, None, last_change_id
+
+    return new_index, np.concatenate(ids), FilterAttributes.concatenate(attributes), last_change_id
+
+
+# Random sample of about TRAIN_SAMPLE normalized vectors, drawn in a
+# separate streaming pass so the full matrix is never in memory
+def _training_sample(batch_size, size, max_id, config):
+    rng = np.random.default_rng(0)
+    rate = min(1.0, config["TRAIN_SAMPLE"] / size)
+
+    sample = []
+    for _, _, vectors in _iter_embedding_chunks(batch_size, max_id):
+        sample.append(vectors[rng.random(len(vectors)) < rate])
+
+    return np.ascontiguousarray(np.vstack(sample))
+
+
+# (categories, publication_year) of the papers in `ids` (sorted), read from the database
+def _attribute_rows(ids):
+    rows = [(None, None)] * len(ids)
+    if not len(ids):
+        return rows
+
+    papers = (
+        Paper.objects
+        .filter(id__gte=int(ids[0]), id__lte=int(ids[-1]))
+        .values_list("id", "categories", "publication_year")
+    )
+    for pk, categories, year in papers.iterator(chunk_size=5000):
+        pos = int(np.searchsorted(ids, pk))
+        if pos < len(ids) and ids[pos] == pk:
+            rows[pos] = (categories, year)
+
+    return rows
+
+
+# Swap in a new base index and forget the deltas it already contains
+def _set_base(new_index, ids, version, last_change_id, attributes=None, exact_vectors=None):
+    global index, paper_ids, index_version, _index_built, _attributes, _generation, _exact_vectors
+    global _delta, _removed, _removed_positions, _delta_attributes, _last_change_id, _removed_selector
+
+    with _lock:
+        index, paper_ids, index_version = new_index, ids, version
+        _attributes = attributes
+        _exact_vectors = exact_vectors
+        _delta = None
+        _removed = {}
+        _removed_positions = np.empty(0, dtype="int64")
+        _delta_attributes = {}
+        _last_change_id = last_change_id
+        _generation += 1
+        _filter_masks.clear()
+        _delta_selectors.clear()
+        _removed_selector = None
+        _index_built = True
+
 
 # Build FAISS index from existing paper embeddings
 def build_faiss_index():
-    global index, paper_ids, _index_built
-
     if _index_built:
         return
 
-    papers = Paper.objects.exclude(embedding__isnull=True).values("id", "embedding")
+    new_index, ids, attributes, last_change_id = _build_from_db()
 
-    if not papers.exists():
+    if new_index is None:
+        # Nothing to search yet, but new embeddings can still arrive as deltas
+        _set_base(None, np.empty(0, dtype="int64"), None, last_change_id)
         print("No embeddings found.")
         return
 
-    embeddings = []
-    paper_ids = []
+    _set_base(new_index, ids, None, last_change_id, attributes)
+    print(f"FAISS {describe_index(index)} index built with {index.ntotal} vectors.")
+
+
+def _snapshot_versions(root):
+    versions = []
+    if not os.path.isdir(root):
+        return versions
+
+    for name in os.listdir(root):
+        if name.startswith("v") and name[1:].isdigit():
+            versions.append(int(name[1:]))
+
+    return sorted(versions)
+
+
+def _current_snapshot_path():
+    root = _index_dir()
+    try:
+        with open(os.path.join(root, _CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
 
-    for row in papers:
-        embeddings.append(row["embedding"])
-        paper_ids.append(row["id"])
+    path = os.path.join(root, name)
+    return path if os.path.isdir(path) else None
 
-    vectors = np.array(embeddings).astype("float32")
+
+# Build an index from the database and write it as a new versioned snapshot.
+# Returns the snapshot metadata, or None when there is nothing to index.
+# The new index is validated against the one this process serves first.
+def save_faiss_snapshot(keep=3, config=None, validate=True):
+    config = config or index_config()
+
+    # Exact vectors are only worth keeping next to a lossy index
+    vectors_file = None
+    if config["RESCORE"]:
+        os.makedirs(_index_dir(), exist_ok=True)
+        vectors_file = os.path.join(_index_dir(), f".{_VECTORS_FILE}.{os.getpid()}.tmp")
+
+    try:
+        new_index, ids, attributes, last_change_id = _build_from_db(config, vectors_file)
+
+        if new_index is None:
+            return None
+        if vectors_file is not None and not is_compressed(new_index):
+            os.remove(vectors_file)
+            vectors_file = None
+        if validate:
+            validate_index(new_index, ids, attributes, current=index, config=config)
+
+        return _write_snapshot(new_index, ids, last_change_id, keep, attributes, vectors_file)
+    finally:
+        if vectors_file is not None and os.path.exists(vectors_file):
+            os.remove(vectors_file)
+
+
+# Add newly written papers to the CURRENT snapshot without re-reading the
+# database. `ids` must all be newer than the snapshot's ids (true for fresh
+# inserts), otherwise a full snapshot is rebuilt instead.
+def append_to_snapshot(ids, vectors, keep=3):
+    # Shard servers pick new papers up from the change log instead
+    if _coordinator():
+        return None
+
+    path = _current_snapshot_path()
+    if path is None:
+        return save_faiss_snapshot(keep)
+
+    ids = np.asarray(ids, dtype="int64")
+    order = np.argsort(ids)
+    ids = ids[order]
+    vectors = np.ascontiguousarray(np.asarray(vectors, dtype="float32")[order])
+
+    snapshot_ids = np.load(os.path.join(path, "ids.npy"))
+    if len(snapshot_ids) and len(ids) and ids[0] <= snapshot_ids[-1]:
+        return save_faiss_snapshot(keep)
+
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    snapshot_index = faiss.read_index(os.path.join(path, "index.faiss"))
     faiss.normalize_L2(vectors)
+    snapshot_index.add(vectors)
+
+    all_ids = np.concatenate([snapshot_ids, ids])
+    attributes_path = os.path.join(path, FILTERS_FILE)
+    if os.path.exists(attributes_path):
+        attributes = FilterAttributes.load(attributes_path).extend(_attribute_rows(ids))
+    else:
+        attributes = FilterAttributes.from_rows(_attribute_rows(all_ids))
+
+    # Exact vectors for rescoring: copy the old ones and add the new rows
+    vectors_file = None
+    if os.path.exists(os.path.join(path, _VECTORS_FILE)):
+        vectors_file = os.path.join(_index_dir(), f".{_VECTORS_FILE}.{os.getpid()}.tmp")
+        shutil.copyfile(os.path.join(path, _VECTORS_FILE), vectors_file)
+        with open(vectors_file, "ab") as f:
+            f.write(vectors.tobytes())
+
+    # Move the change log position past the inserts of these papers, or
+    # every worker loading the snapshot would replay them into its delta
+    last_change_id = _appended_change_id(meta.get("last_change_id", 0), ids)
+    try:
+        return _write_snapshot(snapshot_index, all_ids, last_change_id, keep, attributes, vectors_file)
+    finally:
+        if vectors_file is not None and os.path.exists(vectors_file):
+            os.remove(vectors_file)
+
+
+# Change log position an appended snapshot can start from: past the run
+# of entries after `last_change_id` that are the first UPSERT of one of
+# the appended `ids`. It stops at anything else (another paper, a delete,
+# a later edit of an appended paper), those still have to be replayed.
+def _appended_change_id(last_change_id, ids, chunk_size=5000):
+    appended = set(ids.tolist())
+    seen = set()
+
+    while True:
+        changes = list(
+            PaperIndexChange.objects
+            .filter(id__gt=last_change_id)
+            .order_by("id")
+            .values_list("id", "paper_pk", "op")[:chunk_size]
+        )
+        for change_id, pk, op in changes:
+            if op != PaperIndexChange.UPSERT or pk not in appended or pk in seen:
+                return last_change_id
+            seen.add(pk)
+            last_change_id = change_id
+
+        if len(changes) < chunk_size:
+            return last_change_id
+
+
+def _write_snapshot(new_index, ids, last_change_id, keep, attributes=None, vectors_file=None):
+    root = _index_dir()
+    os.makedirs(root, exist_ok=True)
+
+    versions = _snapshot_versions(root)
+    version = (versions[-1] if versions else 0) + 1
+    name = f"v{version:06d}"
+
+    # Write into a temporary directory first so readers never see a half-written snapshot
+    tmp_path = os.path.join(root, f".{name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    faiss.write_index(new_index, os.path.join(tmp_path, "index.faiss"))
+    np.save(os.path.join(tmp_path, "ids.npy"), ids)
+    if attributes is not None:
+        attributes.save(os.path.join(tmp_path, FILTERS_FILE))
+    if vectors_file is not None:
+        os.replace(vectors_file, os.path.join(tmp_path, _VECTORS_FILE))
+
+    meta = {
+        "version": version,
+        "created_at": time.time(),
+        "ntotal": int(new_index.ntotal),
+        "dim": int(new_index.d),
+        "index_type": describe_index(new_index),
+        "embedding_dtype": str(getattr(settings, "EMBEDDING_DTYPE", "float32")),
+        "last_change_id": last_change_id,
+        "exact_vectors": vectors_file is not None,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    os.rename(tmp_path, os.path.join(root, name))
+
+    # Atomically point CURRENT at the new snapshot
+    current_tmp = os.path.join(root, f".{_CURRENT_FILE}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(root, _CURRENT_FILE))
+
+    # Drop old snapshots (workers that still map them keep their pages until restart)
+    for old in _snapshot_versions(root)[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(root, f"v{old:06d}"), ignore_errors=True)
+
+    # The change log is left alone: workers still serving an older base
+    # replay from it. prune_index_changes trims it after a retention window.
+    return meta
+
+
+# Delete change log entries that every kept snapshot (of every shard)
+# already contains and that are older than `retention_hours`. Workers
+# replay from their own position, so the window has to outlast the
+# slowest of them, e.g. one with FAISS_HOT_RELOAD off still on its startup
+# snapshot. Returns the number of entries deleted.
+def prune_index_changes(retention_hours):
+    root = str(getattr(settings, "FAISS_INDEX_DIR", os.path.join(settings.BASE_DIR, "indexes")))
+    dirs = [root]
+    if os.path.isdir(root):
+        dirs += [os.path.join(root, name) for name in sorted(os.listdir(root)) if name.startswith("shard-")]
+
+    floor = None
+    for path in dirs:
+        for version in _snapshot_versions(path):
+            with open(os.path.join(path, f"v{version:06d}", "meta.json"), "r", encoding="utf-8") as f:
+                change_id = json.load(f).get("last_change_id", 0)
+            floor = change_id if floor is None else min(floor, change_id)
+
+    changes = PaperIndexChange.objects.filter(
+        created_at__lt=timezone.now() - timedelta(hours=retention_hours)
+    )
+    if floor is not None:
+        changes = changes.filter(id__lte=floor)
+
+    return changes.delete()[0]
+
+
+# Read a snapshot directory, returns (index, ids, meta, attributes, exact vectors).
+# With mmap the vectors stay in the page cache and are shared by every
+# worker process instead of copied into each one.
+def _read_snapshot(path, mmap=True):
+    flags = _MMAP_FLAGS if mmap else 0
+    new_index = faiss.read_index(os.path.join(path, "index.faiss"), flags)
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r" if mmap else None)
+
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # Older snapshots have no filter attributes, they are read from the
+    # database on the first filtered search instead
+    attributes = None
+    if os.path.exists(os.path.join(path, FILTERS_FILE)):
+        attributes = FilterAttributes.load(os.path.join(path, FILTERS_FILE))
+
+    exact_vectors = None
+    if os.path.exists(os.path.join(path, _VECTORS_FILE)):
+        shape = (int(new_index.ntotal), int(new_index.d))
+        if mmap:
+            exact_vectors = np.memmap(os.path.join(path, _VECTORS_FILE), dtype="float32", mode="r", shape=shape)
+        else:
+            exact_vectors = np.fromfile(os.path.join(path, _VECTORS_FILE), dtype="float32").reshape(shape)
+
+    return new_index, ids, meta, attributes, exact_vectors
+
+
+# Load the CURRENT snapshot
+def load_faiss_snapshot(mmap=True):
+    path = _current_snapshot_path()
+    if path is None:
+        return False
+
+    new_index, ids, meta, attributes, exact_vectors = _read_snapshot(path, mmap)
+    _set_base(
+        new_index, ids, meta["version"], meta.get("last_change_id", 0), attributes, exact_vectors
+    )
+    return True
+
+
+def _current_snapshot_name():
+    try:
+        with open(os.path.join(_index_dir(), _CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+# Hot swap to the CURRENT snapshot when it differs from the one being
+# served (a newer build, or CURRENT pointed back for a rollback). It is
+# read and validated first, a rejected snapshot is not retried. Changes
+# logged since it was built are replayed right after the swap.
+# Returns True when a new index was swapped in.
+def reload_faiss_snapshot(mmap=None):
+    global _rejected_version
+
+    path = _current_snapshot_path()
+    if path is None:
+        return False
 
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(vectors)
+    version = int(os.path.basename(path)[1:])
+    if version in (index_version, _rejected_version):
+        return False
 
-    _index_built = True
-    print(f"FAISS index built with {index.ntotal} vectors.")
+    mmap = getattr(settings, "FAISS_MMAP", True) if mmap is None else mmap
 
+    # A snapshot that cannot even be read (truncated or missing files) is
+    # rejected like one that fails validation
+    try:
+        new_index, ids, meta, attributes, exact_vectors = _read_snapshot(path, mmap)
+        validate_index(new_index, ids, attributes, exact_vectors, current=index)
+    except (IndexValidationError, OSError, RuntimeError, ValueError, KeyError) as exc:
+        _rejected_version = version
+        _rebuild_status["error"] = f"snapshot v{version} rejected: {exc}"
+        print(f"FAISS snapshot v{version} rejected: {exc}")
+        return False
 
-# Search for similar papers using FAISS
-def search_similar_papers(query_embedding, top_n=10):
-    if index is None:
+    with _sync_lock:
+        _set_base(new_index, ids, version, meta.get("last_change_id", 0), attributes, exact_vectors)
+        _replay_changes()
+
+    print(f"FAISS snapshot v{version} swapped in with {new_index.ntotal} vectors.")
+    return True
+
+
+# Run reload_faiss_snapshot on a background thread, at most one at a time
+def _reload_in_background():
+    if not _reload_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            reload_faiss_snapshot()
+        except Exception as exc:
+            print(f"FAISS snapshot reload failed: {exc}")
+        finally:
+            connections.close_all()
+            _reload_lock.release()
+
+    threading.Thread(target=run, name="faiss-reload", daemon=True).start()
+
+
+# Rebuild the index from the database into a new snapshot while the current
+# one keeps serving, then swap it in. Other workers follow CURRENT on their
+# next sync. Returns False when a rebuild is already running.
+def rebuild_faiss_index(config=None, keep=None, background=True):
+    if _coordinator():
+        raise RuntimeError("FAISS search is sharded, rebuild each shard with build_faiss_snapshot --shard")
+
+    with _lock:
+        if _rebuild_status["running"]:
+            return False
+        _rebuild_status.update(running=True, started_at=time.time(), finished_at=None, version=None, error=None)
+
+    keep = keep or getattr(settings, "FAISS_SNAPSHOTS_TO_KEEP", 3)
+
+    def run():
+        try:
+            meta = save_faiss_snapshot(keep, config)
+            if meta is not None:
+                _rebuild_status["version"] = meta["version"]
+                reload_faiss_snapshot()
+        except Exception as exc:
+            _rebuild_status["error"] = str(exc)
+            print(f"FAISS rebuild failed: {exc}")
+        finally:
+            _rebuild_status.update(running=False, finished_at=time.time())
+            if background:
+                connections.close_all()
+
+    if background:
+        threading.Thread(target=run, name="faiss-rebuild", daemon=True).start()
+    else:
+        run()
+    return True
+
+
+# Startup entry point of the processes serving requests (papyrus/wsgi.py,
+# papyrus/asgi.py): prefer the on-disk snapshot, only fall back to a full
+# database build for the development server
+def load_faiss_index():
+    global _load_attempted
+    _load_attempted = True
+
+    if _coordinator():
+        print(f"FAISS search is sharded across {shard_config()['COUNT']} shard servers.")
+        return
+
+    if load_faiss_snapshot(mmap=getattr(settings, "FAISS_MMAP", True)):
+        print(f"FAISS snapshot v{index_version} loaded with {index.ntotal} vectors.")
+        return
+
+    if os.environ.get("RUN_MAIN") == "true":
+        build_faiss_index()
+
+
+# "<snapshot version>.<change log position>": the same in every process
+# serving the same data, and it changes whenever search results may.
+# Sharded coordinators join the generations their shards last reported.
+def index_generation():
+    if _coordinator():
+        return "-".join(client.generation or "?" for client in get_shard_clients())
+    return f"{index_version or 0}.{_last_change_id}"
+
+
+# Size, version and rebuild state of this process's index (also served as
+# shard stats); sharded coordinators report every shard
+def index_stats():
+    if _coordinator():
+        shards = []
+        for client in get_shard_clients():
+            try:
+                shards.append(client.stats())
+            except Exception as exc:
+                shards.append({"address": client.address, "error": str(exc)})
+        return {"generation": index_generation(), "shards": shards}
+
+    with _lock:
+        return {
+            "shard": _shard[0] if _shard is not None else None,
+            "version": index_version,
+            "generation": index_generation(),
+            "index_type": describe_index(index) if index is not None else None,
+            "ntotal": int(index.ntotal) if index is not None else 0,
+            "delta": int(_delta.ntotal) if _delta is not None else 0,
+            "removed": len(_removed),
+            "last_change_id": _last_change_id,
+            "rebuild": dict(_rebuild_status),
+        }
+
+
+# Position of each Paper.id in the base index, or None when it is not there
+def _base_position(pk):
+    pos = int(np.searchsorted(paper_ids, pk))
+    if pos < len(paper_ids) and paper_ids[pos] == pk:
+        return pos
+    return None
+
+
+# Apply embedding changes to this process's index: `upserts` maps Paper.id
+# to its new vector, `deletes` lists Paper.ids to drop. `attributes` maps
+# upserted Paper.ids to (categories, publication_year) for filtered search,
+# missing ones are read from the database. Cost is O(changes).
+def apply_index_changes(upserts=None, deletes=(), attributes=None):
+    global _delta, _removed_positions, _generation, _removed_selector
+
+    upserts = upserts or {}
+    changed = list(upserts.keys()) + list(deletes)
+    if not changed or _coordinator():
+        return
+
+    attributes = dict(attributes or {})
+    missing = [pk for pk in upserts if pk not in attributes]
+    if missing:
+        rows = Paper.objects.filter(id__in=missing).values_list("id", "categories", "publication_year")
+        attributes.update((pk, (categories, year)) for pk, categories, year in rows)
+
+    with _lock:
+        added = []
+        for pk in changed:
+            if pk not in _removed:
+                _removed[pk] = pos = _base_position(pk)
+                if pos is not None:
+                    added.append(pos)
+
+        changed_ids = np.asarray(changed, dtype="int64")
+        if _delta is not None:
+            _delta.remove_ids(changed_ids)
+
+        if upserts:
+            vectors = np.vstack([np.asarray(v, dtype="float32") for v in upserts.values()])
+            faiss.normalize_L2(vectors)
+
+            if _delta is None:
+                _delta = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            _delta.add_with_ids(vectors, np.asarray(list(upserts.keys()), dtype="int64"))
+
+        for pk in deletes:
+            _delta_attributes.pop(pk, None)
+        for pk in upserts:
+            _delta_attributes[pk] = attributes.get(pk, (None, None))
+
+        # Only positions tombstoned by this call are merged into the sorted array
+        if added:
+            added = np.sort(np.asarray(added, dtype="int64"))
+            _removed_positions = np.insert(_removed_positions, np.searchsorted(_removed_positions, added), added)
+        _generation += 1
+        _filter_masks.clear()
+        _delta_selectors.clear()
+        _removed_selector = None
+
+
+# Append entries to the change log so every other process picks them up
+def record_index_changes(upsert_ids=(), delete_ids=()):
+    PaperIndexChange.objects.bulk_create(
+        [PaperIndexChange(paper_pk=pk, op=PaperIndexChange.UPSERT) for pk in upsert_ids] +
+        [PaperIndexChange(paper_pk=pk, op=PaperIndexChange.DELETE) for pk in delete_ids]
+    )
+
+
+# Replay change log entries this process has not seen yet, and pick up a
+# new CURRENT snapshot (loaded in the background, searches never wait on it)
+def sync_index_changes(force=False):
+    global _last_sync
+
+    interval = getattr(settings, "FAISS_SYNC_INTERVAL", 5.0)
+    if not force and time.monotonic() - _last_sync < interval:
+        return
+
+    # One thread syncs at a time, the others keep searching
+    if not _sync_lock.acquire(blocking=force):
+        return
+
+    try:
+        _last_sync = time.monotonic()
+
+        if getattr(settings, "FAISS_HOT_RELOAD", True):
+            name = _current_snapshot_name()
+            if name and name[1:].isdigit() and int(name[1:]) not in (index_version, _rejected_version):
+                _reload_in_background()
+
+        # Without a base index there is nothing consistent to apply changes to
+        if _index_built:
+            _replay_changes()
+    finally:
+        _sync_lock.release()
+
+
+def _replay_changes(chunk_size=2000):
+    global _last_change_id
+
+    # Bulk writers can log many thousands of changes, replay them in chunks
+    while True:
+        changes = list(
+            PaperIndexChange.objects
+            .filter(id__gt=_last_change_id)
+            .order_by("id")
+            .values_list("id", "paper_pk")[:chunk_size]
+        )
+        if not changes:
+            return
+
+        # Only the latest state of each paper matters
+        changed_pks = {pk for _, pk in changes}
+        rows = (
+            Paper.objects
+            .filter(id__in=changed_pks, embedding__isnull=False)
+            .values_list("id", "embedding", "categories", "publication_year")
+        )
+        upserts = {}
+        attributes = {}
+        for pk, blob, categories, year in rows:
+            # A paper that moved to another shard is dropped from this one
+            if not _owns(pk, categories):
+                continue
+            upserts[pk] = from_bytes(blob)
+            attributes[pk] = (categories, year)
+        deletes = changed_pks - upserts.keys()
+
+        apply_index_changes(upserts, deletes, attributes)
+        # Papers changed by other processes, drop their cached search payloads too
+        invalidate_papers(changed_pks)
+        _last_change_id = changes[-1][0]
+
+        if len(changes) < chunk_size:
+            return
+
+
+# Bitmap selector over base positions for `filters` (matching and not
+# tombstoned), returns (selector, bitmap, matching count). Bitmaps are
+# cached per filter until the index changes.
+def _filter_selector(filters, removed):
+    global _attributes
+
+    key = (filters["categories"], filters["year_from"], filters["year_to"])
+
+    with _lock:
+        generation = _generation
+        cached = _filter_masks.get(key)
+        if cached is not None:
+            _filter_masks.move_to_end(key)
+            return cached
+
+        if _attributes is None:
+            _attributes = FilterAttributes.from_rows(_attribute_rows(paper_ids))
+        attributes = _attributes
+
+    mask = attributes.mask(filters)
+    mask[removed] = False
+
+    bitmap = np.packbits(mask, bitorder="little")
+    entry = (faiss.IDSelectorBitmap(bitmap), bitmap, int(np.count_nonzero(mask)))
+
+    with _lock:
+        if generation == _generation:
+            _filter_masks[key] = entry
+            while len(_filter_masks) > 64:
+                _filter_masks.popitem(last=False)
+
+    return entry
+
+
+# Selector skipping the tombstoned base positions, built once per generation.
+# `removed` is the _removed_positions array the caller took under _lock.
+def _tombstone_selector(removed):
+    global _removed_selector
+
+    with _lock:
+        cached = _removed_selector
+    if cached is not None and cached[0] is removed:
+        return cached[1]
+
+    # IDSelectorNot does not own the batch selector, keep both alive
+    batch = faiss.IDSelectorBatch(removed)
+    entry = (removed, faiss.IDSelectorNot(batch), batch)
+
+    with _lock:
+        if removed is _removed_positions:
+            _removed_selector = entry
+    return entry[1]
+
+
+# Search parameters restricting the delta index to `filters`, and the number
+# of delta papers matching them, cached per filter. Called under _lock.
+def _delta_filter_params(filters):
+    key = (filters["categories"], filters["year_from"], filters["year_to"])
+    cached = _delta_selectors.get(key)
+    if cached is not None:
+        _delta_selectors.move_to_end(key)
+        return cached[0], cached[2]
+
+    allowed = np.asarray([
+        pk for pk, (categories, year) in _delta_attributes.items()
+        if paper_matches(filters, categories, year)
+    ], dtype="int64")
+    selector = faiss.IDSelectorBatch(allowed)
+    entry = (faiss.SearchParameters(sel=selector), selector, len(allowed))
+
+    _delta_selectors[key] = entry
+    while len(_delta_selectors) > 64:
+        _delta_selectors.popitem(last=False)
+    return entry[0], entry[2]
+
+
+# Exact inner products of each query with its candidate positions
+# (-1 padding scores -inf), read from the memory mapped vectors
+def _rescore(exact, query_vectors, indices):
+    valid = indices >= 0
+    positions = np.unique(indices[valid])
+    candidates = np.asarray(exact[positions], dtype="float32")
+
+    scores = np.full(indices.shape, -np.inf, dtype="float32")
+    for row in range(len(indices)):
+        slots = np.searchsorted(positions, indices[row][valid[row]])
+        scores[row][valid[row]] = candidates[slots] @ query_vectors[row]
+    return scores
+
+
+# Search for similar papers using FAISS. `filters` (see
+# search_filters.parse_search_filters) restricts the search to matching
+# papers inside the index, so a filtered query still returns top_n hits.
+def search_similar_papers(query_embedding, top_n=10, filters=None):
+    return search_similar_papers_batch([query_embedding], top_n, filters)[0]
+
+
+# Matrix version of search_similar_papers: one index.search call for all
+# queries, returns one result list per query embedding
+def search_similar_papers_batch(query_embeddings, top_n=10, filters=None):
+    if not len(query_embeddings):
+        return []
+
+    mode = "sharded" if _coordinator() else "local"
+    SEARCH_BATCH_SIZE.observe(len(query_embeddings))
+
+    with SEARCH_SECONDS.time(mode=mode, filtered="true" if filters is not None else "false"):
+        if mode == "sharded":
+            query_vectors = np.array(query_embeddings, dtype="float32").reshape(len(query_embeddings), -1)
+            return search_shards(query_vectors, top_n, filters)
+        return _search_local(query_embeddings, top_n, filters)
+
+
+# Other processes (shell, management commands) load the index on their
+# first search instead of on startup
+def _ensure_loaded():
+    if _index_built or _load_attempted:
+        return
+    with _load_lock:
+        if not _load_attempted:
+            load_faiss_index()
+
+
+def _search_local(query_embeddings, top_n, filters):
+    _ensure_loaded()
+    sync_index_changes()
+
+    if not _index_built:
         raise RuntimeError("FAISS index not initialized")
 
-    query_vector = np.array([query_embedding]).astype("float32")
-    faiss.normalize_L2(query_vector)
+    query_vectors = np.array(query_embeddings, dtype="float32").reshape(len(query_embeddings), -1)
+    faiss.normalize_L2(query_vectors)
+
+    hits = [[] for _ in range(len(query_vectors))]
+
+    # Base index, skipping positions that were updated or deleted since it was built
+    with _lock:
+        base, ids, removed, exact = index, paper_ids, _removed_positions, _exact_vectors
+
+    if base is not None:
+        config = index_config()
+        selector = None
+
+        # Snapshots built with RESCORE carry exact vectors: fetch more
+        # approximate candidates than requested and re-rank them exactly
+        rescore = exact is not None
+        k = top_n * config["RESCORE_FACTOR"] if rescore else top_n
+
+        if filters is not None:
+            selector, bitmap, matching = _filter_selector(filters, removed)
+            if matching:
+                config = filtered_config(config, matching / base.ntotal)
+        elif len(removed):
+            selector = _tombstone_selector(removed)
+
+        if filters is None or matching:
+            params = search_parameters(base, selector, config)
+            scores, indices = base.search(query_vectors, k, params=params)
+
+            # Matches concentrated away from a query can still leave gaps
+            # in an approximate index, widen the search a few more times
+            for _ in range(3):
+                if filters is None or (indices >= 0).sum(axis=1).min() >= min(top_n, matching):
+                    break
+                config = filtered_config(config, 1 / 8)
+                params = search_parameters(base, selector, config)
+                scores, indices = base.search(query_vectors, k, params=params)
+
+            if rescore:
+                scores = _rescore(exact, query_vectors, indices)
+
+            for row, (row_scores, row_indices) in enumerate(zip(scores, indices)):
+                for score, idx in zip(row_scores, row_indices):
+                    # FAISS pads with -1 when the index holds fewer than top_n vectors
+                    if idx >= 0:
+                        hits[row].append((float(score), int(ids[idx])))
+
+    # Delta index, already keyed by Paper.id. It is changed in place, so it
+    # is searched under _lock, but it only holds the changes since the base.
+    with _lock:
+        if _delta is not None and _delta.ntotal:
+            params = None
+            allowed = None
+            if filters is not None:
+                params, allowed = _delta_filter_params(filters)
 
-    scores, indices = index.search(query_vector, top_n)
+            if filters is None or allowed:
+                scores, indices = _delta.search(query_vectors, top_n, params=params)
+                for row, (row_scores, row_indices) in enumerate(zip(scores, indices)):
+                    for score, pk in zip(row_scores, row_indices):
+                        if pk >= 0:
+                            hits[row].append((float(score), int(pk)))
 
     results = []
-    for score, idx in zip(scores[0], indices[0]):
-        results.append({
-            "paper_id": paper_ids[idx],
-            "score": float(score)
-        })
+    for row_hits in hits:
+        row_hits.sort(key=lambda hit: hit[0], reverse=True)
+        results.append([
+            {"paper_id": pk, "score": score}
+            for score, pk in row_hits[:top_n]
+        ])
 
     return results
@@ -0,0 +1,36 @@
+# Reciprocal rank fusion: score(d) = sum over sources of 1 / (k + rank(d)).
+# Only ranks are used, so BM25 and cosine scores never need to be calibrated
+# against each other. `rankings` maps a source name to [(Paper.id, score)]
+# ordered best first. Returns dicts ordered by fused score with the rank and
+# raw score each source gave the paper (None when it did not return it).
+def reciprocal_rank_fusion(rankings, k=60):
+    fused = {}
+
+    for source, ranking in rankings.items():
+        for rank, (pk, score) in enumerate(ranking, start=1):
+            entry = fused.setdefault(pk, {
+                "paper_id": pk,
+                "score": 0.0,
+                "sources": {name: None for name in rankings},
+            })
+            entry["score"] += 1.0 / (k + rank)
+            entry["sources"][source] = {"rank": rank, "score": score}
+
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+# Attach the fused score and each ranking's score to the hydrated paper
+# payloads (Paper.id -> dict), in fused order
+def annotate_results(fused, papers):
+    results = []
+    for item in fused:
+        paper_data = papers.get(item["paper_id"])
+        if paper_data is None:
+            continue
+
+        paper_data["score"] = item["score"]
+        paper_data["semantic_score"] = (item["sources"]["semantic"] or {}).get("score")
+        paper_data["keyword_score"] = (item["sources"]["keyword"] or {}).get("score")
+        results.append(paper_data)
+
+    return results
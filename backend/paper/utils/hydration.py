@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from paper.models import Paper
+from paper.serializers import PaperListSerializer
+
+
+class PaperPayloadCache:
+    # Bounded LRU of serialized PaperListSerializer payloads keyed by Paper.id.
+    # Entries are dropped by the Paper signals in this process, by change log
+    # replay for other processes, and after `ttl` seconds at the latest.
+
+    def __init__(self, max_size=50000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()   # pk -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, pks):
+        now = time.monotonic()
+        found = {}
+
+        with self._lock:
+            for pk in pks:
+                entry = self._entries.get(pk)
+                if entry is None:
+                    continue
+                expires_at, payload = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[pk]
+                    continue
+                self._entries.move_to_end(pk)
+                found[pk] = payload
+
+            self.hits += len(found)
+            self.misses += len(set(pks)) - len(found)
+
+        return found
+
+    def set_many(self, payloads):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+
+        with self._lock:
+            for pk, payload in payloads.items():
+                self._entries[pk] = (expires_at, payload)
+                self._entries.move_to_end(pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, pks):
+        with self._lock:
+            for pk in pks:
+                self._entries.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_paper_cache():
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PaperPayloadCache(
+                    max_size=getattr(settings, "PAPER_CACHE_SIZE", 50000),
+                    ttl=getattr(settings, "PAPER_CACHE_TTL", 300),
+                )
+    return _cache
+
+
+def invalidate_papers(pks):
+    if _cache is not None:
+        _cache.invalidate(pks)
+
+
+# Serialized payloads for `pks` in the given order (missing papers are
+# skipped). Cached papers never touch the database, the rest are fetched
+# with one query. Every payload is a fresh dict the caller may extend.
+def hydrate_papers(pks):
+    pks = list(pks)
+    cache = get_paper_cache()
+    payloads = cache.get_many(pks)
+
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in payloads]
+    if missing:
+        fetched = {paper.id: PaperListSerializer(paper).data for paper in _papers(missing)}
+        cache.set_many(fetched)
+        payloads.update(fetched)
+
+    return [dict(payloads[pk]) for pk in pks if pk in payloads]
+
+
+# hydrate_papers for async views, the query runs through the async ORM
+async def ahydrate_papers(pks):
+    pks = list(pks)
+    cache = get_paper_cache()
+    payloads = cache.get_many(pks)
+
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in payloads]
+    if missing:
+        fetched = {paper.id: PaperListSerializer(paper).data async for paper in _papers(missing)}
+        cache.set_many(fetched)
+        payloads.update(fetched)
+
+    return [dict(payloads[pk]) for pk in pks if pk in payloads]
+
+
+def _papers(pks):
+    return Paper.objects.filter(id__in=pks).only(*PaperListSerializer.Meta.fields)
@@ -0,0 +1,155 @@
+import math
+
+import faiss # type: ignore
+import numpy as np
+from django.conf import settings
+
+
+# Defaults for settings.FAISS_INDEX, any key can be overridden there
+DEFAULTS = {
+    "TYPE": "flat",             # "flat", "fp16", "sq8", "pq", "ivf_flat", "ivf_pq" or "hnsw"
+    "MIN_TRAIN_SIZE": 50000,    # smaller corpora always get an exact flat index
+    "TRAIN_SAMPLE": 100000,     # vectors used to train IVF / PQ
+    "NLIST": None,              # IVF cells, None picks ~4 * sqrt(n)
+    "NPROBE": 16,               # IVF cells visited per query
+    "PQ_M": 48,                 # PQ sub-quantizers (bytes per vector), must divide the dimension
+    "PQ_NBITS": 8,
+    "HNSW_M": 32,
+    "EF_CONSTRUCTION": 200,
+    "EF_SEARCH": 64,            # HNSW candidate list size per query
+    "MAX_EF_SEARCH": 1024,      # upper bound when widening a filtered HNSW search
+    "RESCORE": False,           # re-rank compressed results against exact vectors
+    "RESCORE_FACTOR": 4,        # candidates fetched per requested result when rescoring
+    "BUILD_BATCH_SIZE": 10000,  # embeddings read from the database per chunk while building
+    "VALIDATE_PROBES": 32,      # stored papers searched to check a new index before swapping it in
+    "VALIDATE_MIN_RECALL": 0.8, # share of probes that must find themselves in the top 10
+    "VALIDATE_MIN_SIZE_RATIO": 0.5,  # reject a new index this much smaller than the serving one
+}
+
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq", "ivf_flat", "ivf_pq", "hnsw")
+
+# Exhaustive compressed encodings: float16 (2 bytes / dim), 8-bit scalar
+# quantization (1 byte / dim) and product quantization (PQ_M bytes)
+COMPRESSED_TYPES = ("fp16", "sq8", "pq")
+
+
+def index_config(overrides=None):
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, "FAISS_INDEX", {}))
+    config.update(overrides or {})
+
+    if config["TYPE"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {config['TYPE']}")
+
+    return config
+
+
+# Pick the index type actually used for a corpus of `n` vectors. float16
+# and SQ8 need (almost) no training and are always honoured.
+def resolve_index_type(n, config):
+    if config["TYPE"] not in ("flat", "fp16", "sq8") and n < config["MIN_TRAIN_SIZE"]:
+        return "flat"
+    return config["TYPE"]
+
+
+# Create an empty inner-product index for `n` vectors of size `dim`
+def create_index(dim, n, config=None):
+    config = config or index_config()
+    index_type = resolve_index_type(n, config)
+
+    if index_type == "hnsw":
+        new_index = faiss.IndexHNSWFlat(dim, config["HNSW_M"], faiss.METRIC_INNER_PRODUCT)
+        new_index.hnsw.efConstruction = config["EF_CONSTRUCTION"]
+        new_index.hnsw.efSearch = config["EF_SEARCH"]
+        return new_index
+
+    if index_type in ("fp16", "sq8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        return faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    if index_type in ("pq", "ivf_pq", "ivf_flat"):
+        # Plain "pq" is IVF-PQ with a single list: an exhaustive scan over PQ
+        # codes that, unlike IndexPQ, accepts IDSelectors (filters, tombstones)
+        nlist = 1 if index_type == "pq" else config["NLIST"] or max(1, int(4 * math.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(dim)
+
+        if index_type in ("pq", "ivf_pq"):
+            new_index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, config["PQ_M"], config["PQ_NBITS"], faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            new_index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+
+        new_index.nprobe = config["NPROBE"]
+        return new_index
+
+    return faiss.IndexFlatIP(dim)
+
+
+# Train the index (IVF / PQ) on a random sample of the normalized vectors
+def train_index(new_index, vectors, config=None):
+    if new_index.is_trained:
+        return
+
+    config = config or index_config()
+    sample_size = min(len(vectors), config["TRAIN_SAMPLE"])
+
+    rng = np.random.default_rng(0)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    new_index.train(np.ascontiguousarray(sample, dtype="float32"))
+
+
+# Short description stored in snapshot metadata, e.g. "ivf_pq(nlist=4096)"
+def describe_index(new_index):
+    ivf = faiss.try_extract_index_ivf(new_index)
+
+    if ivf is not None:
+        if isinstance(new_index, faiss.IndexIVFPQ):
+            if ivf.nlist == 1:
+                return f"pq(M={new_index.pq.M})"
+            return f"ivf_pq(nlist={ivf.nlist})"
+        return f"ivf_flat(nlist={ivf.nlist})"
+
+    if isinstance(new_index, faiss.IndexScalarQuantizer):
+        return "fp16" if new_index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+
+    if isinstance(new_index, faiss.IndexHNSW):
+        return f"hnsw(M={new_index.hnsw.nb_neighbors(1)})"
+
+    return "flat"
+
+
+# Search parameters for `search_index` (nprobe / efSearch plus an optional IDSelector)
+def search_parameters(search_index, selector=None, config=None):
+    config = config or index_config()
+
+    ivf = faiss.try_extract_index_ivf(search_index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(config["NPROBE"], ivf.nlist))
+
+    if isinstance(search_index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=config["EF_SEARCH"])
+
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+
+    return None
+
+
+# Widen nprobe / efSearch for a filter matching `selectivity` (0-1] of the
+# index: the approximate search then visits about as many matching vectors
+# as an unfiltered one, so selective filters still fill top_n.
+def filtered_config(config, selectivity):
+    config = dict(config)
+    boost = 1.0 / max(selectivity, 1e-6)
+
+    config["NPROBE"] = int(math.ceil(config["NPROBE"] * boost))
+    config["EF_SEARCH"] = int(min(
+        max(config["EF_SEARCH"], math.ceil(config["EF_SEARCH"] * boost)), config["MAX_EF_SEARCH"]
+    ))
+    return config
+
+
+# Lossy encodings whose scores benefit from rescoring with exact vectors
+def is_compressed(new_index):
+    return describe_index(new_index).split("(")[0] in COMPRESSED_TYPES + ("ivf_pq",)
@@ -0,0 +1,75 @@
+import faiss # type: ignore
+import numpy as np
+
+from paper.models import Paper
+from paper.utils.index_factory import index_config, search_parameters
+from paper.utils.vectors import from_bytes
+
+
+class IndexValidationError(ValueError):
+    pass
+
+
+# Sanity checks a new base index must pass before it replaces the one
+# being served: consistent sizes, a sorted id map, the serving dimension,
+# no sudden shrink, and stored papers finding themselves again.
+# Raises IndexValidationError with the reason.
+def validate_index(new_index, ids, attributes=None, exact_vectors=None, current=None, config=None):
+    config = config or index_config()
+
+    if new_index is None or not new_index.ntotal:
+        raise IndexValidationError("index is empty")
+    if new_index.ntotal != len(ids):
+        raise IndexValidationError(f"index holds {new_index.ntotal} vectors but the id map {len(ids)}")
+    if len(ids) > 1 and not np.all(np.diff(ids) > 0):
+        raise IndexValidationError("id map is not strictly increasing")
+    if attributes is not None and len(attributes) != len(ids):
+        raise IndexValidationError(f"filter attributes cover {len(attributes)} of {len(ids)} papers")
+    if exact_vectors is not None and exact_vectors.shape != (new_index.ntotal, new_index.d):
+        raise IndexValidationError(f"exact vectors have shape {exact_vectors.shape}")
+
+    if current is not None:
+        if current.d != new_index.d:
+            raise IndexValidationError(f"dimension {new_index.d} does not match the serving {current.d}")
+        if new_index.ntotal < config["VALIDATE_MIN_SIZE_RATIO"] * current.ntotal:
+            raise IndexValidationError(
+                f"{new_index.ntotal} vectors is much smaller than the serving {current.ntotal}"
+            )
+
+    recall = probe_recall(new_index, ids, config["VALIDATE_PROBES"], config)
+    if recall is not None and recall < config["VALIDATE_MIN_RECALL"]:
+        raise IndexValidationError(f"self recall {recall:.2f} is below {config['VALIDATE_MIN_RECALL']}")
+
+
+# Share of sampled papers whose stored embedding finds them again in the
+# top 10. A probe hidden only behind exact ties (a top 10 of identical
+# scores) counts as found. None when no probe could be read.
+def probe_recall(new_index, ids, probes=32, config=None, k=10):
+    if not probes:
+        return None
+
+    rng = np.random.default_rng(len(ids))
+    positions = np.unique(rng.integers(0, len(ids), min(probes, len(ids))))
+
+    blobs = dict(
+        Paper.objects
+        .filter(id__in=[int(ids[pos]) for pos in positions], embedding__isnull=False)
+        .values_list("id", "embedding")
+    )
+    positions = [pos for pos in positions if int(ids[pos]) in blobs]
+    if not positions:
+        return None
+
+    queries = np.vstack([from_bytes(blobs[int(ids[pos])]) for pos in positions]).astype("float32")
+    if queries.shape[1] != new_index.d:
+        raise IndexValidationError(f"stored embeddings have dimension {queries.shape[1]}, index {new_index.d}")
+    faiss.normalize_L2(queries)
+
+    scores, indices = new_index.search(queries, k, params=search_parameters(new_index, config=config))
+
+    found = 0
+    for pos, row_scores, row_indices in zip(positions, scores, indices):
+        if pos in row_indices or (row_indices[-1] >= 0 and np.isclose(row_scores[-1], row_scores[0])):
+            found += 1
+
+    return found / len(positions)
@@ -1,13 +1,15 @@
+# Legacy sklearn similarity search, kept for comparison with FAISS
+# (see the benchmark_search command). It used to live in paper/utils.py,
+# which the paper/utils/ package shadowed, so it could never be imported.
 import numpy as np
-from sentence_transformers import SentenceTransformer # type: ignore
 from sklearn.metrics.pairwise import cosine_similarity
-from .models import Paper
+from paper.models import Paper
+from paper.utils.encoders import get_model
+from paper.utils.vectors import to_matrix
 
-# Load model once when Django starts (fast)
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
 
 def generate_embedding(text):
-    return model.encode(text).tolist()
+    return get_model().encode(text).astype("float32")
 
 def get_similar_papers(user_embedding, top_n=10):
     # Convert to array for cosine similarity
@@ -20,11 +22,11 @@ def get_similar_papers(user_embedding, top_n=10):
     paper_embeddings = []
     paper_ids = []
 
-    for paper in papers:
-        paper_embeddings.append(paper.embedding)
-        paper_ids.append(paper.id)
+    for pk, blob in papers.values_list("id", "embedding"):
+        paper_embeddings.append(blob)
+        paper_ids.append(pk)
 
-    paper_embeddings = np.array(paper_embeddings)
+    paper_embeddings = to_matrix(paper_embeddings)
 
     scores = cosine_similarity(user_vec, paper_embeddings)[0]
 
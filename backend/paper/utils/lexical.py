@@ -0,0 +1,97 @@
+import logging
+import re
+
+from django.db import connection
+from django.db.models import Q
+from paper.models import Paper
+from paper.utils.search_filters import filter_sql, paper_matches
+
+# SQLite: FTS5 table over paper_paper, created with its sync triggers by
+# migration 0004
+FTS_TABLE = "paper_paper_fts"
+
+# PostgreSQL: the expression migration 0004 put a GIN index on, the query
+# must use it verbatim for the index to apply
+POSTGRES_DOCUMENT = "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(abstract, ''))"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+_fts_table_exists = False
+
+
+# Whether the FTS5 table of migration 0004 exists. Only a positive answer
+# is remembered, so a later `migrate` is picked up without a restart.
+def _sqlite_fts_available():
+    global _fts_table_exists
+
+    if not _fts_table_exists:
+        with connection.cursor() as cursor:
+            _fts_table_exists = FTS_TABLE in connection.introspection.table_names(cursor)
+        if not _fts_table_exists:
+            logger.warning("%s is missing (run migrate), keyword search falls back to an unranked scan", FTS_TABLE)
+
+    return _fts_table_exists
+
+
+# Ranked keyword search over title + abstract. Returns [(Paper.id, score)]
+# best first, higher scores are better (BM25 on SQLite, ts_rank on Postgres).
+# `filters` restricts results by category / publication year.
+def keyword_search(query, limit=20, filters=None):
+    terms = _TOKEN.findall(query.lower())
+    if not terms:
+        return []
+
+    where, where_params = filter_sql(filters)
+    where = f" AND {where}" if where else ""
+
+    if connection.vendor == "sqlite" and _sqlite_fts_available():
+        # Quote every term so user input can never be read as FTS5 syntax
+        match = " OR ".join(f'"{term}"' for term in terms)
+        sql = (
+            f"SELECT {FTS_TABLE}.rowid, bm25({FTS_TABLE}, 2.0, 1.0) AS rank FROM {FTS_TABLE} "
+            f"JOIN paper_paper ON paper_paper.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s{where} ORDER BY rank LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *where_params, limit])
+            # bm25() is negative, lower is better
+            return [(pk, -rank) for pk, rank in cursor.fetchall()]
+
+    elif connection.vendor == "postgresql":
+        sql = (
+            f"SELECT id, ts_rank({POSTGRES_DOCUMENT}, query) AS rank "
+            f"FROM paper_paper, websearch_to_tsquery('english', %s) query "
+            f"WHERE {POSTGRES_DOCUMENT} @@ query{where} ORDER BY rank DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [" or ".join(terms), *where_params, limit])
+            return [(pk, float(rank)) for pk, rank in cursor.fetchall()]
+
+    # Unindexed fallback for other databases (or SQLite before the FTS
+    # migration): unranked substring match
+    papers = Paper.objects.filter(
+        Q(title__icontains=query) |
+        Q(abstract__icontains=query)
+    )
+    if filters:
+        if filters["categories"]:
+            categories = Q()
+            for category in filters["categories"]:
+                categories |= Q(categories__icontains=category)
+            papers = papers.filter(categories)
+        if filters["year_from"] is not None:
+            papers = papers.filter(publication_year__gte=filters["year_from"])
+        if filters["year_to"] is not None:
+            papers = papers.filter(publication_year__lte=filters["year_to"])
+
+    results = []
+    for pk, categories, year in papers.values_list("id", "categories", "publication_year").iterator():
+        # icontains also matches substrings (cs.L in cs.LG), keep exact categories only
+        if filters and not paper_matches(filters, categories, year):
+            continue
+        results.append((pk, 1.0))
+        if len(results) == limit:
+            break
+    return results
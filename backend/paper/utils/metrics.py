@@ -0,0 +1,254 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger("papyrus.timing")
+
+# Latency buckets in seconds, 1 ms to 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_registry = []
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    # Prometheus style histogram (cumulative buckets, sum and count) per
+    # label combination. Values are per process.
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        slot = bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+
+        for key, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _label_text(self.labels, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "papyrus_stage_seconds", "Time spent in each stage of an instrumented view", labels=("view", "stage")
+)
+REQUEST_SECONDS = Histogram(
+    "papyrus_request_seconds", "Total time of instrumented views", labels=("view", "status")
+)
+ENCODE_SECONDS = Histogram("papyrus_encode_seconds", "Embedding model forward pass latency")
+ENCODE_BATCH_SIZE = Histogram(
+    "papyrus_encode_batch_size", "Texts per embedding model forward pass", buckets=BATCH_BUCKETS
+)
+SEARCH_SECONDS = Histogram(
+    "papyrus_search_seconds", "FAISS search latency per call", labels=("mode", "filtered")
+)
+SEARCH_BATCH_SIZE = Histogram(
+    "papyrus_search_batch_size", "Query vectors per FAISS search call", buckets=BATCH_BUCKETS
+)
+
+
+def timing_config():
+    config = {"ENABLED": True, "LOG": True, "LOG_SLOWER_THAN_MS": 500}
+    config.update(getattr(settings, "REQUEST_TIMING", {}))
+    return config
+
+
+class StageTimer:
+    # Durations of the named stages of one request, reported as a
+    # Server-Timing header, a structured log line and STAGE_SECONDS
+
+    def __init__(self, view=None):
+        self.view = view
+        self.stages = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # Thread safe, so stages running on executor threads can report too
+    def record(self, name, seconds):
+        with self._lock:
+            self.stages.append((name, seconds))
+        if self.view:
+            STAGE_SECONDS.observe(seconds, view=self.view, stage=name)
+
+    def server_timing(self, total):
+        with self._lock:
+            stages = list(self.stages)
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    # Add the header, log and record the total once the response is ready
+    def finish(self, request, response):
+        if not self.view:
+            return response
+
+        total = time.perf_counter() - self.started
+        response["Server-Timing"] = self.server_timing(total)
+        REQUEST_SECONDS.observe(total, view=self.view, status=response.status_code)
+
+        config = timing_config()
+        if config["LOG"] and total * 1000 >= config["LOG_SLOWER_THAN_MS"]:
+            with self._lock:
+                stages = {name: round(seconds * 1000, 3) for name, seconds in self.stages}
+            logger.info(json.dumps({
+                "event": "request_timing",
+                "view": self.view,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "total_ms": round(total * 1000, 3),
+                "stages_ms": stages,
+                "pid": os.getpid(),
+            }))
+
+        return response
+
+
+# Timer of the current request (set by StageTimingMiddleware) named after
+# `view`. Without the middleware a detached timer is returned, so views
+# can time stages unconditionally.
+def stage_timer(request, view):
+    timer = getattr(request, "stage_timer", None)
+    if timer is None:
+        return StageTimer()
+    timer.view = view
+    return timer
+
+
+def _gauge(name, documentation, samples, kind="gauge"):
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_label_text(labels.keys(), labels.values())} {_number(value)}")
+    return lines
+
+
+# Current values read at scrape time: index size and version, cache and
+# executor state
+def _state_lines():
+    from paper.utils.embedding_cache import get_embedding_cache
+    from paper.utils.embeddings import get_batcher
+    from paper.utils.executor import get_executor
+    from paper.utils.faiss_index import index_stats
+    from paper.utils.hydration import get_paper_cache
+
+    lines = []
+
+    stats = index_stats()
+    shards = stats.get("shards") or [stats]
+    index_samples = [
+        ({"shard": str(s["shard"])} if s.get("shard") is not None else {}, s)
+        for s in shards if "error" not in s
+    ]
+    lines += _gauge("papyrus_index_vectors", "Vectors in the base index",
+                    [(labels, s["ntotal"]) for labels, s in index_samples])
+    lines += _gauge("papyrus_index_delta_vectors", "Vectors in the incremental delta index",
+                    [(labels, s["delta"]) for labels, s in index_samples])
+    lines += _gauge("papyrus_index_version", "Snapshot version being served (0 for an in-memory build)",
+                    [(labels, s["version"] or 0) for labels, s in index_samples])
+    lines += _gauge("papyrus_index_last_change_id", "Last change log entry applied to the index",
+                    [(labels, s["last_change_id"]) for labels, s in index_samples])
+    lines += _gauge("papyrus_index_info", "Index type being served",
+                    [({**labels, "type": s["index_type"] or "none"}, 1) for labels, s in index_samples])
+
+    caches = []
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is not None:
+        caches.append(("embedding", embedding_cache.stats()))
+    caches.append(("paper", get_paper_cache().stats()))
+
+    lines += _gauge("papyrus_cache_hits_total", "Cache lookups answered from the cache",
+                    [({"cache": name}, s["hits"] + s.get("shared_hits", 0)) for name, s in caches], "counter")
+    lines += _gauge("papyrus_cache_misses_total", "Cache lookups that missed",
+                    [({"cache": name}, s["misses"]) for name, s in caches], "counter")
+    lines += _gauge("papyrus_cache_hit_ratio", "Share of cache lookups that hit since the process started",
+                    [({"cache": name}, s["hit_rate"]) for name, s in caches])
+    lines += _gauge("papyrus_cache_entries", "Entries held in the cache",
+                    [({"cache": name}, s["size"]) for name, s in caches])
+
+    batcher = get_batcher()
+    if batcher is not None:
+        lines += _gauge("papyrus_encoder_queue_depth", "Texts waiting for the batching encoder",
+                        [({}, batcher.stats()["queued"])])
+
+    executor = get_executor().stats()
+    lines += _gauge("papyrus_executor_queue_depth", "Async view jobs waiting for a worker thread",
+                    [({}, executor["queue_depth"])])
+    lines += _gauge("papyrus_executor_rejected_total", "Async view jobs rejected with 503",
+                    [({}, executor["rejected"])], "counter")
+
+    return lines
+
+
+# Every metric of this process in the Prometheus text format
+def render_metrics():
+    lines = []
+    for histogram in _registry:
+        lines += histogram.render()
+    lines += _state_lines()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,107 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+from django.db import connections
+
+_DONE = object()
+
+
+# Run `source` and every stage in its own thread, connected by bounded
+# queues, so reading, encoding and writing overlap while memory stays flat.
+# Each stage takes the previous stage's output, the last stage's return
+# value is dropped. The first error stops the pipeline and is re-raised.
+def run_pipeline(source, stages, queue_size=2):
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    errors = []
+    abort = threading.Event()
+
+    def fail(e):
+        errors.append(e)
+        abort.set()
+
+    def produce():
+        try:
+            for item in source:
+                if abort.is_set():
+                    break
+                queues[0].put(item)
+        except Exception as e:
+            fail(e)
+        finally:
+            queues[0].put(_DONE)
+            connections.close_all()
+
+    def consume(position, stage):
+        inbox = queues[position]
+        outbox = queues[position + 1] if position + 1 < len(queues) else None
+
+        try:
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+
+                # After a failure keep draining so upstream threads never block
+                if abort.is_set():
+                    continue
+
+                try:
+                    result = stage(item)
+                except Exception as e:
+                    fail(e)
+                    continue
+
+                if outbox is not None:
+                    outbox.put(result)
+        finally:
+            if outbox is not None:
+                outbox.put(_DONE)
+            connections.close_all()
+
+    threads = [threading.Thread(target=produce, name="pipeline-source", daemon=True)]
+    for position, stage in enumerate(stages):
+        threads.append(threading.Thread(
+            target=consume, args=(position, stage), name=f"pipeline-stage-{position}", daemon=True
+        ))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+# pool.imap with backpressure: at most `window` items of `items` are read
+# and submitted ahead of the consumer, results come back in input order.
+# (imap reads its whole input eagerly, so a slow writer lets the parsed
+# chunks of a large dump pile up in memory.)
+def bounded_imap(pool, func, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+# Small JSON progress files used to resume long running commands
+def read_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(path, **state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
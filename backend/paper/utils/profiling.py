@@ -0,0 +1,232 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+# Defaults for settings.REQUEST_PROFILING, any key can be overridden there
+DEFAULTS = {
+    "ENABLED": False,               # off removes the middleware entirely
+    "HEADER": "X-Profile",          # send it to profile one request
+    "TOKEN": None,                  # header value required, None lets staff users trigger it
+    "SAMPLE_RATE": 0.0,             # share of requests profiled without the header
+    "VIEWS": ["PaperViewSet", "UserUploadViewSet"],
+    "DIR": "profiles",              # under MEDIA_ROOT
+    "KEEP": 100,                    # newest profiles kept on disk
+    "MAX_CONCURRENT": 1,            # profiled requests at once per process, others run normally
+    "MAX_QUERIES": 1000,            # SQL statements recorded per profile
+    "TOP_FUNCTIONS": 40,            # rows of the cumulative time table in the summary
+}
+
+# Profile names as written by save_profile (older ones have no
+# microseconds), anything else is rejected
+PROFILE_NAME = re.compile(r"^[0-9]{8}T[0-9]{6}([0-9]{6})?-[\w-]+-[0-9a-f]{8}$")
+
+
+def profiling_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, "REQUEST_PROFILING", {}))
+    return config
+
+
+def profile_dir(config=None):
+    config = config or profiling_config()
+    return os.path.join(str(settings.MEDIA_ROOT), config["DIR"])
+
+
+# Whether this request asked for (or was sampled into) a profile. The
+# header needs TOKEN as its value, or a staff user when no TOKEN is set.
+def wants_profile(request, config):
+    value = request.headers.get(config["HEADER"])
+    if value:
+        if config["TOKEN"]:
+            return value == config["TOKEN"]
+        user = getattr(request, "user", None)
+        return bool(user is not None and user.is_staff)
+
+    return config["SAMPLE_RATE"] > 0 and random.random() < config["SAMPLE_RATE"]
+
+
+class QueryRecorder:
+    # connection.execute_wrapper hook keeping the SQL, duration and
+    # outcome of every statement run while the profile is recorded
+
+    def __init__(self, alias, limit=1000):
+        self.alias = alias
+        self.limit = limit
+        self.queries = []
+        self.total = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        error = None
+        try:
+            return execute(sql, params, many, context)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.total += 1
+            self.seconds += duration
+            if len(self.queries) < self.limit:
+                self.queries.append({
+                    "database": self.alias,
+                    "sql": sql,
+                    "many": many,
+                    "ms": round(duration * 1000, 3),
+                    **({"error": error} if error else {}),
+                })
+
+
+class RequestProfile:
+    # cProfile plus the ORM queries of one request, run in the thread
+    # that executes the view. cProfile only sees that thread: with
+    # ENCODER_BATCHING on, the model runs on the batching encoder's thread
+    # and encode shows up as time waiting in Future.result (the stage
+    # timer's "encode" entry), not as model functions. Work on the async
+    # views' executor threads is invisible for the same reason.
+
+    def __init__(self, config):
+        self.config = config
+        self.profiler = cProfile.Profile()
+        self.recorders = [QueryRecorder(alias, config["MAX_QUERIES"]) for alias in connections]
+        self.started_at = datetime.now(timezone.utc)
+        self.seconds = 0.0
+
+    @contextmanager
+    def record(self):
+        with _wrappers(self.recorders):
+            start = time.perf_counter()
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+                self.seconds += time.perf_counter() - start
+
+    def queries(self):
+        return [query for recorder in self.recorders for query in recorder.queries]
+
+    # Duplicate statements first, the usual sign of an N+1 pattern
+    def repeated_queries(self, limit=10):
+        counts = {}
+        for query in self.queries():
+            entry = counts.setdefault(query["sql"], [0, 0.0])
+            entry[0] += 1
+            entry[1] += query["ms"]
+        repeated = [
+            {"sql": sql, "count": count, "ms": round(ms, 3)}
+            for sql, (count, ms) in counts.items() if count > 1
+        ]
+        return sorted(repeated, key=lambda item: (-item["count"], -item["ms"]))[:limit]
+
+    def top_functions(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.config["TOP_FUNCTIONS"])
+        return out.getvalue()
+
+    def summary(self, request, response, view):
+        return {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view,
+            "status": response.status_code,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round(self.seconds * 1000, 3),
+            "query_count": sum(recorder.total for recorder in self.recorders),
+            "query_ms": round(sum(recorder.seconds for recorder in self.recorders) * 1000, 3),
+            "repeated_queries": self.repeated_queries(),
+            "queries": self.queries(),
+            "top_functions": self.top_functions(),
+            "pid": os.getpid(),
+        }
+
+
+@contextmanager
+def _wrappers(recorders):
+    if not recorders:
+        yield
+        return
+    with connections[recorders[0].alias].execute_wrapper(recorders[0]):
+        with _wrappers(recorders[1:]):
+            yield
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+# Non-blocking: False when MAX_CONCURRENT profiles are already running
+def acquire_slot(config):
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, config["MAX_CONCURRENT"]))
+    return _slots.acquire(blocking=False)
+
+
+def release_slot():
+    _slots.release()
+
+
+# Write <name>.prof (pstats, for snakeviz / pstats.Stats) and <name>.json
+# (request, SQL and the top functions) and prune old profiles. Returns name.
+def save_profile(profile, request, response, view):
+    config = profile.config
+    root = profile_dir(config)
+    os.makedirs(root, exist_ok=True)
+
+    label = re.sub(r"[^\w-]+", "-", view).strip("-") or "view"
+    # Microseconds keep names in start order, pruning relies on it
+    name = f"{profile.started_at:%Y%m%dT%H%M%S%f}-{label}-{uuid.uuid4().hex[:8]}"
+
+    profile.profiler.dump_stats(os.path.join(root, f"{name}.prof"))
+
+    summary = {"name": name, **profile.summary(request, response, view)}
+    tmp = os.path.join(root, f".{name}.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent=1, default=str)
+    os.replace(tmp, os.path.join(root, f"{name}.json"))
+
+    _prune(root, config["KEEP"])
+    return name
+
+
+def _prune(root, keep):
+    names = sorted(list_profiles(root), reverse=True)
+    for name in names[keep:]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(root, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+# Profile names, oldest first
+def list_profiles(root=None):
+    root = root or profile_dir()
+    if not os.path.isdir(root):
+        return []
+    names = (entry[:-len(".json")] for entry in os.listdir(root) if entry.endswith(".json"))
+    return sorted(name for name in names if PROFILE_NAME.match(name))
+
+
+# Path of one artifact ("json" or "prof"), None for unknown names
+def profile_path(name, kind="json"):
+    if not PROFILE_NAME.match(name) or kind not in ("json", "prof"):
+        return None
+    path = os.path.join(profile_dir(), f"{name}.{kind}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,56 @@
+from paper.models import UserUpload
+from paper.utils.embeddings import generate_embeddings
+from paper.utils.faiss_index import search_similar_papers_batch
+from paper.utils.hydration import hydrate_papers
+from paper.utils.vectors import to_bytes
+
+
+# Recommendations for a list of uploads ({"abstract", "title", "authors",
+# "categories"}): one batched encode, one FAISS matrix search, one bulk
+# insert and one hydration query. Returns one result per upload, in order.
+def recommend_batch(items, top_n=12, filters=None, offset=0):
+    embeddings = generate_embeddings([item["abstract"] for item in items])
+
+    uploads = UserUpload.objects.bulk_create([
+        UserUpload(
+            abstract=item["abstract"],
+            title=item.get("title"),
+            authors=item.get("authors"),
+            categories=item.get("categories"),
+            embedding=to_bytes(embedding),
+        )
+        for item, embedding in zip(items, embeddings)
+    ])
+
+    similar = search_similar_papers_batch(embeddings, top_n=top_n, filters=filters)
+
+    # Papers shared between uploads are fetched (and serialized) once
+    papers = {
+        paper["id"]: paper
+        for paper in hydrate_papers(dict.fromkeys(
+            item["paper_id"] for hits in similar for item in hits
+        ))
+    }
+
+    results = []
+    for position, (upload, hits) in enumerate(zip(uploads, similar)):
+        recommendations = []
+        for item in hits:
+            paper = papers.get(item["paper_id"])
+            if paper is not None:
+                recommendations.append({**paper, "similarity": item["score"]})
+
+        results.append({
+            "index": offset + position,
+            "user_upload_id": str(upload.upload_id),
+            "results": recommendations,
+        })
+
+    return results
+
+
+# Same as recommend_batch, `chunk_size` uploads at a time, so callers can
+# stream the first results while later chunks are still being encoded
+def iter_recommendations(items, top_n=12, filters=None, chunk_size=64):
+    for start in range(0, len(items), chunk_size):
+        yield from recommend_batch(items[start:start + chunk_size], top_n, filters, offset=start)
@@ -0,0 +1,179 @@
+import numpy as np
+
+FILTERS_FILE = "filters.npz"
+
+
+# arXiv stores categories as one space separated string ("cs.LG stat.ML")
+def split_categories(value):
+    return value.split() if value else []
+
+
+# Read `categories` and `year_from` / `year_to` from query params or a
+# request body. Categories may be repeated or comma separated, a paper
+# matches when it has any of them. Returns None when nothing is filtered,
+# raises ValueError on malformed values.
+def parse_search_filters(params):
+    if hasattr(params, "getlist"):
+        raw = params.getlist("categories")
+    else:
+        raw = params.get("categories") or []
+        if isinstance(raw, str):
+            raw = [raw]
+
+    categories = []
+    for value in raw:
+        for category in str(value).replace(",", " ").split():
+            if category not in categories:
+                categories.append(category)
+
+    year_from = params.get("year_from")
+    year_to = params.get("year_to")
+    year_from = int(year_from) if year_from not in (None, "") else None
+    year_to = int(year_to) if year_to not in (None, "") else None
+
+    if not categories and year_from is None and year_to is None:
+        return None
+
+    return {
+        "categories": tuple(categories),
+        "year_from": year_from,
+        "year_to": year_to,
+    }
+
+
+# Same test for a single paper, used for vectors outside the base index
+def paper_matches(filters, categories, year):
+    if filters["categories"] and not set(filters["categories"]) & set(split_categories(categories)):
+        return False
+    if filters["year_from"] is not None and (year is None or year < filters["year_from"]):
+        return False
+    if filters["year_to"] is not None and (year is None or year > filters["year_to"]):
+        return False
+    return True
+
+
+# Categories are matched literally, LIKE wildcards in them are escaped
+def _like_literal(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# SQL condition on paper_paper columns, returns (sql, params) or ("", [])
+def filter_sql(filters, table="paper_paper"):
+    if not filters:
+        return "", []
+
+    clauses = []
+    params = []
+
+    if filters["categories"]:
+        clauses.append("(" + " OR ".join(
+            f"(' ' || {table}.categories || ' ') LIKE %s ESCAPE '\\'" for _ in filters["categories"]
+        ) + ")")
+        params.extend(f"% {_like_literal(category)} %" for category in filters["categories"])
+    if filters["year_from"] is not None:
+        clauses.append(f"{table}.publication_year >= %s")
+        params.append(filters["year_from"])
+    if filters["year_to"] is not None:
+        clauses.append(f"{table}.publication_year <= %s")
+        params.append(filters["year_to"])
+
+    return " AND ".join(clauses), params
+
+
+class FilterAttributes:
+    # Filterable attributes of the papers in a base index, by index position:
+    # a publication year array and, per category, the sorted positions of
+    # the papers carrying it (a posting list). Masks for a filter are built
+    # from these with a few vectorised numpy operations.
+
+    def __init__(self, years, names, offsets, positions):
+        self.years = years            # int16, 0 when unknown
+        self.names = list(names)      # category names
+        self.offsets = offsets        # postings of names[i] are positions[offsets[i]:offsets[i + 1]]
+        self.positions = positions
+
+        self._slot = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.years)
+
+    # rows: (categories, publication_year) in index position order
+    @classmethod
+    def from_rows(cls, rows):
+        years = []
+        postings = {}
+
+        for position, (categories, year) in enumerate(rows):
+            years.append(year or 0)
+            for category in split_categories(categories):
+                postings.setdefault(category, []).append(position)
+
+        names = sorted(postings)
+        counts = [len(postings[name]) for name in names]
+        offsets = np.zeros(len(names) + 1, dtype="int64")
+        np.cumsum(counts, out=offsets[1:])
+        positions = np.fromiter(
+            (position for name in names for position in postings[name]),
+            dtype="int32", count=int(offsets[-1]),
+        )
+
+        return cls(np.asarray(years, dtype="int16"), names, offsets, positions)
+
+    # Attributes for rows appended after the current ones
+    def extend(self, rows):
+        return FilterAttributes.concatenate([self, FilterAttributes.from_rows(rows)])
+
+    # Join attributes of consecutive position ranges (e.g. build chunks)
+    @classmethod
+    def concatenate(cls, parts):
+        shifts = np.cumsum([0] + [len(part) for part in parts[:-1]])
+
+        postings = {}
+        for part, shift in zip(parts, shifts):
+            for name in part.names:
+                postings.setdefault(name, []).append((part.postings(name) + shift).astype("int32"))
+
+        names = sorted(postings)
+        merged = [np.concatenate(postings[name]) for name in names]
+        offsets = np.zeros(len(names) + 1, dtype="int64")
+        np.cumsum([len(positions) for positions in merged], out=offsets[1:])
+        positions = np.concatenate(merged) if merged else np.empty(0, dtype="int32")
+
+        years = np.concatenate([part.years for part in parts]) if parts else np.empty(0, dtype="int16")
+        return cls(years, names, offsets, positions)
+
+    def postings(self, name):
+        slot = self._slot.get(name)
+        if slot is None:
+            return np.empty(0, dtype="int32")
+        return self.positions[self.offsets[slot]:self.offsets[slot + 1]]
+
+    # Boolean array over index positions, True where the paper matches
+    def mask(self, filters):
+        if filters["categories"]:
+            mask = np.zeros(len(self), dtype=bool)
+            for category in filters["categories"]:
+                mask[self.postings(category)] = True
+        else:
+            mask = np.ones(len(self), dtype=bool)
+
+        if filters["year_from"] is not None:
+            mask &= self.years >= filters["year_from"]
+        if filters["year_to"] is not None:
+            mask &= (self.years <= filters["year_to"]) & (self.years > 0)
+
+        return mask
+
+    def save(self, path):
+        np.savez(
+            path,
+            years=self.years,
+            names=np.asarray(self.names, dtype="U"),
+            offsets=self.offsets,
+            positions=self.positions,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["years"], data["names"].tolist(), data["offsets"], data["positions"])
@@ -0,0 +1,306 @@
+import heapq
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from paper.utils.search_filters import split_categories
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.FAISS_SHARDS, any key can be overridden there
+DEFAULTS = {
+    "COUNT": 0,                 # 0 keeps the single in-process index
+    "STRATEGY": "hash",         # "hash" (Paper.id) or "category" (primary category)
+    "ADDRESSES": [],            # one per shard, empty uses unix sockets in FAISS_INDEX_DIR
+    "TIMEOUT": 2.0,             # seconds per shard request
+    "ALLOW_PARTIAL": True,      # answer from the remaining shards when one fails
+    "MAX_WORKERS": None,        # coordinator threads, None picks 4 per shard
+}
+
+STRATEGIES = ("hash", "category")
+
+# Frame: (header length, payload length) then a JSON header and raw bytes
+_FRAME = struct.Struct(">II")
+
+
+def shard_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, "FAISS_SHARDS", {}))
+
+    if config["STRATEGY"] not in STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {config['STRATEGY']}")
+
+    return config
+
+
+# Shard owning a paper. "category" keeps a primary category on one shard,
+# papers without categories land on shard 0.
+def shard_of(pk, categories, count, strategy="hash"):
+    if strategy == "category":
+        names = split_categories(categories)
+        return zlib.crc32(names[0].encode()) % count if names else 0
+    return pk % count
+
+
+def shard_addresses(config=None):
+    config = config or shard_config()
+    if config["ADDRESSES"]:
+        return list(config["ADDRESSES"])
+
+    root = getattr(settings, "FAISS_INDEX_DIR", os.path.join(settings.BASE_DIR, "indexes"))
+    return [f"unix:{os.path.join(str(root), f'shard-{number:02d}.sock')}" for number in range(config["COUNT"])]
+
+
+# "unix:/run/papyrus/shard-00.sock" or "host:port"
+def parse_address(address):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(sock, header, payload=b""):
+    body = json.dumps(header).encode()
+    sock.sendall(_FRAME.pack(len(body), len(payload)) + body + payload)
+
+
+# Returns (header, payload), or (None, None) once the peer has closed
+def recv_message(sock):
+    frame = _recv_exact(sock, _FRAME.size)
+    if frame is None:
+        return None, None
+
+    size, payload_size = _FRAME.unpack(frame)
+    body = _recv_exact(sock, size)
+    payload = _recv_exact(sock, payload_size) if payload_size else b""
+    if body is None or payload is None:
+        return None, None
+
+    return json.loads(body), payload
+
+
+def _encode_filters(filters):
+    return None if filters is None else {**filters, "categories": list(filters["categories"])}
+
+
+def _decode_filters(filters):
+    return None if filters is None else {**filters, "categories": tuple(filters["categories"])}
+
+
+class ShardClient:
+    # Connection pool to one shard server. Searches are idempotent, so a
+    # pooled connection the server has since closed is retried once on a
+    # fresh one.
+
+    def __init__(self, address, timeout=2.0):
+        self.address = address
+        self.timeout = timeout
+        self.generation = None   # index generation the shard last answered from
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        family, target = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect(target)
+        return sock
+
+    def request(self, header, payload=b""):
+        for attempt in range(2):
+            with self._lock:
+                sock = self._idle.pop() if self._idle and not attempt else None
+            pooled = sock is not None
+            sock = sock or self._connect()
+
+            try:
+                send_message(sock, header, payload)
+                response, data = recv_message(sock)
+                if response is None:
+                    raise ConnectionError(f"shard {self.address} closed the connection")
+            except socket.timeout:
+                sock.close()
+                raise
+            except OSError:
+                sock.close()
+                if pooled and not attempt:
+                    continue
+                raise
+
+            with self._lock:
+                self._idle.append(sock)
+
+            if "error" in response:
+                raise RuntimeError(f"shard {self.address}: {response['error']}")
+            return response, data
+
+    # (ids, scores) arrays of shape (queries, top_n), -1 / -inf padded
+    def search(self, query_vectors, top_n, filters=None):
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        response, data = self.request(
+            {"op": "search", "top_n": top_n, "filters": _encode_filters(filters), "shape": list(query_vectors.shape)},
+            query_vectors.tobytes(),
+        )
+
+        self.generation = response.get("generation")
+        rows, k = response["shape"]
+        ids = np.frombuffer(data, dtype="int64", count=rows * k).reshape(rows, k)
+        scores = np.frombuffer(data, dtype="float32", offset=rows * k * 8).reshape(rows, k)
+        return ids, scores
+
+    def stats(self):
+        return self.request({"op": "stats"})[0]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+
+_clients = None
+_pool = None
+_clients_lock = threading.Lock()
+
+
+def get_shard_clients():
+    global _clients, _pool
+
+    with _clients_lock:
+        if _clients is None:
+            config = shard_config()
+            _clients = [ShardClient(address, config["TIMEOUT"]) for address in shard_addresses(config)]
+            _pool = ThreadPoolExecutor(
+                max_workers=config["MAX_WORKERS"] or 4 * max(1, len(_clients)),
+                thread_name_prefix="faiss-shard",
+            )
+        return _clients
+
+
+# Scatter the queries to every shard and merge the per-shard top-k by
+# score. Shards hold disjoint papers, so the merge is exact.
+def search_shards(query_vectors, top_n, filters=None):
+    clients = get_shard_clients()
+    config = shard_config()
+
+    futures = [(client, _pool.submit(client.search, query_vectors, top_n, filters)) for client in clients]
+
+    answers = []
+    for client, future in futures:
+        try:
+            answers.append(future.result())
+        except Exception as exc:
+            if not config["ALLOW_PARTIAL"]:
+                raise RuntimeError(f"FAISS shard {client.address} failed: {exc}") from exc
+            logger.warning("FAISS shard %s failed, results are partial: %s", client.address, exc)
+
+    if not answers:
+        raise RuntimeError("No FAISS shard answered")
+
+    results = []
+    for row in range(len(query_vectors)):
+        hits = (
+            (float(score), int(pk))
+            for ids, scores in answers
+            for pk, score in zip(ids[row], scores[row])
+            if pk >= 0
+        )
+        results.append([
+            {"paper_id": pk, "score": score}
+            for score, pk in heapq.nlargest(top_n, hits)
+        ])
+
+    return results
+
+
+# Answer one request with this process's (shard) index
+def handle_request(header, payload):
+    from paper.utils import faiss_index
+
+    if header["op"] == "search":
+        rows, dim = header["shape"]
+        top_n = header["top_n"]
+        query_vectors = np.frombuffer(payload, dtype="float32").reshape(rows, dim)
+
+        results = faiss_index.search_similar_papers_batch(query_vectors, top_n, _decode_filters(header["filters"]))
+
+        ids = np.full((rows, top_n), -1, dtype="int64")
+        scores = np.full((rows, top_n), -np.inf, dtype="float32")
+        for row, hits in enumerate(results):
+            for slot, hit in enumerate(hits):
+                ids[row, slot] = hit["paper_id"]
+                scores[row, slot] = hit["score"]
+
+        return {"shape": [rows, top_n], "generation": faiss_index.index_generation()}, ids.tobytes() + scores.tobytes()
+
+    if header["op"] == "stats":
+        return faiss_index.index_stats(), b""
+
+    raise ValueError(f"Unknown op: {header['op']}")
+
+
+class _ShardHandler(socketserver.BaseRequestHandler):
+    # One thread per connection, requests on it are answered in order.
+    # FAISS releases the GIL while searching, so connections run in parallel.
+
+    def handle(self):
+        while True:
+            header, payload = recv_message(self.request)
+            if header is None:
+                return
+
+            try:
+                response, data = handle_request(header, payload)
+            except Exception as exc:
+                response, data = {"error": str(exc)}, b""
+            send_message(self.request, response, data)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Blocking server for the shard index loaded in this process
+def serve_shard(address):
+    family, target = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        if os.path.exists(target):
+            os.remove(target)
+        server = _UnixServer(target, _ShardHandler)
+    else:
+        server = _TCPServer(target, _ShardHandler)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
@@ -0,0 +1,192 @@
+from collections import Counter, defaultdict
+
+import faiss # type: ignore
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from paper.models import Paper, PaperCategory, PaperTopic, Topic, TopicYearCount
+from paper.utils.vectors import from_bytes, to_bytes, to_matrix
+
+
+# Stream (ids, years, normalized float32 matrix) batches of stored
+# embeddings with keyset pagination, only one batch is in memory at a time
+def iter_embeddings(queryset=None, batch_size=5000):
+    queryset = queryset if queryset is not None else Paper.objects.all()
+    queryset = queryset.exclude(embedding__isnull=True)
+
+    last_id = 0
+    while True:
+        rows = list(
+            queryset
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "publication_year", "embedding")[:batch_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        vectors = to_matrix([blob for _, _, blob in rows])
+        faiss.normalize_L2(vectors)
+        yield (
+            np.asarray([pk for pk, _, _ in rows], dtype="int64"),
+            [year for _, year, _ in rows],
+            vectors,
+        )
+
+
+# Spherical k-means over a random sample of the stored embeddings, drawn
+# while streaming. Returns the (k, dim) centroid matrix.
+def train_topics(k, sample_size=200000, niter=20, seed=0, batch_size=5000):
+    total = Paper.objects.exclude(embedding__isnull=True).count()
+    if total < k:
+        raise ValueError(f"{total} embeddings is not enough for {k} topics")
+
+    rng = np.random.default_rng(seed)
+    rate = min(1.0, sample_size / total)
+
+    sample = []
+    for _, _, vectors in iter_embeddings(batch_size=batch_size):
+        keep = rng.random(len(vectors)) < rate
+        sample.append(vectors[keep])
+    sample = np.ascontiguousarray(np.vstack(sample))
+
+    kmeans = faiss.Kmeans(
+        sample.shape[1], k, niter=niter, seed=seed, spherical=True,
+        max_points_per_centroid=max(256, len(sample) // k + 1),
+    )
+    kmeans.train(sample)
+    return kmeans.centroids
+
+
+# Assign papers to their nearest topic. With only_new, papers that already
+# have a topic are left alone (incremental runs after ingestion).
+# Returns the number of papers assigned.
+def assign_topics(only_new=True, batch_size=5000):
+    topics = list(Topic.objects.order_by("number").values_list("id", "centroid"))
+    if not topics:
+        raise ValueError("No topics yet, run build_topics first")
+
+    topic_ids = np.asarray([pk for pk, _ in topics], dtype="int64")
+    centroids = np.vstack([from_bytes(blob) for _, blob in topics])
+    faiss.normalize_L2(centroids)
+
+    index = faiss.IndexFlatIP(centroids.shape[1])
+    index.add(centroids)
+
+    queryset = Paper.objects.all()
+    if only_new:
+        queryset = queryset.filter(topic_link__isnull=True)
+
+    assigned = 0
+    for ids, _, vectors in iter_embeddings(queryset, batch_size):
+        similarities, nearest = index.search(vectors, 1)
+
+        links = [
+            PaperTopic(paper_id=int(pk), topic_id=int(topic_ids[slot]), similarity=float(similarity))
+            for pk, slot, similarity in zip(ids, nearest[:, 0], similarities[:, 0])
+        ]
+        PaperTopic.objects.bulk_create(
+            links, batch_size=1000,
+            update_conflicts=True, unique_fields=["paper"], update_fields=["topic", "similarity"],
+        )
+        assigned += len(links)
+
+    return assigned
+
+
+# Incremental step after new papers are embedded: assign the ones without
+# a topic and refresh the stats. Returns None while no topics are built.
+def assign_new_papers(window=3, batch_size=5000):
+    if not Topic.objects.exists():
+        return None
+    with transaction.atomic():
+        assigned = assign_topics(only_new=True, batch_size=batch_size)
+        refresh_topic_stats(window)
+    return assigned
+
+
+# Replace every topic with a fresh clustering and assign all papers
+def build_topics(k, sample_size=200000, niter=20, seed=0, batch_size=5000, window=3):
+    centroids = train_topics(k, sample_size, niter, seed, batch_size)
+
+    with transaction.atomic():
+        Topic.objects.all().delete()   # cascades to assignments and yearly counts
+        Topic.objects.bulk_create([
+            Topic(number=number, centroid=to_bytes(centroid))
+            for number, centroid in enumerate(centroids)
+        ])
+        assigned = assign_topics(only_new=False, batch_size=batch_size)
+        refresh_topic_stats(window)
+
+    return assigned
+
+
+# Recompute sizes, labels, per-year counts and growth rates from the
+# assignments. Growth compares the last `window` years of the corpus with
+# the `window` years before them, so every topic is measured on the same span.
+def refresh_topic_stats(window=3):
+    counts = defaultdict(dict)
+    rows = (
+        PaperTopic.objects
+        .exclude(paper__publication_year__isnull=True)
+        .values_list("topic_id", "paper__publication_year")
+        .annotate(total=Count("paper_id"))
+    )
+    for topic_id, year, total in rows:
+        counts[topic_id][year] = total
+
+    sizes = dict(PaperTopic.objects.values_list("topic_id").annotate(total=Count("paper_id")))
+    labels = _topic_labels()
+
+    years = [year for per_year in counts.values() for year in per_year]
+    latest = max(years) if years else None
+
+    with transaction.atomic():
+        TopicYearCount.objects.all().delete()
+
+        year_counts = []
+        topics = list(Topic.objects.all())
+        for topic in topics:
+            per_year = counts.get(topic.id, {})
+
+            for year in sorted(per_year):
+                previous = per_year.get(year - 1)
+                year_counts.append(TopicYearCount(
+                    topic=topic, year=year, count=per_year[year],
+                    growth=(per_year[year] - previous) / previous if previous else None,
+                ))
+
+            recent = previous = 0
+            if latest is not None:
+                recent = sum(per_year.get(year, 0) for year in range(latest - window + 1, latest + 1))
+                previous = sum(per_year.get(year, 0) for year in range(latest - 2 * window + 1, latest - window + 1))
+
+            topic.size = sizes.get(topic.id, 0)
+            topic.label = labels.get(topic.id, "")
+            topic.recent_count = recent
+            topic.previous_count = previous
+            topic.growth_rate = (recent - previous) / previous if previous else None
+
+        TopicYearCount.objects.bulk_create(year_counts, batch_size=1000)
+        Topic.objects.bulk_update(
+            topics, ["size", "label", "recent_count", "previous_count", "growth_rate"], batch_size=500
+        )
+
+
+# "cs.LG / stat.ML / cs.AI": the most common categories of each topic's papers
+def _topic_labels(top=3):
+    per_topic = defaultdict(Counter)
+    rows = (
+        PaperCategory.objects
+        .filter(paper__topic_link__isnull=False)
+        .values_list("paper__topic_link__topic_id", "category__name")
+        .annotate(total=Count("id"))
+    )
+    for topic_id, name, total in rows:
+        per_topic[topic_id][name] = total
+
+    return {
+        topic_id: " / ".join(name for name, _ in names.most_common(top))
+        for topic_id, names in per_topic.items()
+    }
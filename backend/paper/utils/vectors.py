@@ -0,0 +1,31 @@
+import numpy as np
+from django.conf import settings
+
+
+# Embeddings are stored as packed little-endian blobs (float32 by default,
+# float16 to halve the column size). Changing EMBEDDING_DTYPE requires
+# re-running generate_embeddings, old blobs are not converted.
+def embedding_dtype():
+    return np.dtype(getattr(settings, "EMBEDDING_DTYPE", "float32")).newbyteorder("<")
+
+
+# Pack a vector (numpy array or list) into bytes for a BinaryField
+def to_bytes(vector):
+    return np.asarray(vector).astype(embedding_dtype(), copy=False).tobytes()
+
+
+# Unpack a single stored blob into a float32 vector
+def from_bytes(blob):
+    return np.frombuffer(blob, dtype=embedding_dtype()).astype("float32")
+
+
+# Unpack many blobs into one (n, dim) float32 matrix without creating
+# Python float objects along the way
+def to_matrix(blobs):
+    blobs = list(blobs)
+    if not blobs:
+        return np.empty((0, 0), dtype="float32")
+
+    buffer = b"".join(blobs)
+    matrix = np.frombuffer(buffer, dtype=embedding_dtype()).reshape(len(blobs), -1)
+    return matrix.astype("float32")
@@ -4,19 +4,47 @@ from .serializers import *
 from rest_framework.decorators import action # type: ignore
 from rest_framework.response import Response # type: ignore
 from rest_framework import status # type: ignore
-# from .utils import generate_embedding, get_similar_papers
+# from paper.utils.legacy import generate_embedding, get_similar_papers
 from paper.utils.embeddings import generate_embedding
-from paper.utils.faiss_index import search_similar_papers
-from django.db.models import Q
-from django.db.models import Count
-from rest_framework.permissions import AllowAny # type: ignore
+from paper.utils.faiss_index import index_generation, index_stats, rebuild_faiss_index, search_similar_papers
+from paper.utils.fusion import annotate_results, reciprocal_rank_fusion
+from paper.utils.hydration import hydrate_papers
+from paper.utils.index_factory import INDEX_TYPES, index_config
+from paper.utils.lexical import keyword_search
+from paper.utils.metrics import render_metrics, stage_timer
+from paper.utils.profiling import list_profiles, profile_path
+from paper.utils.recommend import iter_recommendations, recommend_batch
+from paper.utils.search_filters import parse_search_filters
+from paper.utils.vectors import to_bytes
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from rest_framework.permissions import AllowAny, IsAdminUser # type: ignore
+from rest_framework.settings import api_settings # type: ignore
+from .pagination import KeysetPagination
+from .renderers import NDJSONRenderer
 
 class PaperViewSet(viewsets.ModelViewSet):
-    queryset = Paper.objects.all().order_by('-created_at')
+    queryset = Paper.objects.defer('embedding').order_by('-created_at')
     serializer_class = PaperSerializer
+    pagination_class = KeysetPagination
     search_fields = ['title', 'authors', 'abstract', 'categories', 'journal_ref']
     ordering_fields = ['publication_year', 'created_at']
     permission_classes = [AllowAny]
+
+    # Embed new abstracts on write so the paper shows up in search right away
+    def perform_create(self, serializer):
+        abstract = serializer.validated_data.get("abstract")
+        serializer.save(embedding=to_bytes(generate_embedding(abstract)))
+
+    def perform_update(self, serializer):
+        abstract = serializer.validated_data.get("abstract")
+        if abstract is not None and abstract != serializer.instance.abstract:
+            serializer.save(embedding=to_bytes(generate_embedding(abstract)))
+        else:
+            serializer.save()
     
     @action(detail=False, methods=["get"])
     def search(self, request):
@@ -26,32 +54,44 @@ class PaperViewSet(viewsets.ModelViewSet):
         if not query:
             return Response({"error": "q parameter is required"}, status=400)
 
-        # Step 1: semantic search (FAISS)
-        query_embedding = generate_embedding(query)
-        semantic_results = search_similar_papers(query_embedding, top_n=top_n * 2)
+        # Optional categories / year_from / year_to filters, applied inside both searches
+        try:
+            filters = parse_search_filters(request.query_params)
+        except ValueError:
+            return Response({"error": "year_from and year_to must be integers"}, status=400)
 
-        semantic_ids = [item["paper_id"] for item in semantic_results]
+        # Each step is reported in Server-Timing, the timing log and /metrics
+        timer = stage_timer(request, "paper-search")
 
-        # Step 2: keyword filtering
-        keyword_qs = Paper.objects.filter(
-            Q(title__icontains=query) |
-            Q(abstract__icontains=query)
-        )
+        # Step 1: semantic search (FAISS)
+        with timer.stage("encode"):
+            query_embedding = generate_embedding(query)
+        with timer.stage("faiss"):
+            semantic_results = search_similar_papers(query_embedding, top_n=top_n * 2, filters=filters)
 
-        # Step 3: merge IDs (semantic + keyword)
-        combined_ids = set(semantic_ids) | set(
-            keyword_qs.values_list("id", flat=True)
-        )
+        # Step 2: keyword search (SQLite FTS5 / Postgres full-text index)
+        with timer.stage("keyword"):
+            keyword_results = keyword_search(query, limit=top_n * 2, filters=filters)
 
-        papers = Paper.objects.filter(id__in=combined_ids)[:top_n]
+        # Step 3: merge both rankings with reciprocal rank fusion
+        with timer.stage("fuse"):
+            fused = reciprocal_rank_fusion({
+                "semantic": [(item["paper_id"], item["score"]) for item in semantic_results],
+                "keyword": keyword_results,
+            }, k=getattr(settings, "SEARCH_RRF_K", 60))[:top_n]
 
-        serializer = PaperListSerializer(papers, many=True)
+        # Step 4: one query (or none, when cached) for all result payloads
+        with timer.stage("hydrate"):
+            papers = {p["id"]: p for p in hydrate_papers(item["paper_id"] for item in fused)}
+            results = annotate_results(fused, papers)
 
+        # Clients can tell from the generation when results may have changed
         return Response({
             "query": query,
-            "count": len(serializer.data),
-            "results": serializer.data
-        })
+            "filters": filters,
+            "count": len(results),
+            "results": results
+        }, headers={"X-Index-Generation": index_generation()})
     
     @action(detail=False, methods=["get"])
     def trends(self, request):
@@ -61,34 +101,34 @@ class PaperViewSet(viewsets.ModelViewSet):
             top_n = 12
 
         top_n = max(1, min(top_n, 50))  # safety limit
+        timer = stage_timer(request, "paper-trends")
 
-        # Step 1: find top categories
-        top_categories_qs = (
-            Paper.objects
-            .exclude(categories__isnull=True)
-            .values("categories")
-            .annotate(total=Count("id"))
-            .order_by("-total")[:top_n]
-        )
-
-        top_categories = [row["categories"] for row in top_categories_qs]
+        # Step 1: top categories from the precomputed (category, year) rollup,
+        # a few thousand rows at most whatever the corpus size
+        with timer.stage("top_categories"):
+            top_categories = [
+                row["category__name"]
+                for row in (
+                    CategoryYearCount.objects
+                    .values("category__name")
+                    .annotate(total=Sum("count"))
+                    .order_by("-total", "category__name")[:top_n]
+                )
+            ]
 
         # Step 2: yearly trends
-        qs = (
-            Paper.objects
-            .filter(categories__in=top_categories)
-            .exclude(publication_year__isnull=True)
-            .values("categories", "publication_year")
-            .annotate(count=Count("id"))
-            .order_by("categories", "publication_year")
-        )
+        with timer.stage("yearly_counts"):
+            qs = (
+                CategoryYearCount.objects
+                .filter(category__name__in=top_categories)
+                .values_list("category__name", "year", "count")
+                .order_by("year")
+            )
 
-        trends = {}
+            trends = {category: {} for category in top_categories}
 
-        for row in qs:
-            trends.setdefault(row["categories"], {})[
-                row["publication_year"]
-            ] = row["count"]
+            for category, year, count in qs:
+                trends[category][year] = count
 
         return Response({
             "default_top_n": 10,
@@ -117,35 +157,220 @@ class UserUploadViewSet(viewsets.ModelViewSet):
         if not abstract:
             return Response({"error": "abstract is required"}, status=400)
 
+        # Optional categories / year_from / year_to filters, from the query string or a
+        # "filters" object in the body ("categories" in the body describes the upload itself)
+        try:
+            filters = (
+                parse_search_filters(request.query_params) or
+                parse_search_filters(request.data.get("filters") or {})
+            )
+        except ValueError:
+            return Response({"error": "year_from and year_to must be integers"}, status=400)
+
+        timer = stage_timer(request, "userupload-recommend")
+
         # Step 1: create user upload entry
-        user_upload = UserUpload.objects.create(
-            abstract=abstract,
-            title=request.data.get("title", None),
-            authors=request.data.get("authors", None),
-            categories=request.data.get("categories", None),
-        )
+        with timer.stage("create_upload"):
+            user_upload = UserUpload.objects.create(
+                abstract=abstract,
+                title=request.data.get("title", None),
+                authors=request.data.get("authors", None),
+                categories=request.data.get("categories", None),
+            )
 
         # Step 2: generate embedding
-        embedding = generate_embedding(abstract)
-        user_upload.embedding = embedding
-        user_upload.save()
+        with timer.stage("encode"):
+            embedding = generate_embedding(abstract)
+        with timer.stage("save_embedding"):
+            user_upload.embedding = to_bytes(embedding)
+            user_upload.save(update_fields=["embedding"])
 
         # Step 3: find similar papers
         # similar = get_similar_papers(embedding, top_n=10)
         
         # Using FAISS for similarity search
-        similar = search_similar_papers(embedding, top_n=12)
+        with timer.stage("faiss"):
+            similar = search_similar_papers(embedding, top_n=12, filters=filters)
 
-        # Step 4: fetch Paper objects & attach similarity scores
-        papers = []
-        for item in similar:
-            p = Paper.objects.filter(id=item["paper_id"]).first()
-            if p:
-                paper_data = PaperListSerializer(p).data
-                paper_data["similarity"] = item["score"]
-                papers.append(paper_data)
+        # Step 4: hydrate all papers at once & attach similarity scores
+        with timer.stage("hydrate"):
+            scores = {item["paper_id"]: item["score"] for item in similar}
+            papers = hydrate_papers(item["paper_id"] for item in similar)
+            for paper_data in papers:
+                paper_data["similarity"] = scores[paper_data["id"]]
 
         return Response({
             "user_upload_id": str(user_upload.upload_id),
             "results": papers
-        }, status=200)
+        }, status=200, headers={"X-Index-Generation": index_generation()})
+
+    @action(
+        detail=False, methods=['post'], url_path='recommend-batch',
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer],
+    )
+    def recommend_batch(self, request):
+        # Recommendations for many abstracts in one request. Body:
+        # {"uploads": [{"abstract", "title", "authors", "categories"}, ...]}
+        # (or {"abstracts": [...]}), optional "top_n", "filters" and "stream".
+        # With stream (or Accept: application/x-ndjson) one JSON line per
+        # upload is sent as soon as its chunk is done.
+
+        uploads = request.data.get("uploads")
+        if uploads is None:
+            uploads = [{"abstract": abstract} for abstract in request.data.get("abstracts") or []]
+
+        if not isinstance(uploads, list) or not uploads:
+            return Response({"error": "uploads (or abstracts) must be a non-empty list"}, status=400)
+
+        max_size = getattr(settings, "RECOMMEND_BATCH_MAX_SIZE", 500)
+        if len(uploads) > max_size:
+            return Response({"error": f"at most {max_size} uploads per request"}, status=400)
+
+        invalid = [
+            i for i, item in enumerate(uploads)
+            if not isinstance(item, dict) or not isinstance(item.get("abstract"), str) or not item["abstract"].strip()
+        ]
+        if invalid:
+            return Response({"error": "every upload needs an abstract", "invalid": invalid}, status=400)
+
+        try:
+            top_n = max(1, min(int(request.data.get("top_n", 12)), 50))
+            filters = (
+                parse_search_filters(request.query_params) or
+                parse_search_filters(request.data.get("filters") or {})
+            )
+        except (TypeError, ValueError):
+            return Response({"error": "top_n, year_from and year_to must be integers"}, status=400)
+
+        stream = (
+            request.data.get("stream") in (True, "true", "1") or
+            "application/x-ndjson" in request.headers.get("Accept", "")
+        )
+
+        if stream:
+            chunk_size = getattr(settings, "RECOMMEND_BATCH_CHUNK_SIZE", 64)
+            lines = (
+                json.dumps(result, cls=DjangoJSONEncoder) + "\n"
+                for result in iter_recommendations(uploads, top_n, filters, chunk_size)
+            )
+            return StreamingHttpResponse(
+                lines, content_type="application/x-ndjson",
+                headers={"X-Index-Generation": index_generation()},
+            )
+
+        results = recommend_batch(uploads, top_n, filters)
+        return Response({
+            "count": len(results),
+            "results": results
+        }, status=200, headers={"X-Index-Generation": index_generation()})
+
+
+class TopicViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Topic.objects.prefetch_related('year_counts').order_by('number')
+    serializer_class = TopicSerializer
+    search_fields = ['label']
+    ordering_fields = ['size', 'growth_rate']
+    permission_classes = [AllowAny]
+
+    @action(detail=False, methods=["get"])
+    def emerging(self, request):
+        # Fastest growing topics, read from the tables build_topics precomputes
+        try:
+            top_n = int(request.query_params.get("top_n", 10))
+            min_size = int(request.query_params.get("min_size", 20))
+        except ValueError:
+            return Response({"error": "top_n and min_size must be integers"}, status=400)
+
+        top_n = max(1, min(top_n, 50))  # safety limit
+
+        topics = (
+            self.get_queryset()
+            .filter(size__gte=min_size, growth_rate__isnull=False)
+            .order_by("-growth_rate", "-recent_count")[:top_n]
+        )
+
+        return Response({
+            "used_top_n": top_n,
+            "min_size": min_size,
+            "results": TopicSerializer(topics, many=True).data
+        })
+
+
+class IndexViewSet(viewsets.ViewSet):
+    # State of this worker's FAISS index: snapshot version, generation,
+    # size and the last background rebuild. Staff only, like rebuilds.
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        return Response(index_stats(), headers={"X-Index-Generation": index_generation()})
+
+    # Rebuild the index from the database in the background and hot swap it
+    # in, searches keep using the current index meanwhile. Optional body:
+    # {"index_type": "sq8"}
+    @action(detail=False, methods=["post"])
+    def rebuild(self, request):
+        overrides = {}
+        index_type = request.data.get("index_type")
+        if index_type:
+            if index_type not in INDEX_TYPES:
+                return Response({"error": f"index_type must be one of {', '.join(INDEX_TYPES)}"}, status=400)
+            overrides["TYPE"] = index_type
+
+        try:
+            started = rebuild_faiss_index(config=index_config(overrides))
+        except RuntimeError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        if not started:
+            return Response({"error": "a rebuild is already running", **index_stats()}, status=409)
+        return Response(index_stats(), status=202)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    # Request profiles written by RequestProfilingMiddleware on this host,
+    # newest first. retrieve returns the summary (SQL, top functions),
+    # download the raw cProfile stats for pstats / snakeviz.
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = r"[\w-]+"
+
+    def list(self, request):
+        profiles = []
+        for name in reversed(list_profiles()):
+            path = profile_path(name)
+            if path is None:
+                continue
+            with open(path) as f:
+                summary = json.load(f)
+            profiles.append({
+                key: summary.get(key)
+                for key in ("name", "method", "path", "view", "status", "started_at", "total_ms", "query_count", "query_ms")
+            })
+        return Response(profiles)
+
+    def retrieve(self, request, pk=None):
+        path = profile_path(pk)
+        if path is None:
+            return Response({"error": "profile not found"}, status=404)
+        with open(path) as f:
+            return Response(json.load(f))
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        path = profile_path(pk, "prof")
+        if path is None:
+            return Response({"error": "profile not found"}, status=404)
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{pk}.prof")
+
+
+# Prometheus text exposition of this process's metrics: stage, encode and
+# search latency histograms, encode batch sizes, cache hit rates, index
+# size and version. Scrapers send METRICS_TOKEN as a bearer token, without
+# a token the endpoint only exists with DEBUG on.
+def metrics(request):
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=404)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serve the async search / recommend endpoints (/api/async/...) with e.g.
+`uvicorn papyrus.asgi:application --workers 2`. Each process runs encode and
+FAISS search on a bounded thread pool (settings.ASYNC_EXECUTOR), so one
+process handles many concurrent clients with a single model copy.
 """
 
 import os
@@ -14,3 +19,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'papyrus.settings')
 
 application = get_asgi_application()
+
+# Only processes serving requests load the FAISS snapshot at startup. With
+# gunicorn's preload_app this runs once in the master, before the fork.
+from paper.utils.faiss_index import load_faiss_index  # noqa: E402
+
+load_faiss_index()
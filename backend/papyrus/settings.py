@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "paper.middleware.StageTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    "paper.middleware.RequestProfilingMiddleware",
 ]
 
 # CORS Configuration
@@ -182,6 +184,150 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Embedding storage
+# Vectors are stored as packed binary blobs. "float32" keeps full precision,
+# "float16" halves the storage size (decoded back to float32 when read).
+EMBEDDING_DTYPE = "float32"
+
+# Sentence encoder backend. "onnx" runs the model exported by
+# `python manage.py export_onnx_model` through ONNX Runtime, use an
+# onnx/model_qint8_<config>.onnx ONNX_FILE for the int8 quantized variant.
+EMBEDDING_MODEL = {
+    "BACKEND": "torch",
+    "ONNX_DIR": os.path.join(BASE_DIR, 'models', 'all-MiniLM-L6-v2-onnx'),
+    "ONNX_FILE": "onnx/model.onnx",
+}
+
+# Query embedding cache used by generate_embedding. "local" is a per-process
+# LRU, "django" also shares entries through the Django cache CACHE_ALIAS
+# (e.g. Redis or FileBasedCache) so every worker benefits. None disables it.
+EMBEDDING_CACHE = {
+    "BACKEND": "local",
+    "MAX_SIZE": 10000,
+    "TTL": 3600,
+    "CACHE_ALIAS": "default",
+}
+
+# Concurrent generate_embedding calls are grouped into one batched encode:
+# wait at most MAX_WAIT_MS for up to MAX_BATCH_SIZE texts.
+ENCODER_BATCHING = {
+    "ENABLED": True,
+    "MAX_BATCH_SIZE": 32,
+    "MAX_WAIT_MS": 5,
+}
+
+
+# FAISS index snapshots
+# `python manage.py build_faiss_snapshot` writes versioned snapshots here,
+# workers load the CURRENT one at startup (memory-mapped when FAISS_MMAP is on).
+FAISS_INDEX_DIR = os.path.join(BASE_DIR, 'indexes')
+FAISS_MMAP = True
+FAISS_SNAPSHOTS_TO_KEEP = 3
+
+# Index type used when building the FAISS index / snapshots, see
+# paper/utils/index_factory.py for every option. "flat" is exact search,
+# "ivf_flat", "ivf_pq" and "hnsw" trade a little recall for much lower latency
+# on large corpora. "fp16" (2 bytes / dim), "sq8" (1 byte / dim) and "pq"
+# (PQ_M bytes per vector) compress the vectors to fit small nodes; with
+# RESCORE the snapshot also keeps the exact vectors on disk (memory mapped)
+# and re-ranks the top RESCORE_FACTOR * top_n candidates with them.
+# Corpora below MIN_TRAIN_SIZE use "flat" for every type except fp16 / sq8.
+FAISS_INDEX = {
+    "TYPE": "flat",
+    "MIN_TRAIN_SIZE": 50000,
+    "NPROBE": 16,
+    "EF_SEARCH": 64,
+    "RESCORE": False,
+    "BUILD_BATCH_SIZE": 10000,
+}
+
+# Sharded search: with COUNT > 0 the corpus is split into COUNT shards by
+# Paper.id ("hash") or primary category ("category"). Shard i is built with
+# `python manage.py build_faiss_snapshot --shard i` and served by
+# `python manage.py serve_faiss_shard --shard i` at ADDRESSES[i]
+# ("unix:/path.sock" on one box, "host:port" across nodes, empty means unix
+# sockets in FAISS_INDEX_DIR). Web workers then hold no index and fan every
+# search out to all shards, merging the top-k.
+FAISS_SHARDS = {
+    "COUNT": 0,
+    "STRATEGY": "hash",
+    "ADDRESSES": [],
+    "TIMEOUT": 2.0,
+    "ALLOW_PARTIAL": True,
+}
+
+# /papers/search/ merges semantic (FAISS) and keyword (full-text) rankings
+# with reciprocal rank fusion, larger k flattens the weight of top ranks
+SEARCH_RRF_K = 60
+
+# Seconds between polls of the index change log (updates made by other processes)
+FAISS_SYNC_INTERVAL = 5.0
+
+# `python manage.py prune_index_changes` (run it from cron) only deletes
+# change log entries older than this that every snapshot already contains.
+# Keep it longer than any worker may go without syncing.
+FAISS_CHANGE_LOG_RETENTION_HOURS = 72
+
+# Workers also check CURRENT on every poll and hot swap to a new snapshot
+# in the background once it passes validation (see FAISS_INDEX VALIDATE_*),
+# so `build_faiss_snapshot` or POST /api/index/rebuild/ need no restart
+FAISS_HOT_RELOAD = True
+
+# Per-stage timing of search / recommend / trends: a Server-Timing header,
+# one JSON log line per request on the "papyrus.timing" logger (only
+# requests slower than LOG_SLOWER_THAN_MS, lower it to log more) and
+# histograms at /metrics. Metrics are per process, scrape every worker.
+# /metrics answers 404 unless METRICS_TOKEN is set (scrapers send it as a
+# bearer token) or DEBUG is on.
+REQUEST_TIMING = {
+    "ENABLED": True,
+    "LOG": True,
+    "LOG_SLOWER_THAN_MS": 500,
+}
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# On-demand profiling of the paper / upload viewsets. With ENABLED a
+# request sending the X-Profile header (value PROFILING_TOKEN, or from a
+# staff user when no token is set) or sampled at SAMPLE_RATE is run under
+# cProfile with its SQL recorded. Artifacts go to MEDIA_ROOT/profiles and
+# are listed / downloaded by admins at /api/profiles/. Off, the middleware
+# is not installed and costs nothing. See paper/utils/profiling.py.
+REQUEST_PROFILING = {
+    "ENABLED": os.environ.get("REQUEST_PROFILING") == "1",
+    "TOKEN": os.environ.get("PROFILING_TOKEN"),
+    "SAMPLE_RATE": 0.0,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "papyrus.timing": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
+# Serialized papers returned by search / recommend are cached per process.
+# Edits drop entries right away in the writing process and on the next
+# change log poll elsewhere, TTL bounds staleness for anything else.
+PAPER_CACHE_SIZE = 50000
+PAPER_CACHE_TTL = 300
+
+# /user-uploads/recommend-batch/ accepts at most MAX_SIZE abstracts, streamed
+# responses are produced CHUNK_SIZE uploads at a time
+RECOMMEND_BATCH_MAX_SIZE = 500
+RECOMMEND_BATCH_CHUNK_SIZE = 64
+
+# Thread pool running encode / FAISS search for the async views. MAX_WORKERS
+# tasks run at once, MAX_QUEUE more may wait, further requests get a 503.
+ASYNC_EXECUTOR = {
+    "MAX_WORKERS": 4,
+    "MAX_QUEUE": 64,
+}
+
+
 JAZZMIN_SETTINGS = {
     "site_title": "Papyrus Admin",
     "site_header": "Papyrus",
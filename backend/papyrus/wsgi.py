@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'papyrus.settings')
 
 application = get_wsgi_application()
+
+# Only processes serving requests load the FAISS snapshot at startup. With
+# gunicorn's preload_app this runs once in the master, before the fork.
+from paper.utils.faiss_index import load_faiss_index  # noqa: E402
+
+load_faiss_index()